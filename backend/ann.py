@@ -0,0 +1,106 @@
+import numpy as np
+import scipy.sparse as sp
+
+from scoring import COLLAB_WEIGHT, CONTENT_WEIGHT, GENRE_BOOST, MOOD_BOOST, CONTENT_FAVOURITES
+
+# -----------------------
+# Candidate generation
+# -----------------------
+#
+# Stage one of recommend(): an inverted-file (IVF) index returns a shortlist
+# of likely movies, and only those go through ScoringEngine.score().
+#
+# Item embeddings are the L2-normalised rating columns of user_movie_matrix
+# (one dimension per user, sparse) next to the TF-IDF genre rows. Cosine
+# similarity is their dot product, so with a = sum(r_i * x_i) and
+# b = sum(x_i) over the movies the user rated, the collaborative score of
+# movie j is exactly (x_j . a) / (x_j . b).
+#
+# That score is an average of a[v] / b[v] over the users v who rated j, so it
+# can never beat the best of those ratios. The inverted lists are keyed by
+# user (the movies each user rated), and a query probes the `nprobe` lists
+# with the highest ratio, scores their movies with the formula above plus
+# content, boosts and recency, and keeps the best `count`. Probing every
+# list gives exhaustive recall; benchmark.py ann measures the trade-off.
+#
+# The index reflects the ratings the model was built from. Stage two scores
+# the shortlist against the live similarity stores, so top-k pruning and
+# incremental updates still apply to the final ranking.
+
+
+class AnnIndex:
+
+    def __init__(self, engine, user_movie_matrix, tfidf_matrix):
+        self.engine = engine
+
+        # Collaborative embeddings, one row per catalog movie (zero when unrated)
+        columns = user_movie_matrix.item_rows().astype(np.float64)
+        norms = np.sqrt(np.asarray(columns.multiply(columns).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        columns = sp.diags(1 / norms) @ columns
+        columns = sp.vstack([columns, sp.csr_matrix((1, columns.shape[1]))]).tocsr()
+        has_collab = engine.collab_of >= 0
+        self.collab = columns[np.where(has_collab, engine.collab_of, columns.shape[0] - 1)]
+
+        # Content embeddings (TfidfVectorizer rows are already L2-normalised)
+        self.content = sp.csr_matrix(tfidf_matrix)
+
+        # Inverted lists: list_items[list_indptr[v]:list_indptr[v + 1]]
+        # are the post-2000 movies user v rated (as catalog positions)
+        lists = self.collab[engine.genre_index.recent].tocsc()
+        self.list_indptr = lists.indptr
+        self.list_items = engine.genre_index.recent[lists.indices]
+
+    @property
+    def nbytes(self):
+        return sum(
+            m.data.nbytes + m.indices.nbytes + m.indptr.nbytes for m in (self.collab, self.content)
+        ) + self.list_indptr.nbytes + self.list_items.nbytes
+
+    def candidates(self, rating_rows, preferred_genres=(), mood_genres=(), method="hybrid",
+                   count=300, nprobe=200):
+        # Sorted catalog positions of up to `count` likely movies, or None
+        # when there is nothing to search from (callers then score everything)
+        engine = self.engine
+        rated = [(engine.position[m], r) for m, r in rating_rows if m in engine.position]
+        # Content and mf scoring are cheap enough to run on every movie
+        if not rated or method in ("content", "mf"):
+            return None
+
+        rows = [p for p, _ in rated]
+        weights = np.array([r for _, r in rated], dtype=np.float64)
+        user_vectors = self.collab[rows]
+        a = user_vectors.T @ weights
+        b = np.asarray(user_vectors.sum(axis=0)).ravel()
+
+        # Probe the lists of the users with the best a / b
+        live = np.flatnonzero(b > 0)
+        if len(live) == 0:
+            return None
+        if len(live) > nprobe:
+            live = live[np.argpartition(-(a[live] / b[live]), nprobe - 1)[:nprobe]]
+        items = np.unique(np.concatenate(
+            [self.list_items[self.list_indptr[v]:self.list_indptr[v + 1]] for v in live]
+        ))
+        if len(items) <= count:
+            return items
+
+        # Same formula as ScoringEngine.score(), on the embeddings
+        vectors = self.collab[items]
+        numerator = vectors @ a
+        denominator = vectors @ b
+        scores = np.zeros(len(items))
+        positive = denominator > 0
+        scores[positive] = numerator[positive] / denominator[positive]
+
+        if method != "collaborative":
+            favourites = sorted(rated, key=lambda x: x[1], reverse=True)[:CONTENT_FAVOURITES]
+            taste = np.asarray(self.content[[p for p, _ in favourites]].sum(axis=0)).ravel()
+            content = (self.content[items] @ taste) / len(favourites)
+            scores = COLLAB_WEIGHT * scores + CONTENT_WEIGHT * content
+
+        scores[engine.genre_index.hits(preferred_genres, items)] += GENRE_BOOST
+        scores[engine.genre_index.hits(mood_genres, items)] += MOOD_BOOST
+        scores *= engine.recency[items]
+
+        return np.sort(items[np.argpartition(-scores, count - 1)[:count]])
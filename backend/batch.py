@@ -0,0 +1,223 @@
+import argparse
+import json
+import time
+from contextlib import closing
+
+from psycopg2.extras import execute_values
+
+from config import (
+    BATCH_RESULT_SIZE, BATCH_RESULT_MAX_AGE, BATCH_CHUNK_SIZE, COLD_START_MIN_RATINGS, INCREMENTAL_SYNC_INTERVAL
+)
+from db import connect
+from genre_index import MOOD_MAP
+import rerank
+
+# -----------------------
+# Batch recommendations
+# -----------------------
+#
+#   python batch.py --user-ids 1-5000
+#   python batch.py --all --method hybrid collaborative
+#
+# Computes recommendations for many users at once (email digests, homepage
+# warm-up) and stores them in the `recommendations` table (migrate.py).
+# Each chunk of users is one set-based query for their ratings and
+# preferences, one ScoringEngine.score_batch() call and one multi-row
+# upsert. /api/recommend serves stored rows while they are fresh: computed
+# by the model being served (result_version(): its version, and how far
+# incremental updates have moved its collaborative similarity), less than
+# BATCH_RESULT_MAX_AGE seconds old, and not invalidated by a newer rating
+# or preference change.
+
+METHODS = ["hybrid", "collaborative", "content", "mf"]
+
+# One row per requested user that exists, including users with no ratings
+# or preferences yet
+FETCH_USERS_SQL = """
+    SELECT u.id, r.movie_ids, r.ratings, p.genres, p.mood
+    FROM users u
+    LEFT JOIN (
+        SELECT user_id, array_agg(movie_id) AS movie_ids, array_agg(rating) AS ratings
+        FROM ratings
+        WHERE user_id = ANY(%s::integer[])
+        GROUP BY user_id
+    ) r ON r.user_id = u.id
+    LEFT JOIN preferences p ON p.user_id = u.id
+    WHERE u.id = ANY(%s::integer[])
+"""
+
+UPSERT_RECOMMENDATIONS_SQL = """
+    INSERT INTO recommendations (user_id, method, size, items, model_version)
+    VALUES %s
+    ON CONFLICT (user_id, method)
+    DO UPDATE SET size = EXCLUDED.size, items = EXCLUDED.items,
+                  model_version = EXCLUDED.model_version, computed_at = CURRENT_TIMESTAMP
+"""
+
+FRESH_RECOMMENDATIONS_SQL = """
+    SELECT items FROM recommendations
+    WHERE user_id = %s AND method = %s AND size >= %s AND model_version = %s
+      AND computed_at > CURRENT_TIMESTAMP - %s * INTERVAL '1 second'
+"""
+
+
+# -----------------------
+# Reading and writing
+# -----------------------
+
+def result_version(model):
+    # Stored as model_version: the artifact version, plus the transaction id
+    # of the newest rating the incremental updater has applied. Any rating
+    # that changes the model moves it, so rows scored before an update stop
+    # matching.
+    updater = model.get('updater')
+    change = updater.last_change if updater else None
+    version = model.get("version")
+    return version if change is None else f"{version}@{change}"
+
+
+def fetch_users(cur, user_ids):
+    # {user_id: (rating_rows, preferred_genres, mood)} in one round trip
+    user_ids = [int(u) for u in user_ids]
+    cur.execute(FETCH_USERS_SQL, (user_ids, user_ids))
+
+    users = {}
+    for user_id, movie_ids, ratings, genres, mood in cur.fetchall():
+        rating_rows = list(zip(movie_ids, ratings)) if movie_ids else []
+        users[user_id] = (rating_rows, genres or [], mood or "")
+    return users
+
+
+def store_recommendations(cur, method, size, results, model_version):
+    # results: {user_id: items}. Part of the caller's transaction.
+    execute_values(
+        cur,
+        UPSERT_RECOMMENDATIONS_SQL,
+        [(user_id, method, size, json.dumps(items), model_version) for user_id, items in results.items()]
+    )
+
+
+def fresh_recommendations(cur, user_id, method, n, model_version, max_age=BATCH_RESULT_MAX_AGE):
+    # The stored top n, or None when there is no fresh row
+    if max_age <= 0:
+        return None
+    cur.execute(FRESH_RECOMMENDATIONS_SQL, (user_id, method, n, model_version, max_age))
+    row = cur.fetchone()
+    return row[0][:n] if row else None
+
+
+def invalidate_recommendations(cur, user_id):
+    # Called in the same transaction as a rating or preference change
+    cur.execute("DELETE FROM recommendations WHERE user_id = %s", (user_id,))
+
+# -----------------------
+# Scoring
+# -----------------------
+
+def recommend_batch(model, users, method="hybrid", n=BATCH_RESULT_SIZE, chunk_size=BATCH_CHUNK_SIZE):
+    # users: {user_id: (rating_rows, preferred_genres, mood)} as returned by
+    # fetch_users(); returns {user_id: items}, scored chunk by chunk
+    engine = model['engine']
+    catalog = model['catalog']
+    coldstart = model['coldstart']
+    results = {}
+
+    # Lists are re-ranked with the default options, like /api/recommend
+    # requests that set no knobs (the only ones served from stored rows),
+    # but without the request latency budget
+    options = dict(rerank.DEFAULTS, budget_ms=float("inf"))
+    depth = n if options["method"] == "none" else max(options["pool"], n)
+
+    # Users below the cold-start threshold get what /api/recommend gives them
+    user_ids = []
+    for user_id, (rating_rows, genres, mood) in users.items():
+        if len(rating_rows) < COLD_START_MIN_RATINGS:
+            positions, scores = coldstart.recommend(rating_rows, genres, mood, depth)
+            results[user_id] = catalog.recommendations(*rerank.rank(model, positions, scores, n, options))
+        else:
+            user_ids.append(user_id)
+
+    for start in range(0, len(user_ids), chunk_size):
+        chunk = user_ids[start:start + chunk_size]
+        scored = engine.score_batch(
+            [(users[u][0], users[u][1], MOOD_MAP.get(users[u][2], [])) for u in chunk], method
+        )
+        for user_id, (positions, scores) in zip(chunk, scored):
+            results[user_id] = catalog.recommendations(*rerank.rank(model, positions, scores, n, options))
+
+    return results
+
+
+def run_batch(model, cur, user_ids, methods=("hybrid",), n=BATCH_RESULT_SIZE, chunk_size=BATCH_CHUNK_SIZE):
+    # Fetches, scores and stores `user_ids` chunk by chunk on `cur` (the
+    # caller commits). Returns {method: {user_id: items}}.
+    version = result_version(model)
+    results = {method: {} for method in methods}
+
+    for start in range(0, len(user_ids), chunk_size):
+        users = fetch_users(cur, user_ids[start:start + chunk_size])
+        for method in methods:
+            chunk_results = recommend_batch(model, users, method, n, chunk_size)
+            store_recommendations(cur, method, n, chunk_results, version)
+            results[method].update(chunk_results)
+
+    return results
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Precompute recommendations into the recommendations table")
+    users_arg = parser.add_mutually_exclusive_group(required=True)
+    users_arg.add_argument("--user-ids", help="user id range (1-5000) or comma-separated ids")
+    users_arg.add_argument("--all", action="store_true", help="every user in the users table")
+    parser.add_argument("--method", nargs="+", choices=METHODS, default=["hybrid"])
+    parser.add_argument("--n", type=int, default=BATCH_RESULT_SIZE, help="recommendations stored per user")
+    parser.add_argument("--chunk-size", type=int, default=BATCH_CHUNK_SIZE, help="users per query and matrix product")
+    args = parser.parse_args()
+
+    from model import load_serving_model
+    model = load_serving_model()
+
+    # Catch up on app ratings like the server does, so the stored rows
+    # carry the result_version() the server will look them up with
+    if INCREMENTAL_SYNC_INTERVAL > 0:
+        from incremental import IncrementalUpdater
+        try:
+            model['updater'] = IncrementalUpdater(model['engine'], model['user_movie_matrix'])
+            model['updater'].sync()
+        except ValueError as e:
+            print("⚠️ Incremental updates disabled:", e)
+
+    with closing(connect()) as conn:
+        cur = conn.cursor()
+
+        if args.all:
+            cur.execute("SELECT id FROM users ORDER BY id")
+            user_ids = [row[0] for row in cur.fetchall()]
+        elif "-" in args.user_ids:
+            first, last = args.user_ids.split("-")
+            user_ids = list(range(int(first), int(last) + 1))
+        else:
+            user_ids = [int(u) for u in args.user_ids.split(",")]
+
+        start = time.perf_counter()
+        done = 0
+        try:
+            # One transaction per chunk, so an interrupted run keeps its progress
+            for offset in range(0, len(user_ids), args.chunk_size):
+                chunk = user_ids[offset:offset + args.chunk_size]
+                run_batch(model, cur, chunk, args.method, args.n, args.chunk_size)
+                conn.commit()
+                done += len(chunk)
+                print(f"🔄 {done}/{len(user_ids)} users, {done / (time.perf_counter() - start):.0f} users/s")
+
+        except Exception as e:
+            conn.rollback()
+            print(f"❌ Batch failed after {done} users: {e}")
+            raise SystemExit(1)
+
+        finally:
+            cur.close()
+
+    print(f"✅ Stored {args.n} recommendations x {len(args.method)} methods for {done} users "
+          f"in {time.perf_counter() - start:.1f}s")
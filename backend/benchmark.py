@@ -0,0 +1,1009 @@
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import closing
+
+import numpy as np
+import pandas as pd
+
+from ann import AnnIndex
+from config import MODEL_ARTIFACT, MF_FACTORS
+from genre_index import MOOD_MAP, sample
+from model import MODEL_PATH, build_model, load_artifact, load_model, resolve_artifact
+from scoring import ScoringEngine, top_n
+from similarity import TopKSimilarity
+
+METHODS = ["hybrid", "collaborative", "content"]
+
+# -----------------------
+# Helpers
+# -----------------------
+
+def sample_users(ratings, genre_names, count, seed=42):
+    # Builds (rating_rows, preferred_genres, mood) tuples from users in the
+    # ratings frame, shaped like the rows recommend() reads from Postgres.
+    rng = random.Random(seed)
+    user_ids = sorted(ratings['userId'].unique())
+    picked = rng.sample(user_ids, min(count, len(user_ids)))
+
+    users = []
+    for uid in picked:
+        user_rows = ratings[ratings['userId'] == uid]
+        rating_rows = list(zip(user_rows['movieId'].tolist(), user_rows['rating'].tolist()))
+        genres = rng.sample(genre_names, 2)
+        mood = rng.choice(list(MOOD_MAP))
+        users.append((rating_rows, genres, mood))
+    return users
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def percentiles(samples):
+    ms = np.array(samples) * 1000
+    return {p: float(np.percentile(ms, p)) for p in (50, 95, 99)}
+
+
+def same_ranking(a, b):
+    # Identical movie order, or identical scores where only tie order differs
+    if [m for m, _ in a] == [m for m, _ in b]:
+        return True
+    return len(a) == len(b) and np.allclose([s for _, s in a], [s for _, s in b])
+
+def dense_precision(dense, user, method, actual, n):
+    # Share of `actual` that the dense scorer would also rank in its top n,
+    # counting ties at the cut (many movies share identical scores).
+    rating_rows, genres, mood = user
+    positions, scores = dense.score(rating_rows, genres, MOOD_MAP.get(mood, []), method)
+    if not actual or len(scores) == 0:
+        return 1.0
+    kth = np.sort(scores)[-min(n, len(scores))]
+    dense_scores = dict(zip(dense.movie_ids[positions].tolist(), scores.tolist()))
+    return np.mean([dense_scores.get(m, -np.inf) >= kth for m, _ in actual])
+
+def load_benchmark_model(args, top_k=None):
+    # --artifact benchmarks a prebuilt artifact, otherwise build from pickle
+    if args.artifact and top_k is None:
+        return load_artifact(args.artifact)
+    top_k = args.top_k if top_k is None else top_k
+    return load_model() if top_k is None else load_model(top_k=top_k)
+
+# -----------------------
+# Reference implementation (original iterrows loop)
+# -----------------------
+
+def legacy_recommend(rating_rows, preferred_genres, preferred_mood,
+                     movies, movie_similarity_df, content_similarity_df, n=10, method="hybrid"):
+
+    user_ratings_dict = {row[0]: row[1] for row in rating_rows}
+    rated_movie_ids = set(user_ratings_dict.keys())
+    mood_target_genres = MOOD_MAP.get(preferred_mood, [])
+
+    predictions = []
+    candidate_movies = movies[movies['year'] >= 2000]
+
+    for index, row in candidate_movies.iterrows():
+        mid = row['movieId']
+
+        if mid in rated_movie_ids:
+            continue
+
+        if mid not in movie_similarity_df.columns and mid not in content_similarity_df.columns:
+            continue
+
+        score_collab = 0
+        score_content = 0
+
+        if mid in movie_similarity_df.columns:
+            sims = movie_similarity_df[mid]
+            valid_sims_indices = sims.index.intersection(rated_movie_ids)
+
+            if not valid_sims_indices.empty:
+                my_ratings_for_sim_movies = [user_ratings_dict[m] for m in valid_sims_indices]
+                my_sims_values = sims[valid_sims_indices].values
+                sim_sum = my_sims_values.sum()
+
+                if sim_sum > 0:
+                    dot_product = np.dot(my_ratings_for_sim_movies, my_sims_values)
+                    score_collab = dot_product / sim_sum
+
+        if mid in content_similarity_df.columns:
+            if rating_rows:
+                sorted_user_ratings = sorted(rating_rows, key=lambda x: x[1], reverse=True)
+                top_3_favs = [x[0] for x in sorted_user_ratings[:3]]
+                scores = []
+                for fav in top_3_favs:
+                    if fav in content_similarity_df.columns:
+                        scores.append(content_similarity_df[mid][fav])
+                if scores:
+                    score_content = float(np.mean(scores))
+
+        if method == "collaborative":
+            final_score = score_collab
+        elif method == "content":
+            final_score = score_content
+        else:
+            final_score = (0.7 * score_collab) + (0.3 * score_content)
+
+        movie_genres_list = row['genres'].split('|')
+
+        if set(preferred_genres).intersection(movie_genres_list):
+            final_score += 0.3
+
+        if set(mood_target_genres).intersection(movie_genres_list):
+            final_score += 0.2
+
+        final_score *= 1.0 + (row['year'] - 2000) * 0.01
+
+        if final_score > 0:
+            predictions.append({"movieId": mid, "score": final_score})
+
+    if not predictions:
+        return []
+
+    result = pd.DataFrame(predictions).sort_values("score", ascending=False).head(n)
+    return list(zip(result['movieId'].tolist(), result['score'].tolist()))
+
+
+def engine_recommend(engine, rating_rows, preferred_genres, preferred_mood, n=10, method="hybrid"):
+    positions, scores = engine.score(rating_rows, preferred_genres, MOOD_MAP.get(preferred_mood, []), method)
+    positions, scores = top_n(positions, scores, n)
+    return list(zip(engine.movie_ids[positions].tolist(), scores.tolist()))
+
+# -----------------------
+# Benchmarks
+# -----------------------
+
+def bench_scoring(args):
+    # Vectorized engine vs the original per-movie loop
+    model = load_benchmark_model(args)
+    movies = model['movies']
+    engine = model['engine']
+    collab_ids = model['user_movie_matrix'].movie_ids
+
+    movie_similarity_df = pd.DataFrame(
+        engine.collab_sim.to_dense(), index=collab_ids, columns=collab_ids, copy=False
+    )
+    content_similarity_df = pd.DataFrame(
+        engine.content_sim.to_dense(), index=movies['movieId'], columns=movies['movieId'], copy=False
+    )
+
+    users = sample_users(model['ratings'], engine.genre_index.names, args.users)
+
+    print(f"\n⏱️  Scoring benchmark: {len(users)} users, n={args.n}")
+    for method in METHODS:
+        legacy_times, engine_times, matches = [], [], 0
+        for rating_rows, genres, mood in users:
+            expected, t_legacy = timed(
+                legacy_recommend, rating_rows, genres, mood,
+                movies, movie_similarity_df, content_similarity_df, args.n, method
+            )
+            actual, t_engine = timed(engine_recommend, engine, rating_rows, genres, mood, args.n, method)
+            legacy_times.append(t_legacy)
+            engine_times.append(t_engine)
+            matches += same_ranking(expected, actual)
+
+        legacy, vectorized = percentiles(legacy_times), percentiles(engine_times)
+        print(f"  {method:<14} legacy p50 {legacy[50]:9.2f} ms | "
+              f"vectorized p50 {vectorized[50]:7.2f} ms | "
+              f"speedup {legacy[50] / vectorized[50]:6.1f}x | "
+              f"rankings match {matches}/{len(users)}")
+
+
+def bench_similarity(args):
+    # Memory footprint and ranking drift of top-k stores vs the dense matrices
+    model = load_benchmark_model(args, top_k=0)
+    dense = model['engine']
+    movies = model['movies']
+    collab_ids = model['user_movie_matrix'].movie_ids
+
+    users = sample_users(model['ratings'], dense.genre_index.names, args.users)
+    baseline = {
+        method: [engine_recommend(dense, *user, args.n, method) for user in users]
+        for method in METHODS
+    }
+
+    # overlap: share of the dense top n that is kept
+    # precision: share of the top-k top n whose dense score makes the cut
+    mb = 1024 * 1024
+    print(f"\n📦 dense   collab {dense.collab_sim.nbytes / mb:6.1f} MB | "
+          f"content {dense.content_sim.nbytes / mb:6.1f} MB")
+
+    for k in args.ks:
+        collab = TopKSimilarity.from_dense(dense.collab_sim.matrix, k, args.floor)
+        content = TopKSimilarity.from_dense(dense.content_sim.matrix, k, args.floor)
+        engine = ScoringEngine(dense.movie_ids, dense.years, movies['genres'], collab_ids, collab, content)
+
+        drift = []
+        for method in METHODS:
+            overlap, precision = [], []
+            for user, expected in zip(users, baseline[method]):
+                actual = engine_recommend(engine, *user, args.n, method)
+                expected_ids = {m for m, _ in expected}
+                overlap.append(len(expected_ids & {m for m, _ in actual}) / max(len(expected_ids), 1))
+                precision.append(dense_precision(dense, user, method, actual, args.n))
+            drift.append(f"{method} overlap {np.mean(overlap):.2f} precision {np.mean(precision):.2f}")
+
+        print(f"📦 k={k:<5} collab {collab.nbytes / mb:6.1f} MB | content {content.nbytes / mb:6.1f} MB | "
+              + " | ".join(drift))
+
+
+def bench_genres(args):
+    # Genre index vs the per-call string parsing it replaced
+    model = load_benchmark_model(args)
+    movies = model['movies']
+    index = model['engine'].genre_index
+
+    queries = [["Comedy"], ["Action", "Thriller"], ["Drama", "Romance", "Documentary"], ["Film-Noir", "Indie"]]
+    rounds = args.rounds
+
+    def string_any(genres):
+        candidates = movies[movies['year'] >= 2000]
+        mask = candidates['genres'].apply(lambda x: any(g in x.split('|') for g in genres))
+        return candidates.index[mask].to_numpy()
+
+    def string_boost(genres, mood):
+        # The old per-candidate split + set intersections from recommend()
+        mood_genres = MOOD_MAP.get(mood, [])
+        flags = []
+        for genres_str in movies['genres']:
+            genre_list = genres_str.split('|')
+            flags.append((bool(set(genres).intersection(genre_list)), bool(set(mood_genres).intersection(genre_list))))
+        return np.array(flags)
+
+    def index_boost(genres, mood):
+        return np.column_stack([index.hits(genres), index.hits(MOOD_MAP.get(mood, []))])
+
+    print(f"\n🏷️  Genre benchmark: {rounds} rounds per query")
+    for name, old, new, inputs in [
+        ("ANY filter", string_any, index.any_of, [(q,) for q in queries]),
+        ("boost flags", string_boost, index_boost, [(q, mood) for q, mood in zip(queries, MOOD_MAP)]),
+    ]:
+        t_old = t_new = 0.0
+        for query in inputs:
+            expected, _ = timed(old, *query)
+            actual, _ = timed(new, *query)
+            assert np.array_equal(expected, actual), f"{name} mismatch for {query}"
+            for _ in range(rounds):
+                t_old += timed(old, *query)[1]
+                t_new += timed(new, *query)[1]
+        calls = rounds * len(inputs)
+        print(f"  {name:<12} string {t_old / calls * 1e6:9.1f} us | index {t_new / calls * 1e6:7.1f} us | "
+              f"speedup {t_old / t_new:6.1f}x")
+
+    # A whole /api/movies-by-genre page: the original frame filter, sample
+    # and record renaming vs a precomputed pool and prebuilt cards (random
+    # draws differ, so only the sizes are compared)
+    catalog = model['catalog']
+    rng = np.random.default_rng(args.seed)
+
+    def frame_page(genres):
+        candidates = movies[movies['year'] >= 2000]
+        mask = candidates['genres'].apply(lambda x: any(g in x.split('|') for g in genres))
+        filtered = candidates[mask]
+        if len(filtered) == 0:
+            filtered = candidates
+        page = filtered.sample(n=min(args.n, len(filtered)))[['movieId', 'title', 'genres', 'year']].to_dict('records')
+        for movie in page:
+            movie['summary'] = f"Released in {movie['year']}. A popular {movie['genres'].replace('|', ', ')} movie."
+            movie['id'] = movie.pop('movieId')
+            movie['genre'] = movie.pop('genres')
+        return page
+
+    def pool_page(genres):
+        return catalog.cards(sample(catalog.genre_index.pool(genres), args.n, rng))
+
+    t_old = t_new = 0.0
+    for query in queries:
+        assert len(frame_page(query)) == len(pool_page(query)), f"page size mismatch for {query}"
+        for _ in range(rounds):
+            t_old += timed(frame_page, query)[1]
+            t_new += timed(pool_page, query)[1]
+    calls = rounds * len(queries)
+    print(f"  {'page':<12} frame  {t_old / calls * 1e6:9.1f} us | pool  {t_new / calls * 1e6:7.1f} us | "
+          f"speedup {t_old / t_new:6.1f}x")
+
+
+def bench_catalog(args):
+    # Catalog response items vs the per-request DataFrame code they replaced
+    model = load_benchmark_model(args)
+    movies = model['movies']
+    catalog = model['catalog']
+    rng = np.random.default_rng(args.seed)
+    rounds = args.rounds
+
+    def frame_recommendations(positions, scores):
+        top = movies.iloc[positions]
+        return [
+            {"title": title, "genres": genres, "score": float(score), "year": int(year)}
+            for title, genres, year, score in zip(top['title'], top['genres'], top['year'], scores)
+        ]
+
+    def frame_cards(positions):
+        result = movies.iloc[positions][['movieId', 'title', 'genres', 'year']].to_dict('records')
+        for movie in result:
+            movie['summary'] = f"Released in {movie['year']}. A popular {movie['genres'].replace('|', ', ')} movie."
+            movie['id'] = movie.pop('movieId')
+            movie['genre'] = movie.pop('genres')
+        return result
+
+    queries = [rng.choice(len(catalog), args.n, replace=False) for _ in range(rounds)]
+    scores = [rng.random(args.n) for _ in range(rounds)]
+
+    print(f"\n🗂️  Catalog benchmark: {rounds} queries of {args.n} movies "
+          f"({len(catalog.genre_strings)} distinct genre strings for {len(catalog)} movies)")
+    for name, old, new, inputs in [
+        ("recommend", frame_recommendations, catalog.recommendations, list(zip(queries, scores))),
+        ("by genre", frame_cards, catalog.cards, [(q,) for q in queries]),
+    ]:
+        t_old = t_new = 0.0
+        for query in inputs:
+            expected, elapsed_old = timed(old, *query)
+            actual, elapsed_new = timed(new, *query)
+            assert expected == actual, f"{name} items differ"
+            t_old += elapsed_old
+            t_new += elapsed_new
+        print(f"  {name:<10} frame {t_old / rounds * 1e6:8.1f} us | catalog {t_new / rounds * 1e6:6.1f} us | "
+              f"speedup {t_old / t_new:6.1f}x")
+
+
+def bench_coldstart(args):
+    # Precomputed popularity lists vs scoring the whole catalog for new users
+    model = load_benchmark_model(args)
+    engine = model['engine']
+    coldstart = model['coldstart']
+    names = engine.genre_index.names
+    rng = random.Random(args.seed)
+
+    users = []
+    for rating_rows, _, _ in sample_users(model['ratings'], names, args.users, args.seed):
+        genres = rng.sample(names, rng.randint(0, 3))
+        mood = rng.choice(list(MOOD_MAP) + [""])
+        # No ratings yet, or a few (COLD_START_MIN_RATINGS > 1)
+        users.append(([], genres, mood))
+        users.append((rating_rows[:rng.randint(1, 4)], genres, mood))
+
+    def exhaustive(rating_rows, genres, mood):
+        return top_n(*coldstart.score(rating_rows, genres, mood), args.n)
+
+    def full_scorer(rating_rows, genres, mood):
+        positions, scores = engine.score(rating_rows, genres, MOOD_MAP.get(mood, []), "hybrid")
+        return top_n(positions, scores, args.n)
+
+    times = {"full scorer": [], "exhaustive": [], "lists": []}
+    for user in users:
+        expected, t_exhaustive = timed(exhaustive, *user)
+        actual, t_lists = timed(coldstart.recommend, *user, args.n)
+        assert np.array_equal(expected[0], actual[0]), f"cold-start lists miss movies for {user[1:]}"
+        times["exhaustive"].append(t_exhaustive)
+        times["lists"].append(t_lists)
+        times["full scorer"].append(timed(full_scorer, *user)[1])
+
+    print(f"\n🧊 Cold start: {len(users)} users, n={args.n}, lists {coldstart.nbytes / 1024:.0f} KB, "
+          f"results identical to scoring every movie")
+    for name, samples in times.items():
+        p = percentiles(samples)
+        print(f"  {name:<12} p50 {p[50]:7.3f} ms | p95 {p[95]:7.3f} ms")
+
+
+
+def bench_rerank(args):
+    # Cost and effect of each diversity re-ranker on the top n
+    import rerank
+
+    model = load_benchmark_model(args)
+    engine = model['engine']
+    catalog = model['catalog']
+    users = sample_users(model['ratings'], engine.genre_index.names, args.users, args.seed)
+    scored = [engine.score(rating_rows, genres, MOOD_MAP.get(mood, [])) for rating_rows, genres, mood in users]
+
+    def naive_mmr(positions, scores, options):
+        # Reference MMR recomputing similarity to every pick at every step
+        positions, scores = top_n(positions, scores, options["pool"])
+        dense = engine.content_sim.to_dense()
+        relevance = np.round((scores - scores[-1]) / max(scores[0] - scores[-1], 1e-12), 9)
+        order = []
+        for _ in range(min(args.n, len(positions))):
+            closest = np.zeros(len(positions))
+            if order:
+                closest = dense[np.ix_(positions[order], positions)].max(axis=0)
+            value = (1 - options["diversity"]) * relevance - options["diversity"] * closest
+            value[order] = -np.inf
+            order.append(int(np.argmax(value)))
+        return positions[order], scores[order]
+
+    def diversity_of(positions):
+        # Distinct genre strings, and mean pairwise content similarity
+        block = engine.content_sim.to_dense()[np.ix_(positions, positions)] if len(positions) > 1 else None
+        pairs = len(positions) * (len(positions) - 1)
+        similarity = (block.sum() - np.trace(block)) / pairs if pairs else 0.0
+        return len(set(catalog.genre_codes[positions].tolist())), similarity
+
+    print(f"\n🎨 Re-ranking: {len(users)} users, n={args.n}, pool {rerank.DEFAULTS['pool']}, "
+          f"budget {rerank.DEFAULTS['budget_ms']} ms")
+    for method in ["none", "mmr", "genre_cap"]:
+        options = dict(rerank.DEFAULTS, method=method)
+        times, genres, similarity, kept = [], [], [], []
+        for positions, scores in scored:
+            (picked, picked_scores), elapsed = timed(rerank.rank, model, positions, scores, args.n, options)
+            times.append(elapsed)
+            if method == "mmr":
+                expected = naive_mmr(positions, scores, options)[0]
+                assert np.array_equal(expected, picked), "incremental MMR differs from the reference"
+            distinct, mean_sim = diversity_of(picked)
+            genres.append(distinct)
+            similarity.append(mean_sim)
+            kept.append(picked_scores.sum() / max(top_n(positions, scores, args.n)[1].sum(), 1e-12))
+        p = percentiles(times)
+        print(f"  {method:<10} p50 {p[50]:6.3f} ms | p95 {p[95]:6.3f} ms | "
+              f"genre strings {np.mean(genres):4.1f}/{args.n} | intra-list similarity {np.mean(similarity):.3f} | "
+              f"score kept {np.mean(kept):.1%}")
+
+
+def bench_mf(args):
+    # Held-out evaluation of method="mf" against the item-item methods: 20%
+    # of each user's ratings (users with 10+) are hidden, a model is built
+    # from the rest, and the hidden ratings are predicted and recommended.
+    import pickle
+    from rating_matrix import RatingMatrix
+
+    with open(MODEL_PATH, 'rb') as f:
+        data = pickle.load(f)
+    ratings = data['ratings']
+
+    rng = np.random.default_rng(args.seed)
+    counts = ratings.groupby('userId')['movieId'].transform('size')
+    held_out = (counts >= 10) & (rng.random(len(ratings)) < 0.2)
+    train, test = ratings[~held_out], ratings[held_out]
+
+    model, build = timed(
+        build_model, data['movies'], train, RatingMatrix.from_frame(train),
+        0 if args.top_k is None else args.top_k, args.floor, 1, "float64", MF_FACTORS
+    )
+    engine = model['engine']
+    if engine.factors is None:
+        raise SystemExit("❌ MF_FACTORS=0: nothing to evaluate")
+
+    train_rows = {u: list(zip(g['movieId'].tolist(), g['rating'].tolist())) for u, g in train.groupby('userId')}
+    test_rows = {u: list(zip(g['movieId'].tolist(), g['rating'].tolist())) for u, g in test.groupby('userId')}
+
+    # Rating prediction, on hidden movies that appear in the training ratings
+    errors = {"user mean": [], "item-item": [], "mf": []}
+    for user, hidden in test_rows.items():
+        rated = train_rows[user]
+        hidden = [(m, r) for m, r in hidden if m in engine.collab_position]
+        if not hidden:
+            continue
+        positions = np.array([engine.position[m] for m, _ in hidden])
+        actual = np.array([r for _, r in hidden])
+        errors["user mean"].extend(np.mean([r for _, r in rated]) - actual)
+        errors["item-item"].extend(engine.collab_scores(rated, positions) - actual)
+        errors["mf"].extend(engine.mf_scores(rated, positions) - actual)
+
+    print(f"\n🧮 Matrix factorization: {engine.factors.shape[1]} factors, built with the item-item stores "
+          f"in {build:.1f}s | {len(train)} training / {len(test)} held-out ratings")
+    print(f"  memory       collaborative similarity {engine.collab_sim.nbytes / 1024 / 1024:7.1f} MB | "
+          f"item factors {engine.factors.nbytes / 1024 / 1024:5.1f} MB")
+    for name, error in errors.items():
+        print(f"  RMSE         {name:<14} {np.sqrt(np.mean(np.square(error))):.4f}")
+
+    # Top-k quality: hidden movies rated 4+ count as relevant
+    k = args.n
+    for method in ["hybrid", "collaborative", "mf"]:
+        precision, recall, times = [], [], []
+        for user, hidden in test_rows.items():
+            relevant = {m for m, r in hidden if r >= 4}
+            if not relevant:
+                continue
+            (positions, scores), elapsed = timed(engine.score, train_rows[user], (), (), method)
+            times.append(elapsed)
+            top = set(engine.movie_ids[top_n(positions, scores, k)[0]].tolist())
+            precision.append(len(top & relevant) / k)
+            recall.append(len(top & relevant) / len(relevant))
+        p = percentiles(times)
+        print(f"  {method:<14} precision@{k} {np.mean(precision):.4f} | recall@{k} {np.mean(recall):.4f} | "
+              f"scoring p50 {p[50]:6.2f} ms | p95 {p[95]:6.2f} ms")
+
+
+def bench_quantize(args):
+    # Quantized similarity stores against the float64 baseline: memory,
+    # top-n overlap (model.quantization_report) and scoring latency
+    import copy
+    from model import quantization_report
+
+    model = load_benchmark_model(args)
+    engine = model['engine']
+    if engine.collab_sim.dtype != "float64":
+        raise SystemExit(f"❌ Baseline stores are {engine.collab_sim.dtype}; benchmark a float64 artifact")
+    users = sample_users(model['ratings'], engine.genre_index.names, args.users, args.seed)
+
+    print(f"\n🗜️  Quantized similarity: {len(users)} users, n={args.n}")
+    for dtype in ["float64", "float32", "float16", "int8"]:
+        quantized = copy.copy(engine)
+        if dtype != "float64":
+            quantized.collab_sim = engine.collab_sim.quantize(dtype)
+            quantized.content_sim = engine.content_sim.quantize(dtype)
+            quantization_report(engine, quantized, model['user_movie_matrix'], n=args.n)
+
+        times = {method: [] for method in METHODS}
+        for rating_rows, genres, mood in users:
+            for method in METHODS:
+                times[method].append(timed(engine_recommend, quantized, rating_rows, genres, mood, args.n, method)[1])
+        size = (quantized.collab_sim.nbytes + quantized.content_sim.nbytes) / 2**20
+        print(f"  {dtype:<8} {size:7.0f} MB | " + " | ".join(
+            f"{method} p50 {percentiles(samples)[50]:6.2f} ms" for method, samples in times.items()
+        ))
+
+def bench_responses(args):
+    # Bytes and CPU per response: jsonify() as it was (json module, sorted
+    # keys, no compression) vs responses.py (orjson, gzip above the size
+    # threshold) vs a cached payload resent (or, on GET, answered with a 304)
+    import gzip
+    from flask import Flask
+    from flask.json.provider import DefaultJSONProvider
+    import responses
+    from config import RESPONSE_COMPRESS_MIN_BYTES, RESPONSE_GZIP_LEVEL
+
+    model = load_benchmark_model(args)
+    catalog = model['catalog']
+    legacy = DefaultJSONProvider(Flask(__name__))
+    rng = np.random.default_rng(args.seed)
+    rounds = args.rounds
+
+    payloads = []
+    for n in sorted({10, args.n, 50}):
+        positions = rng.choice(len(catalog), n, replace=False)
+        payloads.append((f"recommend n={n}", {
+            "success": True, "degraded": False,
+            "recommendations": catalog.recommendations(positions, np.sort(rng.random(n))[::-1] * 5),
+        }))
+        recent = catalog.genre_index.recent
+        payloads.append((f"by genre n={n}", {
+            "success": True, "movies": catalog.cards(rng.choice(recent, n, replace=False)),
+        }))
+
+    def cpu_us(fn, *a):
+        start = time.process_time()
+        for _ in range(rounds):
+            fn(*a)
+        return (time.process_time() - start) / rounds * 1e6
+
+    def new_encoding(obj):
+        body = responses.dumps(obj)
+        if 0 < RESPONSE_COMPRESS_MIN_BYTES <= len(body):
+            body = gzip.compress(body, compresslevel=RESPONSE_GZIP_LEVEL, mtime=0)
+        return body
+
+    print(f"\n📦 Response encoding: {rounds} rounds per payload, gzip level {RESPONSE_GZIP_LEVEL} "
+          f"from {RESPONSE_COMPRESS_MIN_BYTES} bytes")
+    print(f"  {'payload':<18} {'before':>16} {'after':>16} {'cached':>10} {'304':>8}")
+    for name, obj in payloads:
+        before = legacy.dumps(obj).encode()
+        after = new_encoding(obj)
+        assert json.loads(before) == json.loads(gzip.decompress(after) if after[:2] == b"\x1f\x8b" else after)
+
+        cache = responses.PayloadCache()
+        cache.put(name, responses.Payload(responses.dumps(obj), source=obj))
+        cache.get(name, obj).encoded("gzip")
+
+        t_before = cpu_us(lambda: legacy.dumps(obj).encode())
+        t_after = cpu_us(new_encoding, obj)
+        t_cached = cpu_us(lambda: cache.get(name, obj).encoded("gzip"))
+        print(f"  {name:<18} {len(before):6d} B {t_before:6.1f} us {len(after):6d} B {t_after:6.1f} us "
+              f"{t_cached:7.1f} us {0:6d} B")
+
+
+def bench_ann(args):
+    # Two-stage candidate generation + scoring vs exhaustive scoring
+    model = load_benchmark_model(args)
+    engine = model['engine']
+    index, build = timed(AnnIndex, engine, model['user_movie_matrix'], model['tfidf_matrix'])
+    users = sample_users(model['ratings'], engine.genre_index.names, args.users)
+
+    def two_stage(rating_rows, genres, mood, method, count, nprobe):
+        mood_genres = MOOD_MAP.get(mood, [])
+        candidates = index.candidates(rating_rows, genres, mood_genres, method, count, nprobe)
+        positions, scores = engine.score(rating_rows, genres, mood_genres, method, candidates)
+        positions, scores = top_n(positions, scores, args.n)
+        return list(zip(engine.movie_ids[positions].tolist(), scores.tolist()))
+
+    # recall: share of the exhaustive top n that is kept
+    # precision: share of the two-stage top n whose exhaustive score makes the
+    # cut (counts ties at the cut, like the similarity benchmark)
+    print(f"\n🎯 Candidate index built in {build:.2f}s, {index.nbytes / 1024 / 1024:.1f} MB | "
+          f"{len(users)} users, n={args.n}")
+    for method in ["hybrid", "collaborative"]:
+        exhaustive, times = [], []
+        for rating_rows, genres, mood in users:
+            result, elapsed = timed(engine_recommend, engine, rating_rows, genres, mood, args.n, method)
+            exhaustive.append(result)
+            times.append(elapsed)
+        full = percentiles(times)
+        print(f"  {method:<14} exhaustive            p50 {full[50]:6.2f} ms | p95 {full[95]:6.2f} ms")
+
+        for count in args.candidates:
+            for nprobe in args.nprobes:
+                recall, precision, times = [], [], []
+                for user, expected in zip(users, exhaustive):
+                    actual, elapsed = timed(two_stage, *user, method, count, nprobe)
+                    times.append(elapsed)
+                    expected_ids = {m for m, _ in expected}
+                    recall.append(len(expected_ids & {m for m, _ in actual}) / max(len(expected_ids), 1))
+                    precision.append(dense_precision(engine, user, method, actual, args.n))
+                stage = percentiles(times)
+                print(f"  {method:<14} {count:>5} cand {nprobe:>5} lists p50 {stage[50]:6.2f} ms | "
+                      f"p95 {stage[95]:6.2f} ms | recall@{args.n} {np.mean(recall):.3f} | "
+                      f"precision {np.mean(precision):.3f}")
+
+
+STARTUP_SCRIPT = """
+import json, resource, sys, time
+start = time.perf_counter()
+import model
+kind, path = sys.argv[1], sys.argv[2]
+m = model.load_artifact(path) if kind == "artifact" else model.load_model(path)
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+"""
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def run_measured(cmd, env=None):
+    # Runs `cmd` to completion; returns (seconds, peak RSS of that process
+    # in MB, stdout). wait4() reports the child's own peak, unlike
+    # RUSAGE_CHILDREN which keeps the largest of every child so far.
+    with tempfile.TemporaryFile(mode="w+") as out:
+        start = time.perf_counter()
+        proc = subprocess.Popen(cmd, cwd=HERE, env=env, stdout=out, stderr=subprocess.DEVNULL)
+        _, status, usage = os.wait4(proc.pid, 0)
+        elapsed = time.perf_counter() - start
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        if proc.returncode != 0:
+            raise RuntimeError(f"{' '.join(cmd)} exited with {proc.returncode}")
+        out.seek(0)
+        return elapsed, usage.ru_maxrss / 1024, out.read()
+
+
+def bench_startup(args):
+    # Cold start of a fresh process: rebuild from pickle vs mapped artifact
+    artifact = resolve_artifact(args.artifact or MODEL_ARTIFACT)
+    variants = [("pickle", ["pickle", MODEL_PATH])]
+    if os.path.exists(artifact):
+        variants.append(("artifact", ["artifact", artifact]))
+    else:
+        print(f"⚠️ No artifact at {artifact}, run build_model.py first")
+
+    print("\n🚀 Startup benchmark")
+    for name, extra in variants:
+        _, _, out = run_measured([sys.executable, "-c", STARTUP_SCRIPT, *extra])
+        result = json.loads(out.strip().splitlines()[-1])
+        print(f"  {name:<9} {result['seconds']:7.2f} s | max RSS {result['max_rss_mb']:8.1f} MB")
+
+
+def bench_db(args):
+    # Per-request connect (the old get_db()) vs the pool, against a local
+    # Postgres, running the two queries recommend() issues per call.
+    from concurrent.futures import ThreadPoolExecutor
+    from db import ConnectionPool, connect
+
+    with closing(connect()) as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT id FROM users ORDER BY id LIMIT 100")
+        user_ids = [row[0] for row in cur.fetchall()] or [1]
+
+    def queries(conn, user_id):
+        cur = conn.cursor()
+        cur.execute("SELECT movie_id, rating FROM ratings WHERE user_id = %s", (user_id,))
+        cur.fetchall()
+        cur.execute("SELECT genres, mood FROM preferences WHERE user_id = %s", (user_id,))
+        cur.fetchone()
+        cur.close()
+
+    def unpooled(user_id):
+        conn = connect()
+        try:
+            queries(conn, user_id)
+        finally:
+            conn.close()
+
+    pool = ConnectionPool(minconn=args.concurrency, maxconn=args.concurrency)
+    pool.open()
+
+    def pooled(user_id):
+        with pool.connection() as conn:
+            queries(conn, user_id)
+
+    print(f"\n🐘 DB benchmark: {args.requests} requests, concurrency {args.concurrency}")
+    for name, fn in [("connect", unpooled), ("pool", pooled)]:
+        def one(i):
+            _, elapsed = timed(fn, user_ids[i % len(user_ids)])
+            return elapsed
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.concurrency) as executor:
+            latencies = list(executor.map(one, range(args.requests)))
+        wall = time.perf_counter() - start
+
+        p = percentiles(latencies)
+        print(f"  {name:<8} p50 {p[50]:7.2f} ms | p95 {p[95]:7.2f} ms | p99 {p[99]:7.2f} ms | "
+              f"{args.requests / wall:8.1f} req/s")
+
+    print("  pool stats:", pool.stats())
+    pool.closeall()
+
+
+# -----------------------
+# Benchmark suite
+# -----------------------
+#
+#   python benchmark.py suite                          # 10k, 100k and 1m ratings
+#   python benchmark.py suite --scales 10k 100k --top-k 200 --out before.json
+#   python benchmark.py compare --files before.json after.json
+#
+# For every scale: generate a synthetic dataset (synthetic.py, cached under
+# --workdir), build its artifact, then measure cold start from the pickle
+# and from the artifact, recommend() scoring latency per method and, when
+# Postgres is reachable, /api/recommend throughput through serve.py. The
+# DB step copies --db-users dataset users into the configured database as
+# app users bench-<scale>-<id>@example.com, so point DB_NAME at a scratch
+# database. Everything lands in one JSON file; `compare` diffs two of them.
+
+def suite_meta(args):
+    import platform
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=HERE, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "seed": args.seed,
+        "top_k": args.top_k or 0,
+        "users": args.users,
+        "rounds": args.rounds,
+        "n": args.n,
+    }
+
+
+def seed_database(ratings, scale, count, seed):
+    # Copies the ratings of `count` dataset users into Postgres as app users
+    # and returns their app user ids. Ratings are rounded onto the table's
+    # integer 1-5 scale.
+    from psycopg2.extras import execute_values
+    from db import connect, upsert_ratings
+
+    rng = np.random.default_rng(seed)
+    picked = rng.choice(ratings['userId'].unique(), min(count, ratings['userId'].nunique()), replace=False)
+    emails = {f"bench-{scale}-{uid}@example.com": int(uid) for uid in picked}
+
+    with closing(connect()) as conn:
+        cur = conn.cursor()
+        execute_values(
+            cur,
+            "INSERT INTO users (username, email, password) VALUES %s ON CONFLICT (email) DO NOTHING",
+            [(email.split("@")[0], email, "benchmark") for email in emails]
+        )
+        cur.execute("SELECT id, email FROM users WHERE email = ANY(%s)", (list(emails),))
+        app_ids = {emails[email]: user_id for user_id, email in cur.fetchall()}
+
+        subset = ratings[ratings['userId'].isin(list(app_ids))]
+        upsert_ratings(cur, (
+            (app_ids[uid], int(mid), min(5, max(1, int(round(r)))))
+            for uid, mid, r in zip(subset['userId'], subset['movieId'], subset['rating'])
+        ))
+        # Stored batch results would skip scoring altogether
+        cur.execute("DELETE FROM recommendations WHERE user_id = ANY(%s)", (list(app_ids.values()),))
+        conn.commit()
+        cur.close()
+
+    return sorted(app_ids.values())
+
+
+def suite_throughput(args, scale, artifact, ratings):
+    import load_test
+    from db import connect
+
+    try:
+        connect().close()
+    except Exception as e:
+        return {"skipped": f"Postgres unavailable: {str(e).strip().splitlines()[0]}"}
+
+    user_ids = seed_database(ratings, scale, args.db_users, args.seed)
+
+    load = argparse.Namespace(
+        endpoint="recommend", port=args.port, threads=args.threads, cache=False,
+        server=[sys.executable, "serve.py"], concurrency=args.concurrency,
+        client_processes=max(1, (os.cpu_count() or 2) // 2), duration=args.duration
+    )
+    os.environ["MODEL_ARTIFACT"] = artifact
+    os.environ["INCREMENTAL_SYNC_INTERVAL"] = "0"
+    workers = os.cpu_count() or 1
+    result = load_test.run_server(workers, load, user_ids)
+    result.update(workers=workers, threads=args.threads, concurrency=args.concurrency)
+    return result
+
+
+def suite_scale(args, scale):
+    import shutil
+    from synthetic import ensure_dataset
+
+    entry = {}
+    source = ensure_dataset(scale, os.path.join(args.workdir, "data"), args.seed)
+    env = dict(os.environ, SIMILARITY_TOP_K=str(args.top_k or 0))
+
+    # Offline build
+    root = os.path.join(args.workdir, "artifacts", scale)
+    shutil.rmtree(root, ignore_errors=True)
+    seconds, rss, _ = run_measured([
+        sys.executable, "build_model.py", "--source", source, "--out", root,
+        "--version", scale, "--top-k", str(args.top_k or 0), "--no-activate"
+    ], env)
+    artifact = os.path.join(root, scale)
+    entry["build"] = {"seconds": seconds, "max_rss_mb": rss}
+    print(f"  build        {seconds:8.2f} s | max RSS {rss:8.1f} MB")
+
+    # Cold start
+    entry["startup"] = {}
+    for kind, path in [("pickle", source), ("artifact", artifact)]:
+        _, rss, out = run_measured([sys.executable, "-c", STARTUP_SCRIPT, kind, path], env)
+        seconds = json.loads(out.strip().splitlines()[-1])["seconds"]
+        entry["startup"][kind] = {"seconds": seconds, "max_rss_mb": rss}
+        print(f"  startup {kind:<8} {seconds:6.2f} s | max RSS {rss:8.1f} MB")
+
+    # Scoring latency (recommend() after its two queries)
+    model = load_artifact(artifact)
+    engine = model['engine']
+    ratings = model['ratings']
+    entry["dataset"] = {
+        "movies": len(model['movies']), "ratings": len(ratings), "users": int(ratings['userId'].nunique())
+    }
+    users = sample_users(ratings, engine.genre_index.names, args.users, seed=args.seed)
+
+    entry["recommend_ms"] = {}
+    for method in METHODS:
+        # Untimed pass first: the mapped arrays are paged in on first touch
+        for user in users:
+            engine_recommend(engine, *user, args.n, method)
+        times = [
+            timed(engine_recommend, engine, *user, args.n, method)[1]
+            for _ in range(args.rounds) for user in users
+        ]
+        entry["recommend_ms"][method] = {f"p{p}": v for p, v in percentiles(times).items()}
+        p = entry["recommend_ms"][method]
+        print(f"  {method:<14} p50 {p['p50']:7.2f} ms | p95 {p['p95']:7.2f} ms | p99 {p['p99']:7.2f} ms")
+    del model, engine
+
+    # End-to-end throughput
+    if args.no_db:
+        entry["throughput"] = {"skipped": "--no-db"}
+    else:
+        entry["throughput"] = suite_throughput(args, scale, artifact, ratings)
+    if "skipped" in entry["throughput"]:
+        print(f"  throughput   skipped ({entry['throughput']['skipped']})")
+    else:
+        t = entry["throughput"]
+        print(f"  throughput {t['rps']:8.1f} req/s | p99 {t.get('p99_ms', 0):7.2f} ms | errors {t['errors']}")
+
+    return entry
+
+
+def bench_suite(args):
+    out = args.out or os.path.join(args.workdir, "results", f"suite-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    results = {"meta": suite_meta(args), "scales": {}}
+
+    for scale in args.scales:
+        print(f"\n📏 Scale {scale}")
+        results["scales"][scale] = suite_scale(args, scale)
+
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\n📝 Results written to {out}")
+
+
+def flatten(tree, prefix=""):
+    # {"a": {"b": 1}} -> {"a.b": 1}, numbers only
+    flat = {}
+    for key, value in tree.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def bench_compare(args):
+    # Metric-by-metric diff of two suite results. Everything is "lower is
+    # better" except throughput; a change beyond --tolerance in the wrong
+    # direction is a regression and makes the command exit with status 1.
+    with open(args.files[0]) as f:
+        before = flatten(json.load(f)["scales"])
+    with open(args.files[1]) as f:
+        after = flatten(json.load(f)["scales"])
+
+    higher_is_better = ("rps", "requests")
+    ignored = ("errors", "dataset.", "workers", "threads", "concurrency")
+    regressions = 0
+
+    print(f"\n🔍 {args.files[0]} -> {args.files[1]} (tolerance {args.tolerance:.0%})")
+    for key in sorted(before.keys() & after.keys()):
+        if any(part in key for part in ignored) or before[key] == 0:
+            continue
+        change = (after[key] - before[key]) / abs(before[key])
+        worse = -change if key.endswith(higher_is_better) else change
+        flag = "❌" if worse > args.tolerance else ("✅" if worse < -args.tolerance else "  ")
+        regressions += worse > args.tolerance
+        print(f"  {flag} {key:<44} {before[key]:12.2f} -> {after[key]:12.2f} ({change:+.1%})")
+
+    if regressions:
+        raise SystemExit(f"❌ {regressions} regressions beyond {args.tolerance:.0%}")
+    print("✅ No regressions")
+
+
+BENCHMARKS = {
+    "ann": bench_ann,
+    "scoring": bench_scoring,
+    "similarity": bench_similarity,
+    "startup": bench_startup,
+    "db": bench_db,
+    "genres": bench_genres,
+    "catalog": bench_catalog,
+    "coldstart": bench_coldstart,
+    "rerank": bench_rerank,
+    "mf": bench_mf,
+    "quantize": bench_quantize,
+    "responses": bench_responses,
+    "suite": bench_suite,
+    "compare": bench_compare,
+}
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Recommender benchmarks")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--users", type=int, default=10, help="number of sampled users")
+    parser.add_argument("--n", type=int, default=10, help="recommendations per user")
+    parser.add_argument("--top-k", type=int, default=None,
+                        help="similarity neighbours per item for the loaded model (0 = dense)")
+    parser.add_argument("--ks", type=int, nargs="+", default=[50, 100, 200, 500],
+                        help="top-k values compared by the similarity benchmark")
+    parser.add_argument("--floor", type=float, default=0.0, help="similarity floor for top-k stores")
+    parser.add_argument("--artifact", default=None, help="artifact to benchmark (default: current)")
+    parser.add_argument("--rounds", type=int, default=50, help="repetitions per micro-benchmark query")
+    parser.add_argument("--candidates", type=int, nargs="+", default=[100, 300, 1000],
+                        help="shortlist sizes compared by the ann benchmark")
+    parser.add_argument("--nprobes", type=int, nargs="+", default=[50, 200, 1000],
+                        help="inverted lists probed, compared by the ann benchmark")
+    parser.add_argument("--requests", type=int, default=2000, help="requests for the db benchmark")
+    parser.add_argument("--concurrency", type=int, default=8, help="client threads for the db and suite benchmarks")
+    parser.add_argument("--scales", nargs="+", default=["10k", "100k", "1m"], help="synthetic sizes for the suite")
+    parser.add_argument("--seed", type=int, default=7, help="seed for synthetic data and sampled users")
+    parser.add_argument("--workdir", default=os.path.join(HERE, "benchmarks"),
+                        help="datasets, artifacts and results of the suite")
+    parser.add_argument("--out", default=None, help="suite results file (default: <workdir>/results/)")
+    parser.add_argument("--no-db", action="store_true", help="skip the suite's Postgres throughput step")
+    parser.add_argument("--db-users", type=int, default=100, help="dataset users copied into Postgres")
+    parser.add_argument("--threads", type=int, default=8, help="SERVER_THREADS for the suite's server")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of load per scale")
+    parser.add_argument("--port", type=int, default=5055, help="port for the suite's server")
+    parser.add_argument("--files", nargs=2, metavar=("BEFORE", "AFTER"), help="suite results to compare")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="relative change counted as a regression")
+    args = parser.parse_args()
+
+    BENCHMARKS[args.benchmark](args)
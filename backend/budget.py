@@ -0,0 +1,83 @@
+import threading
+import time
+
+import metrics
+
+# -----------------------
+# Request latency budget
+# -----------------------
+#
+# /api/recommend gets RECOMMEND_BUDGET_MS per request. recommend() answers
+# from the cheap cold-start path (popularity merged with the user's
+# preferences, see coldstart.py) instead of the full scorer when:
+#
+#   saturated   RECOMMEND_MAX_INFLIGHT computations are already running in
+#               this process
+#   database    no connection could be checked out within the budget, or
+#               the queries failed
+#   budget      a query ran into the budget (what is left of it is applied
+#               as the transaction's statement_timeout), or what is left is
+#               less than the full scorer has recently taken for this method
+#               (RECOMMEND_COST_PRIOR_MS until it has been measured)
+#   coalesced   an identical request is computing, but not within the budget
+#
+# Degraded results are flagged in the response and never cached.
+
+DEGRADED = metrics.registry.counter(
+    "recommend_degraded_total", "Recommendations served from the cheap fallback path", ["reason"]
+)
+
+
+class Deadline:
+
+    def __init__(self, seconds):
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(self.expires - time.monotonic(), 0.0)
+
+    def statement_timeout(self):
+        # What is left, in whole milliseconds for Postgres' statement_timeout
+        # (at least 1: 0 would disable the timeout)
+        return max(int(self.remaining() * 1000), 1)
+
+
+class Degraded(list):
+
+    # Response items from the fallback path, with why it was taken
+    degraded = True
+
+    def __init__(self, items, reason):
+        super().__init__(items)
+        self.reason = reason
+        DEGRADED.inc(reason=reason)
+
+
+class CostEstimate:
+
+    # Moving average of recent durations per key (the scoring method),
+    # `prior` seconds for keys not measured yet
+
+    def __init__(self, weight=0.1, prior=0.0):
+        self.weight = weight
+        self.prior = prior
+        self._averages = {}
+        self._lock = threading.Lock()
+
+    def observe(self, key, seconds):
+        with self._lock:
+            average = self._averages.get(key)
+            self._averages[key] = seconds if average is None else average + self.weight * (seconds - average)
+
+    def expected(self, key):
+        return self._averages.get(key, self.prior)
+
+    def skipped(self, key):
+        # Called when the estimate made a request skip the work: shrinks it,
+        # so one slow spell cannot keep every later request degraded and a
+        # real measurement is taken again after a few skips
+        with self._lock:
+            self._averages[key] = self._averages.get(key, self.prior) * (1.0 - self.weight)
+
+    def stats(self):
+        return {key: round(seconds * 1000, 3) for key, seconds in self._averages.items()}
@@ -0,0 +1,76 @@
+import argparse
+import os
+import time
+
+import pandas as pd
+
+from config import (
+    ARTIFACT_DIR, SIMILARITY_TOP_K, SIMILARITY_FLOOR, SIMILARITY_WORKERS, SIMILARITY_DTYPE, SIMILARITY_MIN_OVERLAP,
+    MF_FACTORS
+)
+from model import MODEL_PATH, load_model, load_streamed_model, save_artifact, set_current_artifact
+from rating_matrix import DEFAULT_CHUNK_SIZE, rating_chunks
+from similarity import DTYPES
+
+# -----------------------
+# Offline model build
+# -----------------------
+#
+#   python build_model.py                      # dense, from model_small.pkl
+#   python build_model.py --top-k 200          # pruned similarity stores
+#   python build_model.py --no-activate        # build without switching over
+#   python build_model.py --dtype int8         # 8x smaller similarity stores
+#
+# Catalogs too large for the pickle stream their ratings chunk by chunk
+# into a sparse matrix and compute similarity in parallel blocks:
+#
+#   python build_model.py --ratings ml-25m/ratings.csv --movies ml-25m/movies.csv \
+#       --top-k 200 --workers 8
+#   python build_model.py --ratings postgres --movies ml-25m/movies.csv --top-k 200
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Build a memory-mappable model artifact")
+    parser.add_argument("--source", default=MODEL_PATH, help="pickled movies/ratings frames")
+    parser.add_argument("--ratings", default=None,
+                        help="stream ratings from a .csv / .parquet file or `postgres` instead of --source")
+    parser.add_argument("--movies", default=None, help="movies CSV (movieId,title,genres) for --ratings")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="ratings read per chunk")
+    parser.add_argument("--workers", type=int, default=SIMILARITY_WORKERS, help="similarity build processes")
+    parser.add_argument("--out", default=ARTIFACT_DIR, help="artifact root directory")
+    parser.add_argument("--version", default=None, help="version name (default: timestamp)")
+    parser.add_argument("--top-k", type=int, default=SIMILARITY_TOP_K, help="neighbours per item (0 = dense)")
+    parser.add_argument("--floor", type=float, default=SIMILARITY_FLOOR, help="minimum stored similarity")
+    parser.add_argument("--dtype", choices=DTYPES, default=SIMILARITY_DTYPE, help="similarity storage type")
+    parser.add_argument("--min-overlap", type=float, default=SIMILARITY_MIN_OVERLAP,
+                        help="lowest top-n overlap with float64 accepted for a quantized --dtype")
+    parser.add_argument("--mf-factors", type=int, default=MF_FACTORS,
+                        help="matrix factor dimensions for method=mf (0 = none)")
+    parser.add_argument("--no-activate", action="store_true", help="do not update the `current` pointer")
+    args = parser.parse_args()
+
+    if args.ratings and not args.movies:
+        parser.error("--ratings needs --movies")
+
+    start = time.perf_counter()
+    if args.ratings:
+        movies = pd.read_csv(args.movies, usecols=["movieId", "title", "genres"])
+        chunks = rating_chunks(args.ratings, args.chunk_size)
+        model = load_streamed_model(chunks, movies, args.top_k, args.floor, args.workers, args.dtype, args.mf_factors)
+        source = args.ratings if os.path.isfile(args.ratings) else None
+    else:
+        model = load_model(args.source, args.top_k, args.floor, args.workers, args.dtype, args.mf_factors)
+        source = args.source
+
+    report = model.get("quantization")
+    if report and min(report["overlap"].values()) < args.min_overlap:
+        raise SystemExit(f"❌ {args.dtype} keeps less than {args.min_overlap:.0%} of the float64 top "
+                         f"{report['n']}; no artifact written (lower --min-overlap to accept it)")
+
+    print("💾 Writing artifact...")
+    path = save_artifact(model, args.out, source=source, version=args.version)
+
+    if not args.no_activate:
+        set_current_artifact(args.out, os.path.basename(path))
+
+    print(f"✅ Artifact written to {path} in {time.perf_counter() - start:.1f}s")
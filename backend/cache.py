@@ -0,0 +1,254 @@
+import multiprocessing
+import threading
+import time
+from collections import OrderedDict
+
+from config import RESULT_CACHE_SIZE, RESULT_CACHE_TTL
+
+# -----------------------
+# Cache backends
+# -----------------------
+#
+# Entries are keyed by tuples whose first element is the user id, so a
+# backend can drop everything cached for one user at once. A shared store
+# (e.g. Redis with one hash per user) only has to implement this interface.
+
+
+class CacheBackend:
+
+    def get(self, key):
+        # Returns the cached value, or None when missing or expired
+        raise NotImplementedError
+
+    def set(self, key, value, ttl, version=None):
+        # With `version`, only stores if the user's version still matches
+        raise NotImplementedError
+
+    def delete_user(self, user_id):
+        # Drops every entry for user_id and bumps its version
+        raise NotImplementedError
+
+    def version(self, user_id):
+        # Changes every time delete_user(user_id) or clear() runs
+        raise NotImplementedError
+
+    def clear(self):
+        # Drops every entry; values computed before it are no longer stored
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+
+class LocalVersions:
+
+    # Per-user versions for a single process
+
+    def __init__(self):
+        self._versions = {}
+
+    def get(self, user_id):
+        return self._versions.get(user_id, 0)
+
+    def bump(self, user_id):
+        # Returns the new version
+        self._versions[user_id] = self._versions.get(user_id, 0) + 1
+        return self._versions[user_id]
+
+
+class SharedVersions:
+
+    # Per-user versions in shared memory, seen by every process forked after
+    # it is created (serve.py workers), so a write handled by one worker
+    # invalidates what the others cached. Users hash into a fixed number of
+    # slots: a write can also invalidate another user's entries, never miss
+    # its own.
+
+    def __init__(self, slots=65536):
+        self.slots = slots
+        self._counts = multiprocessing.Array('Q', slots)
+
+    def get(self, user_id):
+        return self._counts[user_id % self.slots]
+
+    def bump(self, user_id):
+        with self._counts.get_lock():
+            counts = self._counts.get_obj()
+            counts[user_id % self.slots] += 1
+            return counts[user_id % self.slots]
+
+
+class MemoryBackend(CacheBackend):
+
+    # In-process LRU with per-entry expiry. Thread-safe. Entries remember
+    # the user's version they were computed at and are dropped once it moves.
+    # A version is (generation, per-user count): clear() bumps the
+    # generation, so a result computed against a model that was swapped or
+    # updated meanwhile is refused by set().
+
+    def __init__(self, max_entries=RESULT_CACHE_SIZE, versions=None):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self.versions = versions if versions is not None else LocalVersions()
+        self.generation = 0
+        self._entries = OrderedDict()   # key -> (expires_at, version, value), oldest first
+        self._by_user = {}              # user_id -> set of keys
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic() or entry[1] != self._version(key[0]):
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[2]
+
+    def set(self, key, value, ttl, version=None):
+        with self._lock:
+            current = self._version(key[0])
+            if version is not None and current != version:
+                return
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self._entries[key] = (time.monotonic() + ttl, current, value)
+            self._by_user.setdefault(key[0], set()).add(key)
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def delete_user(self, user_id):
+        with self._lock:
+            for key in list(self._by_user.get(user_id, ())):
+                self._remove(key)
+            self.versions.bump(user_id)
+
+    def version(self, user_id):
+        with self._lock:
+            return self._version(user_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+            self.generation += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _version(self, user_id):
+        # Called with the lock held
+        return (self.generation, self.versions.get(user_id))
+
+    def _remove(self, key):
+        # Called with the lock held
+        del self._entries[key]
+        keys = self._by_user[key[0]]
+        keys.discard(key)
+        if not keys:
+            del self._by_user[key[0]]
+
+# -----------------------
+# Recommendation result cache
+# -----------------------
+#
+# Misses are single-flight: concurrent requests for the same key (a page
+# firing the same /api/recommend several times) wait for the first one's
+# computation instead of each running their own. Results with a true
+# `degraded` attribute (see budget.py) are handed to the waiting requests
+# but never cached. clear() also detaches the computations in flight, so
+# requests arriving after a model swap or update start their own.
+
+
+class _Flight:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class RecommendationCache:
+
+    def __init__(self, backend=None, ttl=RESULT_CACHE_TTL):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+        self._inflight = {}         # key -> _Flight of the request computing it
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, user_id, method, n, compute, variant=None, wait=None):
+        # `variant` tells apart results computed with different options.
+        # A request joining another's computation waits at most `wait`
+        # seconds, then raises TimeoutError.
+        key = (int(user_id), method, int(n), variant)
+
+        result = self.backend.get(key)
+        if result is not None:
+            with self._lock:
+                self.hits += 1
+            return result
+
+        with self._lock:
+            flight = self._inflight.get(key)
+            if flight is None:
+                self.misses += 1
+                flight = self._inflight[key] = _Flight()
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            if not flight.done.wait(wait):
+                raise TimeoutError("Timed out waiting for an identical request")
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            # If a write invalidates this user, or the cache is cleared, while
+            # we compute, the result may already be stale: it is returned but
+            # not cached.
+            version = self.backend.version(key[0])
+            result = compute()
+            if not getattr(result, "degraded", False):
+                self.backend.set(key, result, self.ttl, version)
+            flight.result = result
+            return result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._inflight.get(key) is flight:
+                    del self._inflight[key]
+            flight.done.set()
+
+    def clear(self):
+        self.backend.clear()
+        with self._lock:
+            self._inflight.clear()
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self.invalidations += 1
+        self.backend.delete_user(int(user_id))
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.backend),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "coalesced": self.coalesced,
+            "invalidations": self.invalidations,
+            "evictions": getattr(self.backend, "evictions", None),
+        }
@@ -0,0 +1,113 @@
+import sys
+
+import numpy as np
+
+from genre_index import GenreIndex
+
+# -----------------------
+# Movie catalog
+# -----------------------
+#
+# The request path reads the catalog through this class instead of the
+# `movies` DataFrame, which is kept for offline tooling only. Each column is
+# a contiguous array indexed by catalog position (the row order of the
+# frame it was built from):
+#
+#   movie_ids, years     NumPy arrays
+#   titles               list of str
+#   genre_codes          position -> index into genre_strings; movies share
+#                        their pipe-separated genre string (~1k distinct
+#                        strings for ~10k movies)
+#   genre_index          genre bitmasks and posting lists (genre_index.py)
+#   position             movie id -> catalog position
+#   card_items           prebuilt /api/movies-by-genre items of the movies
+#                        from genre_index.MIN_YEAR on (None for older ones)
+#
+# Building a response item reads plain Python objects, with no per-row
+# pandas indexing, Series allocation or merge.
+
+
+class Catalog:
+
+    __slots__ = ("movie_ids", "years", "titles", "genre_strings", "genre_codes", "genre_index", "position",
+                 "card_items")
+
+    def __init__(self, movie_ids, titles, genres, years):
+        self.movie_ids = np.asarray(movie_ids, dtype=np.int64)
+        self.years = np.asarray(years, dtype=np.int64)
+        self.titles = [sys.intern(str(t)) for t in titles]
+
+        genres = [str(g) for g in genres]
+        self.genre_strings, codes = np.unique(genres, return_inverse=True)
+        self.genre_strings = [sys.intern(g) for g in self.genre_strings.tolist()]
+        self.genre_codes = codes.astype(np.int32)
+
+        self.genre_index = GenreIndex(genres, self.years)
+        self.position = {mid: i for i, mid in enumerate(self.movie_ids.tolist())}
+
+        # Only recent movies are ever served by genre
+        self.card_items = [None] * len(self.movie_ids)
+        recent = self.genre_index.recent
+        for p, item in zip(recent.tolist(), self._build_cards(recent)):
+            self.card_items[p] = item
+
+    @classmethod
+    def from_frame(cls, movies):
+        return cls(movies['movieId'].to_numpy(), movies['title'].to_numpy(),
+                   movies['genres'].to_numpy(), movies['year'].to_numpy())
+
+    def __len__(self):
+        return len(self.movie_ids)
+
+    @property
+    def nbytes(self):
+        # Arrays plus the string payloads (not the dict and list overhead)
+        strings = sum(len(s) for s in self.titles) + sum(len(s) for s in self.genre_strings)
+        return self.movie_ids.nbytes + self.years.nbytes + self.genre_codes.nbytes + strings
+
+    def genres(self, position):
+        return self.genre_strings[self.genre_codes[position]]
+
+    # ---------------------------
+    # Response items
+    # ---------------------------
+
+    def recommendations(self, positions, scores):
+        # The /api/recommend items, in the order given (best first)
+        titles, genre_strings = self.titles, self.genre_strings
+        return [
+            {"title": titles[p], "genres": genre_strings[code], "score": score, "year": year}
+            for p, code, year, score in zip(
+                positions.tolist(),
+                self.genre_codes[positions].tolist(),
+                self.years[positions].tolist(),
+                np.asarray(scores, dtype=np.float64).tolist()
+            )
+        ]
+
+    def cards(self, positions):
+        # The /api/movies-by-genre items, in the frontend's field names.
+        # Prebuilt items are shared between responses: do not modify them.
+        items = self.card_items
+        cards = [items[p] for p in np.asarray(positions).tolist()]
+        if None not in cards:
+            return cards
+        return self._build_cards(np.asarray(positions, dtype=np.int64))
+
+    def _build_cards(self, positions):
+        titles, genre_strings = self.titles, self.genre_strings
+        return [
+            {
+                "id": movie_id,
+                "title": titles[p],
+                "genre": genre_strings[code],
+                "year": year,
+                "summary": f"Released in {year}. A popular {genre_strings[code].replace('|', ', ')} movie.",
+            }
+            for p, movie_id, code, year in zip(
+                positions.tolist(),
+                self.movie_ids[positions].tolist(),
+                self.genre_codes[positions].tolist(),
+                self.years[positions].tolist()
+            )
+        ]
@@ -0,0 +1,123 @@
+import numpy as np
+
+from config import COLD_START_PRIOR, COLD_START_DEPTH
+from genre_index import MOOD_MAP, MIN_YEAR
+from scoring import GENRE_BOOST, MOOD_BOOST, RECENCY_PER_YEAR, top_n
+
+# -----------------------
+# Cold-start recommendations
+# -----------------------
+#
+# Users with fewer than COLD_START_MIN_RATINGS ratings have no
+# collaborative or content signal, so the full scorer would only rank
+# movies by their genre/mood boosts. They are served from popularity
+# instead:
+#
+#   score = base + GENRE_BOOST (preferred genre) + MOOD_BOOST (mood genre)
+#   base  = weighted rating / 5 * recency
+#
+# The weighted rating is the movie's mean rating damped towards the
+# catalog mean by COLD_START_PRIOR pseudo-ratings. Without the damping, a
+# movie rated 5 by a single user would outrank well-liked classics.
+#
+# Each list below holds post-2000 movies sorted by base, truncated to
+# COLD_START_DEPTH:
+#   overall                every movie
+#   by_genre[g]            movies tagged g
+#   by_mood[m]             movies tagged with any of MOOD_MAP[m]
+#   by_genre_mood[g, m]    movies in both
+# A query scores only the union of the lists for its genres and mood, which
+# is exact. Within a list every movie gets the same boosts, so a movie
+# missing from the list of its own boost pattern has at least DEPTH
+# better-scored movies ahead of it.
+
+
+class ColdStartEngine:
+
+    def __init__(self, catalog, user_movie_matrix, prior=COLD_START_PRIOR, depth=COLD_START_DEPTH):
+        self.catalog = catalog
+        self.genre_index = catalog.genre_index
+        self.depth = depth
+
+        # Rating counts and means per catalog position
+        matrix = user_movie_matrix.matrix
+        rated = np.array([catalog.position.get(m, -1) for m in user_movie_matrix.movie_ids.tolist()])
+        known = rated >= 0
+        self.counts = np.zeros(len(catalog))
+        sums = np.zeros(len(catalog))
+        self.counts[rated[known]] = np.bincount(matrix.indices, minlength=matrix.shape[1])[known]
+        sums[rated[known]] = np.bincount(matrix.indices, weights=matrix.data, minlength=matrix.shape[1])[known]
+
+        mean = sums.sum() / max(self.counts.sum(), 1)
+        weighted = (sums + prior * mean) / (self.counts + prior)
+        self.means = np.divide(sums, self.counts, out=np.zeros(len(catalog)), where=self.counts > 0)
+
+        recency = 1.0 + (catalog.years - MIN_YEAR) * RECENCY_PER_YEAR
+        self.base = weighted / 5.0 * recency
+
+        index = self.genre_index
+        self.mood_masks = {mood: index.mask(genres) for mood, genres in MOOD_MAP.items()}
+        self.overall = self._ranked(index.recent)
+        self.by_genre = {g: self._ranked(p) for g, p in index.recent_postings.items()}
+        self.by_mood = {mood: self._ranked(index.any_of(genres)) for mood, genres in MOOD_MAP.items()}
+        self.by_genre_mood = {
+            (g, mood): self._ranked(p[(index.masks[p] & mask) != 0])
+            for g, p in index.recent_postings.items()
+            for mood, mask in self.mood_masks.items()
+        }
+
+    def _ranked(self, positions):
+        # The `depth` best positions by base, ties broken by catalog order
+        positions = np.asarray(positions, dtype=np.int64)
+        order = np.lexsort((positions, -self.base[positions]))[:self.depth]
+        return positions[order]
+
+    @property
+    def nbytes(self):
+        lists = [self.overall, *self.by_genre.values(), *self.by_mood.values(), *self.by_genre_mood.values()]
+        return self.base.nbytes + self.counts.nbytes + self.means.nbytes + sum(p.nbytes for p in lists)
+
+    # ---------------------------
+    # Scoring
+    # ---------------------------
+
+    def score(self, rating_rows, preferred_genres=(), mood="", positions=None):
+        # Cold-start scores of the movies at `positions` (default: every
+        # post-2000 movie), without the user's rated movies
+        if positions is None:
+            positions = self.genre_index.recent
+
+        index = self.genre_index
+        masks = index.masks[positions]
+        scores = self.base[positions].copy()
+        scores[(masks & index.mask(preferred_genres)) != 0] += GENRE_BOOST
+        scores[(masks & self.mood_masks.get(mood, np.uint64(0))) != 0] += MOOD_BOOST
+
+        rated = [self.catalog.position[m] for m, _ in rating_rows if m in self.catalog.position]
+        if rated:
+            keep = ~np.isin(positions, rated)
+            positions, scores = positions[keep], scores[keep]
+        return positions, scores
+
+    def candidates(self, preferred_genres=(), mood=""):
+        # Union of the precomputed lists that can hold this user's top movies
+        genres = [g for g in set(preferred_genres) if g in self.by_genre]
+        lists = [self.overall]
+        lists.extend(self.by_genre[g] for g in genres)
+        if mood in self.by_mood:
+            lists.append(self.by_mood[mood])
+            lists.extend(self.by_genre_mood[g, mood] for g in genres)
+        # A flag array is much cheaper than np.unique for a few hundred ids
+        union = np.zeros(len(self.base), dtype=bool)
+        union[np.concatenate(lists)] = True
+        return np.flatnonzero(union)
+
+    def recommend(self, rating_rows, preferred_genres=(), mood="", n=10):
+        # (positions, scores) of the top n, best first. The lists are only
+        # deep enough when n plus the user's rated movies fits in them;
+        # beyond that every post-2000 movie is scored.
+        rating_rows = list(rating_rows)
+        positions = None
+        if n + len(rating_rows) <= self.depth:
+            positions = self.candidates(preferred_genres, mood)
+        return top_n(*self.score(rating_rows, preferred_genres, mood, positions), n)
@@ -0,0 +1,229 @@
+import os
+
+# -----------------------
+# Backend settings (override with environment variables)
+# -----------------------
+
+# Similarity store: neighbours kept per item and the minimum similarity worth
+# storing. 0 keeps the exact dense N x N matrices; set a top-k (e.g. 200) for
+# catalogs too large for that, see `python benchmark.py similarity` for the
+# memory / ranking trade-off.
+SIMILARITY_TOP_K = int(os.environ.get("SIMILARITY_TOP_K", 0))
+SIMILARITY_FLOOR = float(os.environ.get("SIMILARITY_FLOOR", 0.0))
+# Processes computing similarity blocks during a model build (1 = inline).
+# Each holds one block of 1024 x catalog floats at a time.
+SIMILARITY_WORKERS = int(os.environ.get("SIMILARITY_WORKERS", 1))
+# Storage type of similarity values: float64, float32, float16 or int8
+# (with a float64 scale per row); 2x / 4x / 8x smaller than float64. int8
+# also scores fastest; float16 is slowest, as NumPy widens it in software.
+# build_model.py reports the top-n overlap with float64 and refuses to write
+# an artifact below SIMILARITY_MIN_OVERLAP (see `python benchmark.py quantize`).
+SIMILARITY_DTYPE = os.environ.get("SIMILARITY_DTYPE", "float64")
+SIMILARITY_MIN_OVERLAP = float(os.environ.get("SIMILARITY_MIN_OVERLAP", 0.9))
+
+# Matrix factorization behind method="mf" (mf.py), trained by build_model.py
+# only: latent dimensions (0 skips training and disables the method), ALS
+# sweeps, ridge penalty per rating, and threads solving the per-user /
+# per-item systems.
+MF_FACTORS = int(os.environ.get("MF_FACTORS", 64))
+MF_ITERATIONS = int(os.environ.get("MF_ITERATIONS", 15))
+MF_REGULARIZATION = float(os.environ.get("MF_REGULARIZATION", 0.1))
+MF_WORKERS = int(os.environ.get("MF_WORKERS", os.cpu_count() or 1))
+
+# Precomputed model artifacts written by build_model.py. MODEL_ARTIFACT may
+# point at a version directory or at the `current` pointer file; when it does
+# not exist the server rebuilds everything from model_small.pkl.
+ARTIFACT_DIR = os.environ.get("ARTIFACT_DIR", os.path.join(os.path.dirname(__file__), "artifacts"))
+MODEL_ARTIFACT = os.environ.get("MODEL_ARTIFACT", os.path.join(ARTIFACT_DIR, "current"))
+
+# Seconds between checks of MODEL_ARTIFACT for a new version to hot-reload
+# (0 disables); build_model.py switches `current` once an artifact is written
+MODEL_WATCH_INTERVAL = float(os.environ.get("MODEL_WATCH_INTERVAL", 10.0))
+# Token expected in the X-Admin-Token header of /api/admin/* requests; the
+# admin endpoints are disabled while it is empty
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+
+# -----------------------
+# PostgreSQL
+# -----------------------
+
+DB_SETTINGS = {
+    "host": os.environ.get("DB_HOST", "localhost"),
+    "database": os.environ.get("DB_NAME", "movie_recommendation"),
+    "user": os.environ.get("DB_USER", "postgres"),
+    "password": os.environ.get("DB_PASSWORD", "postgres@123"),
+}
+
+# Connection pool: connections kept open, hard upper bound (keep it below
+# Postgres max_connections divided by the number of worker processes), and
+# how long a request waits for a free connection before failing.
+DB_POOL_MIN = int(os.environ.get("DB_POOL_MIN", 2))
+DB_POOL_MAX = int(os.environ.get("DB_POOL_MAX", 10))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 5.0))
+# Idle connections above DB_POOL_MIN are closed after this many seconds
+DB_POOL_MAX_IDLE = float(os.environ.get("DB_POOL_MAX_IDLE", 300.0))
+# Connections idle for longer than this are pinged before being handed out
+DB_HEALTH_CHECK_AFTER = float(os.environ.get("DB_HEALTH_CHECK_AFTER", 30.0))
+# Hash partitions of `ratings` by user_id created by migrate.py (0 keeps
+# one table; changing it later needs a manual rebuild)
+DB_RATINGS_PARTITIONS = int(os.environ.get("DB_RATINGS_PARTITIONS", 0))
+
+# -----------------------
+# Caches
+# -----------------------
+
+# /api/recommend results per (user_id, method, n); entries are dropped as
+# soon as the user rates movies or changes preferences.
+RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", 10000))
+RESULT_CACHE_TTL = float(os.environ.get("RESULT_CACHE_TTL", 300.0))
+
+# Ratings and preferences per user (profiles.py), kept current by /api/rate
+# and /api/preferences. The TTL bounds how long writes made outside the API
+# (import_ratings.py, manual SQL) can go unnoticed. PROFILE_CACHE_WARM users
+# with the latest ratings are loaded when the server starts (0 disables).
+PROFILE_CACHE_SIZE = int(os.environ.get("PROFILE_CACHE_SIZE", 20000))
+PROFILE_CACHE_TTL = float(os.environ.get("PROFILE_CACHE_TTL", 3600.0))
+PROFILE_CACHE_WARM = int(os.environ.get("PROFILE_CACHE_WARM", 1000))
+
+# /api/movies-by-genre candidate pools per genre combination, and seeded
+# shuffles of them for paginated requests (genre_index.py). Single genres
+# are precomputed and not counted.
+GENRE_POOL_CACHE_SIZE = int(os.environ.get("GENRE_POOL_CACHE_SIZE", 1024))
+# Largest page /api/movies-by-genre returns
+GENRE_PAGE_MAX = int(os.environ.get("GENRE_PAGE_MAX", 100))
+
+# -----------------------
+# Incremental model updates
+# -----------------------
+
+# Seconds between pulls of new ratings from Postgres into the collaborative
+# similarity (0 disables). Needs the dense store (SIMILARITY_TOP_K=0).
+INCREMENTAL_SYNC_INTERVAL = float(os.environ.get("INCREMENTAL_SYNC_INTERVAL", 300.0))
+
+# -----------------------
+# Cold start (coldstart.py)
+# -----------------------
+
+# Users with fewer ratings than this are served from precomputed popularity
+# lists merged with their preferred genres and mood; from this many ratings
+# on they get the full hybrid scorer (0 disables the cold-start path).
+COLD_START_MIN_RATINGS = int(os.environ.get("COLD_START_MIN_RATINGS", 1))
+# Pseudo-ratings at the catalog mean added to every movie's mean rating, so
+# movies with a handful of ratings do not top the popularity lists
+COLD_START_PRIOR = float(os.environ.get("COLD_START_PRIOR", 10.0))
+# Movies kept per precomputed list; requests for more recommendations than
+# this (plus the user's rated movies) score the whole catalog instead
+COLD_START_DEPTH = int(os.environ.get("COLD_START_DEPTH", 200))
+
+# -----------------------
+# Candidate generation
+# -----------------------
+
+# Shortlist size for the ANN stage in front of scoring (see ann.py); 0 scores
+# every post-2000 movie. Worth enabling once the catalog is large enough
+# that exhaustive scoring dominates latency (python benchmark.py ann).
+ANN_CANDIDATES = int(os.environ.get("ANN_CANDIDATES", 0))
+# Inverted lists probed per query; more lists means higher recall and latency
+ANN_NPROBE = int(os.environ.get("ANN_NPROBE", 200))
+
+# -----------------------
+# Diversity re-ranking (rerank.py)
+# -----------------------
+
+# How the final list is picked from the RERANK_POOL best scored movies:
+# "none" (plain top n, sorted by score), "mmr" (trade score for content
+# dissimilarity) or "genre_cap" (at most RERANK_GENRE_CAP movies per genre
+# string). Re-ranked lists are not sorted by score, so clients opt in per
+# request ({"rerank": "mmr"} on /api/recommend, with the same knobs).
+RERANK_METHOD = os.environ.get("RERANK_METHOD", "none")
+RERANK_POOL = int(os.environ.get("RERANK_POOL", 200))
+# MMR weight of dissimilarity against score, from 0 (plain top n) to 1
+RERANK_DIVERSITY = float(os.environ.get("RERANK_DIVERSITY", 0.3))
+RERANK_GENRE_CAP = int(os.environ.get("RERANK_GENRE_CAP", 2))
+# Re-ranking stops after this many milliseconds and fills the remaining
+# slots in score order
+RERANK_BUDGET_MS = float(os.environ.get("RERANK_BUDGET_MS", 5.0))
+
+# -----------------------
+# Request budget (budget.py)
+# -----------------------
+
+# Milliseconds /api/recommend may take before it answers from the cheap
+# popularity path instead of the full scorer (0 disables the budget)
+RECOMMEND_BUDGET_MS = float(os.environ.get("RECOMMEND_BUDGET_MS", 500.0))
+# Full recommendations computed at once per process. Scoring mostly holds
+# the GIL, so beyond a few concurrent ones each only gets slower; further
+# requests are answered from the cheap path right away (0 = no limit).
+RECOMMEND_MAX_INFLIGHT = int(os.environ.get("RECOMMEND_MAX_INFLIGHT", 4))
+# Assumed cost of a full scoring pass for a method that has not been timed
+# yet in this process; deliberately pessimistic, it is replaced by the
+# measured average after the first full pass
+RECOMMEND_COST_PRIOR_MS = float(os.environ.get("RECOMMEND_COST_PRIOR_MS", 100.0))
+
+# -----------------------
+# Responses (responses.py)
+# -----------------------
+
+# JSON bodies of at least this many bytes are compressed (brotli when
+# installed, else gzip at RESPONSE_GZIP_LEVEL) for clients that accept it;
+# 0 disables compression
+RESPONSE_COMPRESS_MIN_BYTES = int(os.environ.get("RESPONSE_COMPRESS_MIN_BYTES", 1024))
+RESPONSE_GZIP_LEVEL = int(os.environ.get("RESPONSE_GZIP_LEVEL", 6))
+# Encoded bodies of cached recommendations and seeded genre pages kept for
+# ETag checks and re-sends (0 disables)
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", 4096))
+
+# -----------------------
+# Serving (serve.py)
+# -----------------------
+#
+# serve.py loads the model once and forks SERVER_WORKERS processes that share
+# its arrays (copy-on-write, plus the page cache for mmap'd artifacts). Each
+# worker runs up to SERVER_THREADS requests at a time; further connections
+# wait in its queue.
+#
+# - Scoring is CPU-bound and mostly holds the GIL, so parallel scoring comes
+#   from workers: use about one per core.
+# - Threads cover time spent waiting on Postgres. A thread beyond DB_POOL_MAX
+#   only waits for a connection, so keep SERVER_THREADS <= DB_POOL_MAX and
+#   SERVER_WORKERS * DB_POOL_MAX below Postgres max_connections.
+# - With incremental updates on, each worker syncs on its own and keeps a
+#   private copy of the dense collaborative matrix once it changes.
+SERVER_HOST = os.environ.get("SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.environ.get("SERVER_PORT", 5000))
+SERVER_WORKERS = int(os.environ.get("SERVER_WORKERS", os.cpu_count() or 1))
+SERVER_THREADS = int(os.environ.get("SERVER_THREADS", 8))
+# Pending connections the kernel queues before refusing new ones
+SERVER_BACKLOG = int(os.environ.get("SERVER_BACKLOG", 1024))
+# Seconds an idle keep-alive connection may hold a request thread
+SERVER_KEEPALIVE = float(os.environ.get("SERVER_KEEPALIVE", 5.0))
+
+# -----------------------
+# Batch recommendations (batch.py)
+# -----------------------
+
+# Recommendations stored per user and method by batch runs; /api/recommend
+# serves any n up to this straight from the `recommendations` table.
+BATCH_RESULT_SIZE = int(os.environ.get("BATCH_RESULT_SIZE", 50))
+# Stored rows older than this many seconds are ignored (0 never serves them)
+BATCH_RESULT_MAX_AGE = float(os.environ.get("BATCH_RESULT_MAX_AGE", 86400.0))
+# Users scored per matrix product; each intermediate is chunk x catalog floats
+BATCH_CHUNK_SIZE = int(os.environ.get("BATCH_CHUNK_SIZE", 256))
+# Most user_ids accepted by one /api/recommend/batch request
+BATCH_MAX_USERS = int(os.environ.get("BATCH_MAX_USERS", 5000))
+
+# -----------------------
+# Observability
+# -----------------------
+
+# Requests slower than this many milliseconds are logged as one JSON line
+# with their per-stage timings (-1 never logs, 0 logs every request). The
+# same timings are always returned in the Server-Timing response header.
+SPAN_LOG_THRESHOLD_MS = float(os.environ.get("SPAN_LOG_THRESHOLD_MS", 500.0))
+
+# Sampling profiler (profiler.py): when enabled, a request carrying the
+# header `X-Profile: 1` is sampled every PROFILE_INTERVAL seconds and its
+# folded stacks are written under PROFILE_DIR. Off by default.
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "0") == "1"
+PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL", 0.001))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(os.path.dirname(__file__), "profiles"))
@@ -0,0 +1,297 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.extras import execute_values
+from psycopg2.extensions import cursor as _cursor
+from psycopg2.pool import PoolError
+
+from config import (
+    DB_SETTINGS, DB_POOL_MIN, DB_POOL_MAX, DB_POOL_TIMEOUT,
+    DB_POOL_MAX_IDLE, DB_HEALTH_CHECK_AFTER
+)
+from metrics import record_query, span
+
+# -----------------------
+# PostgreSQL connection pool
+# -----------------------
+#
+#   with pool.connection() as conn:
+#       cur = conn.cursor()
+#       ...
+#       conn.commit()
+#
+# Connections are checked out for the duration of the `with` block and go
+# back to the pool afterwards. Anything left uncommitted is rolled back on
+# return, and broken connections are discarded instead of reused.
+#
+# Every statement is timed and counted by verb (db_query_duration_seconds,
+# db_queries_total in metrics.py); time spent waiting for a free connection
+# shows up as the db.checkout stage.
+
+
+class TimedCursor(_cursor):
+
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            result = super().execute(query, vars)
+        except Exception:
+            record_query(_verb(query), time.perf_counter() - start, failed=True)
+            raise
+        record_query(_verb(query), time.perf_counter() - start)
+        return result
+
+
+def _verb(query):
+    # SELECT / INSERT / DELETE ...; execute_values() passes bytes
+    head = query[:64].decode(errors="replace") if isinstance(query, bytes) else str(query)[:64]
+    words = head.split(None, 1)
+    return words[0].upper() if words else "EMPTY"
+
+
+def connect():
+    return psycopg2.connect(cursor_factory=TimedCursor, **DB_SETTINGS)
+
+
+def _close_quietly(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+class ConnectionPool:
+
+    def __init__(self, minconn=DB_POOL_MIN, maxconn=DB_POOL_MAX, timeout=DB_POOL_TIMEOUT,
+                 max_idle=DB_POOL_MAX_IDLE, health_check_after=DB_HEALTH_CHECK_AFTER, factory=connect):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.health_check_after = health_check_after
+        self.factory = factory
+
+        self._idle = []          # (connection, returned_at), most recent last
+        self._size = 0           # open connections, idle + checked out
+        self._cond = threading.Condition()
+
+        # Metrics
+        self.checkouts = 0
+        self.waits = 0           # checkouts that found the pool saturated
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.timeouts = 0
+        self.discarded = 0
+
+    def open(self):
+        # Pre-opens connections up to minconn
+        for _ in range(self.minconn):
+            with self._cond:
+                if self._size >= self.minconn:
+                    return
+                self._size += 1
+            self._checkin(self._new_connection())
+
+    # ---------------------------
+    # Checkout / checkin
+    # ---------------------------
+
+    def getconn(self, timeout=None):
+        # `timeout` overrides the pool's wait limit for this checkout
+        timeout = self.timeout if timeout is None else timeout
+        start = time.perf_counter()
+        waited = False
+
+        with self._cond:
+            while True:
+                self._reap_idle()
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                    break
+                if self._size < self.maxconn:
+                    self._size += 1
+                    conn, returned_at = None, None
+                    break
+
+                waited = True
+                remaining = timeout - (time.perf_counter() - start)
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolError(f"No database connection available within {timeout:.3g}s")
+                self._cond.wait(remaining)
+
+            elapsed = time.perf_counter() - start
+            self.checkouts += 1
+            if waited:
+                self.waits += 1
+                self.wait_seconds += elapsed
+                self.max_wait_seconds = max(self.max_wait_seconds, elapsed)
+
+        if conn is None:
+            return self._new_connection()
+
+        if not self._healthy(conn, returned_at):
+            # Replace it in place, keeping the slot it occupied
+            _close_quietly(conn)
+            with self._cond:
+                self.discarded += 1
+            return self._new_connection()
+
+        return conn
+
+    def putconn(self, conn):
+        if conn.closed:
+            self._discard(conn)
+            return
+
+        try:
+            if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        except psycopg2.Error:
+            self._discard(conn)
+            return
+
+        self._checkin(conn)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        with span("db.checkout"):
+            conn = self.getconn(timeout)
+        try:
+            yield conn
+        except Exception:
+            if not conn.closed:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    pass
+            raise
+        finally:
+            self.putconn(conn)
+
+    # ---------------------------
+    # Internals
+    # ---------------------------
+
+    def _new_connection(self):
+        try:
+            return self.factory()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    def _checkin(self, conn):
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def _discard(self, conn):
+        _close_quietly(conn)
+        with self._cond:
+            self._size -= 1
+            self.discarded += 1
+            self._cond.notify()
+
+    def _healthy(self, conn, returned_at):
+        if conn.closed:
+            return False
+        # Connections that sat idle for a while may have been dropped by the
+        # server or a proxy; ping them before handing them out.
+        if time.monotonic() - returned_at < self.health_check_after:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _reap_idle(self):
+        # Close connections above minconn that have been idle too long.
+        # Called with the lock held; the oldest idle connections come first.
+        now = time.monotonic()
+        while self._size > self.minconn and self._idle and now - self._idle[0][1] > self.max_idle:
+            conn, _ = self._idle.pop(0)
+            self._size -= 1
+            _close_quietly(conn)
+
+    def stats(self):
+        with self._cond:
+            idle = len(self._idle)
+            return {
+                "size": self._size,
+                "idle": idle,
+                "in_use": self._size - idle,
+                "min": self.minconn,
+                "max": self.maxconn,
+                "saturation": round((self._size - idle) / self.maxconn, 3),
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "wait_seconds_total": round(self.wait_seconds, 6),
+                "wait_seconds_max": round(self.max_wait_seconds, 6),
+                "timeouts": self.timeouts,
+                "discarded": self.discarded,
+            }
+
+    def closeall(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for conn, _ in idle:
+            _close_quietly(conn)
+
+
+pool = ConnectionPool()
+
+
+# -----------------------
+# Batched writes
+# -----------------------
+
+# Rows per INSERT statement; a typical /api/rate payload fits in one
+UPSERT_PAGE_SIZE = 1000
+
+UPSERT_RATINGS_SQL = """
+    INSERT INTO ratings (user_id, movie_id, rating)
+    VALUES %s
+    ON CONFLICT (user_id, movie_id)
+    DO UPDATE SET rating = EXCLUDED.rating
+"""
+
+UPSERT_RATINGS_RETURNING_SQL = UPSERT_RATINGS_SQL + "    RETURNING movie_id, rating\n"
+
+
+def upsert_ratings(cur, rows, page_size=UPSERT_PAGE_SIZE, returning=False):
+    # rows: iterable of (user_id, movie_id, rating). Written with multi-row
+    # INSERT ... ON CONFLICT statements inside the caller's transaction, so
+    # the batch still commits or rolls back as a whole.
+    #
+    # created_at keeps the time of the first rating. Changes, re-ratings
+    # included, are tracked by the change_txid column, which Postgres stamps
+    # on every insert and update (see migrate.py and incremental.py).
+    #
+    # Postgres refuses to update the same row twice in one statement, so
+    # repeated (user_id, movie_id) pairs are collapsed first; the last one
+    # wins, as it did when each row was its own statement.
+    #
+    # Returns the number of rows written, or with `returning` the
+    # (movie_id, rating) pairs as stored (ratings cast to the column type).
+    latest = {}
+    for user_id, movie_id, rating in rows:
+        latest[(user_id, movie_id)] = rating
+
+    stored = execute_values(
+        cur,
+        UPSERT_RATINGS_RETURNING_SQL if returning else UPSERT_RATINGS_SQL,
+        [(user_id, movie_id, rating) for (user_id, movie_id), rating in latest.items()],
+        page_size=page_size,
+        fetch=returning
+    )
+    return stored if returning else len(latest)
@@ -0,0 +1,181 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from config import GENRE_POOL_CACHE_SIZE
+
+# -----------------------
+# Genre index
+# -----------------------
+
+MOOD_MAP = {
+    "Happy": ["Comedy", "Adventure", "Animation", "Musical"],
+    "Funny": ["Comedy", "Animation"],
+    "Sad": ["Drama", "Romance", "Documentary"],
+    "Quirky": ["Indie", "Fantasy", "Comedy"], # Indie might not be a genre in dataset, checking... usually standard genres
+    "Romantic": ["Romance", "Comedy"],
+    "Action": ["Action", "Thriller", "Sci-Fi", "Adventure"]
+}
+
+# Catalog queries only return movies released from this year on
+MIN_YEAR = 2000
+
+# Genres per catalog: one bit each in a uint64 mask
+MAX_GENRES = 64
+
+
+def sample(pool, n, rng):
+    # n distinct entries of `pool` in random order, at a cost that depends on
+    # n rather than len(pool): indices are drawn with replacement and repeats
+    # skipped (a dict keeps the first draws in order). Pools under 4 * n,
+    # where repeats get frequent, are permuted instead.
+    size = len(pool)
+    if size <= n:
+        return pool
+    if size <= 4 * n:
+        return pool[rng.permutation(size)[:n]]
+
+    picks = {}
+    while len(picks) < n:
+        for i in rng.integers(0, size, 2 * n).tolist():
+            picks.setdefault(i)
+            if len(picks) == n:
+                break
+    return pool[list(picks)]
+
+
+class GenreIndex:
+
+    # Built once per model from the pipe-separated `genres` column:
+    #   masks[i]       bitmask of movie i's genres (bit j = names[j])
+    #   postings[g]    sorted catalog positions of movies tagged g
+    #   recent         sorted positions of movies from MIN_YEAR on
+    # Genres that are not in the catalog (e.g. "Indie") match nothing.
+    #
+    # /api/movies-by-genre samples from pool(): the recent movies matching a
+    # genre selection. Single genres and the empty selection are the arrays
+    # above; combinations and seeded shuffles (for paginated requests) are
+    # computed once and kept in a small LRU. Returned arrays are shared and
+    # must not be modified.
+
+    def __init__(self, genres, years, min_year=MIN_YEAR):
+        genre_lists = [g.split('|') for g in genres]
+
+        self.names = sorted({g for gl in genre_lists for g in gl})
+        if len(self.names) > MAX_GENRES:
+            raise ValueError(
+                f"The catalog has {len(self.names)} genres; genre masks hold at most {MAX_GENRES}"
+            )
+        self.bits = {g: np.uint64(1) << np.uint64(j) for j, g in enumerate(self.names)}
+
+        self.masks = np.zeros(len(genre_lists), dtype=np.uint64)
+        postings = {g: [] for g in self.names}
+        for i, gl in enumerate(genre_lists):
+            for g in gl:
+                self.masks[i] |= self.bits[g]
+                postings[g].append(i)
+
+        self.recent_flags = np.asarray(years) >= min_year
+        self.recent = np.flatnonzero(self.recent_flags)
+
+        self.postings = {g: np.array(p, dtype=np.int64) for g, p in postings.items()}
+        self.recent_postings = {g: p[self.recent_flags[p]] for g, p in self.postings.items()}
+
+        self.pool_cache_size = GENRE_POOL_CACHE_SIZE
+        self._pools = OrderedDict()     # (match_all, genres) or (..., seed) -> positions
+        self._lock = threading.Lock()
+
+    def mask(self, genres):
+        mask = np.uint64(0)
+        for g in genres:
+            mask |= self.bits.get(g, np.uint64(0))
+        return mask
+
+    # ---------------------------
+    # Whole-catalog flags (used for score boosts)
+    # ---------------------------
+
+    def hits(self, genres, positions=None):
+        # True for every movie (or every movie at `positions`) sharing at
+        # least one genre with `genres` (a preference list or a MOOD_MAP
+        # expansion)
+        masks = self.masks if positions is None else self.masks[positions]
+        return (masks & self.mask(genres)) != 0
+
+    # ---------------------------
+    # Position queries
+    # ---------------------------
+
+    def any_of(self, genres, recent=True):
+        # Sorted positions of movies tagged with at least one of `genres`
+        known = {g for g in genres if g in self.bits}
+        if not known:
+            return np.empty(0, dtype=np.int64)
+
+        # A single genre is its posting list; unions are a bitmask filter
+        if len(known) == 1:
+            postings = self.recent_postings if recent else self.postings
+            return postings[known.pop()]
+
+        positions = self.recent if recent else np.arange(len(self.masks))
+        return positions[(self.masks[positions] & self.mask(known)) != 0]
+
+    def all_of(self, genres, recent=True):
+        # Sorted positions of movies tagged with every one of `genres`
+        genres = set(genres)
+        if not genres or any(g not in self.bits for g in genres):
+            return np.empty(0, dtype=np.int64)
+
+        postings = self.recent_postings if recent else self.postings
+        # Start from the shortest list and filter it by bitmask
+        shortest = min((postings[g] for g in genres), key=len)
+        mask = self.mask(genres)
+        return shortest[(self.masks[shortest] & mask) == mask]
+
+    # ---------------------------
+    # Sampling pools (/api/movies-by-genre)
+    # ---------------------------
+
+    def pool(self, genres, match_all=False):
+        # Recent movies matching ANY (or ALL) of `genres`; every recent
+        # movie when the selection is empty or matches nothing
+        genres = frozenset(genres)
+        if not genres:
+            return self.recent
+        if len(genres) == 1:
+            # ANY and ALL agree on one genre
+            (genre,) = genres
+            pool = self.recent_postings.get(genre)
+            return pool if pool is not None and len(pool) else self.recent
+
+        key = (match_all, genres)
+        pool = self._cached(key)
+        if pool is None:
+            pool = self.all_of(genres) if match_all else self.any_of(genres)
+            pool = self._store(key, pool if len(pool) else self.recent)
+        return pool
+
+    def shuffled(self, genres, match_all, seed):
+        # pool() in a fixed order for `seed`, so that consecutive pages of a
+        # paginated request neither repeat nor skip movies
+        key = (match_all, frozenset(genres), seed)
+        order = self._cached(key)
+        if order is None:
+            pool = self.pool(genres, match_all)
+            order = self._store(key, pool[np.random.default_rng(seed).permutation(len(pool))])
+        return order
+
+    def _cached(self, key):
+        with self._lock:
+            value = self._pools.get(key)
+            if value is not None:
+                self._pools.move_to_end(key)
+            return value
+
+    def _store(self, key, value):
+        with self._lock:
+            self._pools[key] = value
+            while len(self._pools) > self.pool_cache_size:
+                self._pools.popitem(last=False)
+        return value
@@ -0,0 +1,72 @@
+import argparse
+import csv
+import math
+import time
+from contextlib import closing
+from itertools import islice
+
+from db import connect, upsert_ratings
+
+# -----------------------
+# Bulk ratings import
+# -----------------------
+#
+#   python import_ratings.py ml-latest-small/ratings.csv
+#
+# Loads a MovieLens-style CSV (userId,movieId,rating[,timestamp]) into the
+# `ratings` table through the same batched upsert /api/rate uses. The whole
+# file is one transaction: any bad row rolls the import back. user ids must
+# already exist in `users` (foreign key).
+#
+# The table stores whole stars from 1 to 5. MovieLens uses half stars
+# (0.5-5.0), which Postgres would otherwise round silently on insert, so
+# a non-integer rating fails the import unless --round is given: then
+# halves round up (0.5 -> 1, 3.5 -> 4).
+
+
+def read_rows(path, round_ratings=False):
+    with open(path, newline='') as f:
+        for line, row in enumerate(csv.DictReader(f), start=2):
+            rating = float(row['rating'])
+            if rating != int(rating):
+                if not round_ratings:
+                    raise ValueError(f"line {line}: rating {row['rating']} is not a whole star (use --round)")
+                rating = math.floor(rating + 0.5)
+            if not 1 <= rating <= 5:
+                raise ValueError(f"line {line}: rating {row['rating']} is outside 1-5")
+            yield int(row['userId']), int(row['movieId']), int(rating)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Import a ratings CSV into Postgres")
+    parser.add_argument("csv", help="CSV with userId, movieId and rating columns")
+    parser.add_argument("--batch-size", type=int, default=10000, help="rows per upsert batch")
+    parser.add_argument("--round", action="store_true", help="round half-star ratings up instead of failing")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    rows = read_rows(args.csv, args.round)
+    total = 0
+
+    with closing(connect()) as conn:
+        cur = conn.cursor()
+        try:
+            while True:
+                batch = list(islice(rows, args.batch_size))
+                if not batch:
+                    break
+                total += upsert_ratings(cur, batch, page_size=args.batch_size)
+                print(f"🔄 {total} ratings written...")
+
+            conn.commit()
+
+        except Exception as e:
+            conn.rollback()
+            print(f"❌ Import failed, nothing was written: {e}")
+            raise SystemExit(1)
+
+        finally:
+            cur.close()
+
+    print(f"✅ Imported {total} ratings in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,255 @@
+import argparse
+import threading
+import time
+
+import numpy as np
+
+from similarity import DenseSimilarity, PatchedSimilarity
+
+# -----------------------
+# Incremental collaborative updates
+# -----------------------
+#
+# Collaborative similarity is cosine(item_i, item_j) = G[i, j] / (n[i] * n[j])
+# where G = R^T R is the item co-rating dot product matrix and n[i] the norm
+# of item i's rating column. When a user's rating for item i changes by d,
+# only row/column i of G moves:
+#
+#   G[i, j] += d * r_u[j]        for every other item j the user rated
+#   n[i]^2  += 2 * d * r_u[i] + d^2
+#
+# G is never stored: row i is recovered as S[i] * n[i] * n, updated, and
+# divided back, so each rating costs O(N) instead of a full rebuild. The
+# updated rows go into a PatchedSimilarity over the loaded store (see
+# similarity.py): the mmap'd artifact stays shared between workers and
+# each update costs memory for the changed rows only.
+#
+# Ratings stored through /api/rate belong to app users, which are separate
+# from the users in model_small.pkl. Movies outside the collaborative index
+# (never rated when the model was built) are skipped until the next rebuild.
+# Only the dense collaborative store can be updated. Rows changed over a
+# quantized store are kept in float64.
+#
+# Changes are found by transaction id rather than by time: every insert or
+# update stamps the row with txid_current() (migrate.py, version 6), and
+# each sync remembers the oldest transaction still running when it started
+# (txid_snapshot_xmin). The next sync reads every row stamped at or after
+# it, so a long transaction (import_ratings.py commits a whole file at once)
+# is picked up whenever it commits. Rows read twice are no-ops.
+
+SNAPSHOT_XMIN_SQL = "SELECT txid_snapshot_xmin(txid_current_snapshot())"
+ALL_RATINGS_SQL = "SELECT user_id, movie_id, rating, change_txid FROM ratings"
+CHANGED_RATINGS_SQL = ALL_RATINGS_SQL + " WHERE change_txid >= %s"
+
+
+class IncrementalUpdater:
+
+    def __init__(self, engine, user_movie_matrix, on_update=None):
+        if not isinstance(engine.collab_sim, (DenseSimilarity, PatchedSimilarity)):
+            raise ValueError("Incremental updates need the dense collaborative store (SIMILARITY_TOP_K=0)")
+
+        self.engine = engine
+        self.on_update = on_update
+        self.norms = user_movie_matrix.column_norms()
+
+        self.user_rows = {}         # app user id -> {collab position: rating}
+        self.watermark = None       # txid_snapshot_xmin of the last sync
+        self.last_change = None     # change_txid of the newest row that changed the model
+        self.applied = 0
+        self.skipped = 0
+        self.last_sync = None
+
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    # ---------------------------
+    # Applying deltas
+    # ---------------------------
+
+    def apply(self, rows):
+        # rows: iterable of (user_id, movie_id, rating). Re-applying a rating
+        # that is already known is a no-op, so overlapping batches are safe.
+        with self._lock:
+            positions = self.engine.collab_position
+            store = self.engine.collab_sim
+            updated = {}            # collab position -> new row, this batch
+            norms = None
+            changed = 0
+
+            for user_id, movie_id, rating in rows:
+                pos = positions.get(int(movie_id))
+                if pos is None:
+                    self.skipped += 1
+                    continue
+
+                user = self.user_rows.setdefault(user_id, {})
+                old = user.get(pos, 0.0)
+                delta = float(rating) - old
+                if delta == 0:
+                    continue
+
+                if norms is None:
+                    # Copy-on-write: requests keep scoring against the current
+                    # store until the patched one is swapped in below.
+                    norms = self.norms.copy()
+
+                sim_row = updated.get(pos)
+                if sim_row is None:
+                    sim_row = store.row(pos)
+                    for other, other_row in updated.items():
+                        sim_row[other] = other_row[pos]
+
+                gram_row = sim_row * norms[pos] * norms
+                rated = np.fromiter(user.keys(), dtype=np.int64, count=len(user))
+                values = np.fromiter(user.values(), dtype=np.float64, count=len(user))
+                gram_row[rated] += delta * values
+
+                norms[pos] = np.sqrt(norms[pos] ** 2 + 2 * delta * old + delta ** 2)
+
+                row = gram_row / (norms[pos] * norms)
+                row[pos] = 1.0
+                updated[pos] = row
+                for other, other_row in updated.items():
+                    other_row[pos] = row[other]
+
+                user[pos] = float(rating)
+                changed += 1
+
+            if changed:
+                self.engine.collab_sim = store.patched(list(updated), list(updated.values()))
+                self.norms = norms
+                self.applied += changed
+
+        if changed and self.on_update:
+            self.on_update()
+        return changed
+
+    # ---------------------------
+    # Syncing from Postgres
+    # ---------------------------
+
+    def sync(self):
+        # Pulls ratings changed by transactions at or after the watermark.
+        # The snapshot is read first: anything older than its xmin has
+        # committed (or aborted) by then, so the query below sees it.
+        from db import pool
+
+        with pool.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(SNAPSHOT_XMIN_SQL)
+            (watermark,) = cur.fetchone()
+            if self.watermark is None:
+                cur.execute(ALL_RATINGS_SQL)
+            else:
+                cur.execute(CHANGED_RATINGS_SQL, (self.watermark,))
+            rows = cur.fetchall()
+            cur.close()
+
+        changed = self.apply((user_id, movie_id, rating) for user_id, movie_id, rating, _ in rows)
+        if changed:
+            self.last_change = max(change for _, _, _, change in rows)
+        self.watermark = watermark
+        self.last_sync = time.time()
+        return changed
+
+    def start(self, interval):
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    changed = self.sync()
+                    if changed:
+                        print(f"🔄 Collaborative model updated with {changed} new ratings")
+                except Exception as e:
+                    print("⚠️ Incremental sync failed:", e)
+                self._stop.wait(interval)
+
+        self._thread = threading.Thread(target=loop, name="incremental-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        return {
+            "applied": self.applied,
+            "skipped": self.skipped,
+            "app_users": len(self.user_rows),
+            "watermark": self.watermark,
+            "last_change": self.last_change,
+            "last_sync": self.last_sync,
+        }
+
+# -----------------------
+# Verification against a full rebuild
+# -----------------------
+#
+#   python incremental.py verify
+#
+# Feeds synthetic app-user ratings (including re-ratings) through the
+# updater in several batches, then checks the result against cosine
+# similarity recomputed from scratch over the combined ratings.
+
+
+def verify(users, per_user, batches, seed):
+    import pandas as pd
+    from sklearn.metrics.pairwise import cosine_similarity
+    from model import load_model
+
+    model = load_model(top_k=0)
+    engine = model['engine']
+    user_movie_matrix = model['user_movie_matrix']
+    updater = IncrementalUpdater(engine, user_movie_matrix)
+
+    rng = np.random.default_rng(seed)
+    collab_ids = user_movie_matrix.movie_ids
+
+    rows = []
+    for user_id in range(1, users + 1):
+        for movie_id in rng.choice(collab_ids, per_user, replace=False):
+            rows.append((user_id, int(movie_id), int(rng.integers(1, 6))))
+    # Re-ratings of already rated movies
+    for i in rng.choice(len(rows), len(rows) // 5, replace=False):
+        user_id, movie_id, _ = rows[i]
+        rows.append((user_id, movie_id, int(rng.integers(1, 6))))
+
+    start = time.perf_counter()
+    for batch in np.array_split(np.arange(len(rows)), batches):
+        updater.apply([rows[i] for i in batch])
+    elapsed = time.perf_counter() - start
+
+    # Full rebuild: pickle users plus the app users (negative ids so the two
+    # populations never collide), latest rating per (user, movie)
+    latest = {}
+    for user_id, movie_id, rating in rows:
+        latest[(-user_id, movie_id)] = rating
+    app_ratings = pd.DataFrame(
+        [(u, m, r) for (u, m), r in latest.items()], columns=['userId', 'movieId', 'rating']
+    )
+    combined = pd.concat([model['ratings'], app_ratings], ignore_index=True)
+    matrix = combined.pivot_table(index='userId', columns='movieId', values='rating').fillna(0)
+    matrix = matrix.reindex(columns=collab_ids, fill_value=0)
+
+    start = time.perf_counter()
+    expected = cosine_similarity(matrix.T)
+    rebuild = time.perf_counter() - start
+
+    error = np.abs(engine.collab_sim.to_dense() - expected).max()
+    print(f"\n🔍 {len(rows)} ratings in {batches} batches: incremental {elapsed:.2f}s, "
+          f"full similarity rebuild {rebuild:.2f}s, max abs difference {error:.2e}")
+    if error > 1e-9:
+        raise SystemExit("❌ Incremental update does not match the full rebuild")
+    print("✅ Incremental update matches the full rebuild")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Incremental collaborative model updates")
+    parser.add_argument("command", choices=["verify"])
+    parser.add_argument("--users", type=int, default=20, help="synthetic app users")
+    parser.add_argument("--per-user", type=int, default=15, help="ratings per synthetic user")
+    parser.add_argument("--batches", type=int, default=3, help="delta batches to apply")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    verify(args.users, args.per_user, args.batches, args.seed)
@@ -0,0 +1,208 @@
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# -----------------------
+# Local load test
+# -----------------------
+#
+#   python load_test.py --workers 1 2 4 --concurrency 32 --duration 15
+#
+# Starts serve.py once per worker count, drives it with `--concurrency`
+# keep-alive clients for `--duration` seconds and reports throughput and
+# latency, so throughput scaling with cores is visible side by side. The
+# result cache is disabled in the spawned servers (unless --cache) so every
+# request is scored. Needs the same Postgres as the app: recommendations
+# are requested for app users --user-ids (e.g. 1-100).
+#
+#   python load_test.py --url http://localhost:5000
+#
+# only drives an already running server.
+
+PAYLOADS = {
+    "recommend": lambda rng, users: ("POST", "/api/recommend", {
+        "user_id": rng.choice(users), "num_recommendations": 10, "method": "hybrid"
+    }),
+    "movies-by-genre": lambda rng, users: ("POST", "/api/movies-by-genre", {
+        "genres": rng.sample(["Action", "Comedy", "Drama", "Romance", "Thriller", "Sci-Fi"], 2), "n": 10
+    }),
+    "health": lambda rng, users: ("GET", "/api/health", None),
+}
+
+
+def parse_users(spec):
+    first, _, last = spec.partition("-")
+    return list(range(int(first), int(last or first) + 1))
+
+
+def client_process(host, port, endpoint, users, threads, duration, seed):
+    # One client process running `threads` keep-alive connections;
+    # returns (latencies in seconds, errors)
+    deadline = time.perf_counter() + duration
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def client(index):
+        rng = random.Random(seed * 1000 + index)
+        conn = http.client.HTTPConnection(host, port, timeout=30)
+        mine, failed = [], 0
+        while time.perf_counter() < deadline:
+            method, path, body = PAYLOADS[endpoint](rng, users)
+            start = time.perf_counter()
+            try:
+                if body is None:
+                    conn.request(method, path)
+                else:
+                    conn.request(method, path, json.dumps(body), {"Content-Type": "application/json"})
+                response = conn.getresponse()
+                response.read()
+                if response.status != 200:
+                    failed += 1
+                    continue
+                mine.append(time.perf_counter() - start)
+            except (OSError, http.client.HTTPException):
+                failed += 1
+                conn.close()
+                conn = http.client.HTTPConnection(host, port, timeout=30)
+        conn.close()
+        with lock:
+            latencies.extend(mine)
+            errors.append(failed)
+
+    pool = [threading.Thread(target=client, args=(i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return latencies, sum(errors)
+
+
+def drive(host, port, args, users):
+    # Splits the clients over processes so the load generator is not
+    # limited by one interpreter's GIL
+    processes = max(1, min(args.client_processes, args.concurrency))
+    shares = [len(s) for s in np.array_split(np.arange(args.concurrency), processes)]
+
+    with ProcessPoolExecutor(processes) as executor:
+        futures = [
+            executor.submit(client_process, host, port, args.endpoint, users, threads, args.duration, seed)
+            for seed, threads in enumerate(shares)
+        ]
+        results = [f.result() for f in futures]
+
+    latencies = np.concatenate([np.array(r[0]) for r in results]) * 1000
+    errors = sum(r[1] for r in results)
+    if len(latencies) == 0:
+        return {"requests": 0, "errors": errors, "rps": 0.0}
+    return {
+        "requests": int(len(latencies)),
+        "errors": int(errors),
+        "rps": len(latencies) / args.duration,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+    }
+
+
+def wait_until_up(host, port, server, timeout=300):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise SystemExit("❌ Server exited during startup")
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=2)
+            conn.request("GET", "/api/health")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise SystemExit("❌ Server did not come up")
+
+
+def run_server(workers, args, users):
+    env = dict(
+        os.environ,
+        SERVER_HOST="127.0.0.1",
+        SERVER_PORT=str(args.port),
+        SERVER_WORKERS=str(workers),
+        SERVER_THREADS=str(args.threads),
+    )
+    if not args.cache:
+        env["RESULT_CACHE_SIZE"] = "0"
+
+    server = subprocess.Popen(
+        args.server, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    try:
+        wait_until_up("127.0.0.1", args.port, server)
+        return drive("127.0.0.1", args.port, args, users)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def report(label, result, baseline=None):
+    line = f"  {label:<12} {result['rps']:8.1f} req/s"
+    if baseline:
+        line += f" ({result['rps'] / baseline:4.2f}x)"
+    if result["requests"]:
+        line += (f" | p50 {result['p50_ms']:7.2f} ms | p95 {result['p95_ms']:7.2f} ms | "
+                 f"p99 {result['p99_ms']:7.2f} ms")
+    line += f" | errors {result['errors']}"
+    print(line)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Load test the recommendation API")
+    parser.add_argument("--endpoint", choices=sorted(PAYLOADS), default="recommend")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1],
+                        help="worker counts to start serve.py with")
+    parser.add_argument("--threads", type=int, default=8, help="SERVER_THREADS for the spawned servers")
+    parser.add_argument("--concurrency", type=int, default=32, help="concurrent keep-alive clients")
+    parser.add_argument("--client-processes", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="processes the clients are spread over")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per measurement")
+    parser.add_argument("--user-ids", default="1-100", help="app user ids to request, e.g. 1-100")
+    parser.add_argument("--port", type=int, default=5055, help="port for the spawned servers")
+    parser.add_argument("--cache", action="store_true", help="keep the result cache enabled")
+    parser.add_argument("--server", nargs="+", default=[sys.executable, "serve.py"],
+                        help="command that starts the server")
+    parser.add_argument("--url", default=None, help="drive a running server instead of spawning one")
+    parser.add_argument("--out", default=None, help="also write the results as JSON")
+    args = parser.parse_args()
+
+    users = parse_users(args.user_ids)
+    print(f"\n🔥 {args.endpoint}: {args.concurrency} clients x {args.duration:.0f}s "
+          f"({os.cpu_count()} cores)")
+
+    results = {}
+    if args.url:
+        target = args.url.split("://")[-1].rstrip("/")
+        host, _, port = target.partition(":")
+        results["external"] = drive(host, int(port or 80), args, users)
+        report(target, results["external"])
+    else:
+        baseline = None
+        for workers in args.workers:
+            result = run_server(workers, args, users)
+            results[f"workers={workers}"] = result
+            report(f"{workers} workers", result, baseline)
+            baseline = baseline or result["rps"] or None
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"endpoint": args.endpoint, "concurrency": args.concurrency,
+                       "duration": args.duration, "results": results}, f, indent=2)
+        print(f"📝 Results written to {args.out}")
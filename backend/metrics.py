@@ -0,0 +1,228 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+from config import SPAN_LOG_THRESHOLD_MS
+
+# -----------------------
+# Metrics
+# -----------------------
+#
+# A minimal Prometheus client: counters and histograms kept in process and
+# rendered in the text exposition format by /api/metrics. Under serve.py
+# every worker has its own registry, so each scrape reports the worker
+# that answered it.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}      # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, "") for n in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    labels = _format_labels(self.labels, key, [("le", repr(float(bound)))])
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, [('le', '+Inf')])} {series[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {series[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {series[-1]}")
+        return lines
+
+
+class Registry:
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []    # callables returning [(name, type, help, value)] at scrape time
+
+    def counter(self, name, help, labels=()):
+        metric = Counter(name, help, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def collect(self, fn):
+        # For values that already live elsewhere (pool and cache stats)
+        self.collectors.append(fn)
+        return fn
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for fn in self.collectors:
+            for name, kind, help, value in fn():
+                if value is None:
+                    continue
+                lines.extend([f"# HELP {name} {help}", f"# TYPE {name} {kind}", f"{name} {value}"])
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUEST_SECONDS = registry.histogram(
+    "http_request_duration_seconds", "Time spent handling HTTP requests", ["endpoint", "method", "status"]
+)
+STAGE_SECONDS = registry.histogram(
+    "stage_duration_seconds", "Time spent in each timed stage of a request", ["stage"]
+)
+DB_QUERY_SECONDS = registry.histogram(
+    "db_query_duration_seconds", "Time spent executing Postgres statements", ["statement"]
+)
+DB_QUERIES = registry.counter("db_queries_total", "Postgres statements executed", ["statement"])
+DB_ERRORS = registry.counter("db_query_errors_total", "Postgres statements that raised", ["statement"])
+
+# -----------------------
+# Timing spans
+# -----------------------
+#
+#   with span("score"):
+#       ...
+#
+# Every span is observed in stage_duration_seconds. While a request is being
+# handled its spans are also collected on the request's trace, which
+# becomes the Server-Timing header and, for slow requests, a JSON log line.
+
+_local = threading.local()
+
+
+class Trace:
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans = {}     # name -> [total seconds, count]
+
+    def add(self, name, seconds):
+        entry = self.spans.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def server_timing(self):
+        return ", ".join(f"{name};dur={total * 1000:.2f}" for name, (total, _) in self.spans.items())
+
+
+def current_trace():
+    return getattr(_local, "trace", None)
+
+
+@contextmanager
+def span(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        trace = current_trace()
+        if trace is not None:
+            trace.add(name, elapsed)
+
+
+def record_query(statement, seconds, failed=False):
+    # Called by db.TimedCursor for every statement, keyed by its verb
+    DB_QUERY_SECONDS.observe(seconds, statement=statement)
+    DB_QUERIES.inc(statement=statement)
+    if failed:
+        DB_ERRORS.inc(statement=statement)
+    trace = current_trace()
+    if trace is not None:
+        trace.add("db.query", seconds)
+
+# -----------------------
+# Flask integration
+# -----------------------
+
+def init_app(app):
+    from flask import request
+
+    @app.before_request
+    def start_trace():
+        _local.trace = Trace()
+
+    @app.after_request
+    def finish_trace(response):
+        trace = current_trace()
+        _local.trace = None
+        if trace is None:
+            return response
+
+        elapsed = trace.elapsed()
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        REQUEST_SECONDS.observe(elapsed, endpoint=endpoint, method=request.method, status=response.status_code)
+
+        if trace.spans:
+            response.headers["Server-Timing"] = trace.server_timing()
+
+        if 0 <= SPAN_LOG_THRESHOLD_MS <= elapsed * 1000:
+            print(json.dumps({
+                "event": "request",
+                "endpoint": endpoint,
+                "method": request.method,
+                "status": response.status_code,
+                "ms": round(elapsed * 1000, 3),
+                "spans": {
+                    name: {"ms": round(total * 1000, 3), "count": count}
+                    for name, (total, count) in trace.spans.items()
+                },
+            }))
+        return response
@@ -0,0 +1,126 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import scipy.sparse as sp
+
+from config import MF_FACTORS, MF_ITERATIONS, MF_REGULARIZATION, MF_WORKERS
+
+# -----------------------
+# Matrix factorization
+# -----------------------
+#
+# Backs method="mf": a low-rank alternative to the item-item similarity
+# stores. Ratings are modelled as
+#
+#   r(u, i) ~ mean(u) + p_u . q_i
+#
+# with d-dimensional user and item factors, trained offline by alternating
+# least squares (ALS) with weighted-lambda regularisation: each half step
+# solves one d x d ridge regression per user (or item), penalised by
+# MF_REGULARIZATION times its number of ratings. The solves are independent
+# and run on a thread pool (NumPy releases the GIL inside them).
+#
+# Only the item factors are kept. At request time the user's ratings are
+# folded in with the same user step as in training (one d x d solve), and
+# every movie is scored with one matrix-vector product, so the model needs
+# O(N * d) memory instead of the O(N^2) similarity matrix. Item rows follow
+# user_movie_matrix.movie_ids, like the collaborative similarity store.
+#
+# Factors reflect the ratings the model was built from; unlike the
+# collaborative store they are not touched by incremental updates. They are
+# trained by build_model.py only (a few seconds per sweep on model_small),
+# never while the server starts.
+#
+# Predictions are clipped to the range of the training ratings, so mf
+# scores stay on the same scale as the collaborative weighted averages
+# before the shared genre, mood and recency adjustments.
+
+# Used for artifacts that predate stored rating ranges (MovieLens stars)
+RATING_RANGE = (0.5, 5.0)
+
+
+class MatrixFactors:
+
+    def __init__(self, item_factors, regularization=MF_REGULARIZATION, rating_range=RATING_RANGE):
+        self.item_factors = item_factors       # movies x d, float32
+        self.regularization = regularization
+        self.rating_range = rating_range       # (lowest, highest) training rating
+        self.shape = item_factors.shape
+
+    @property
+    def nbytes(self):
+        return self.item_factors.nbytes
+
+    def fold_in(self, rows, ratings):
+        # (user factors, mean rating) for ratings of the item rows `rows`
+        ratings = np.asarray(ratings, dtype=np.float64)
+        mean = ratings.mean()
+        factors = np.asarray(self.item_factors[rows], dtype=np.float64)
+        return _ridge(factors, ratings - mean, self.regularization), mean
+
+    def predict(self, user_factors, mean, columns=None):
+        # Predicted ratings of every item row (or only `columns`), within
+        # the training rating range
+        items = self.item_factors if columns is None else self.item_factors[columns]
+        return np.clip(mean + items @ user_factors.astype(items.dtype), *self.rating_range)
+
+# -----------------------
+# Training
+# -----------------------
+
+def _ridge(factors, targets, regularization):
+    d = factors.shape[1]
+    a = factors.T @ factors
+    a[np.diag_indices(d)] += regularization * len(targets)
+    return np.linalg.solve(a, factors.T @ targets)
+
+
+def _solve_rows(matrix, fixed, regularization, workers):
+    # One ALS half step: a ridge solve per row of the CSR `matrix`
+    # (centered ratings) against the `fixed` factors of its columns
+    solved = np.zeros((matrix.shape[0], fixed.shape[1]))
+
+    def solve(start, end):
+        for row in range(start, end):
+            lo, hi = matrix.indptr[row], matrix.indptr[row + 1]
+            if hi > lo:
+                solved[row] = _ridge(fixed[matrix.indices[lo:hi]], matrix.data[lo:hi], regularization)
+
+    step = max(1, -(-matrix.shape[0] // (workers * 4)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(lambda start: solve(start, min(start + step, matrix.shape[0])),
+                      range(0, matrix.shape[0], step)))
+    return solved
+
+
+def train_als(user_movie_matrix, factors=MF_FACTORS, iterations=MF_ITERATIONS,
+              regularization=MF_REGULARIZATION, workers=MF_WORKERS, seed=0):
+    # Returns MatrixFactors for user_movie_matrix.movie_ids
+    matrix = user_movie_matrix.matrix.astype(np.float64)
+    counts = np.diff(matrix.indptr)
+    means = np.asarray(matrix.sum(axis=1)).ravel() / np.maximum(counts, 1)
+
+    # Ratings centered on each user's mean, by user and by item
+    by_user = sp.csr_matrix(
+        (matrix.data - np.repeat(means, counts), matrix.indices, matrix.indptr), shape=matrix.shape
+    )
+    by_item = by_user.T.tocsr()
+
+    rng = np.random.default_rng(seed)
+    items = rng.normal(scale=0.1, size=(matrix.shape[1], factors))
+    workers = max(1, workers)
+
+    for iteration in range(iterations):
+        start = time.perf_counter()
+        users = _solve_rows(by_user, items, regularization, workers)
+        items = _solve_rows(by_item, users, regularization, workers)
+
+        residual = by_user.data - np.einsum(
+            'ij,ij->i', users[np.repeat(np.arange(matrix.shape[0]), counts)], items[by_user.indices]
+        )
+        print(f"🔄 ALS iteration {iteration + 1}/{iterations}: train RMSE "
+              f"{np.sqrt(np.mean(residual ** 2)):.4f} ({time.perf_counter() - start:.1f}s)")
+
+    rating_range = (float(matrix.data.min()), float(matrix.data.max()))
+    return MatrixFactors(items.astype(np.float32), regularization, rating_range)
@@ -0,0 +1,467 @@
+import argparse
+import json
+import time
+from contextlib import closing
+
+from batch import FETCH_USERS_SQL
+from config import DB_RATINGS_PARTITIONS
+from db import connect
+from incremental import CHANGED_RATINGS_SQL, SNAPSHOT_XMIN_SQL
+
+# -----------------------
+# Schema migrations
+# -----------------------
+#
+#   python migrate.py                       # apply pending migrations
+#   python migrate.py --partitions 8        # ... and hash-partition ratings
+#   python migrate.py status                # applied and pending versions
+#   python migrate.py verify                # EXPLAIN the hot queries
+#
+# Replaces create_table.py. Each migration runs once, in version order, and
+# is recorded in `schema_migrations`; databases set up by create_table.py
+# are adopted as version 1 (every statement there is IF NOT EXISTS).
+#
+# The indexes follow the request path:
+#
+#   ratings   (user_id, movie_id) INCLUDE (rating), unique: the per-user
+#             rating fetch (recommend(), batch.fetch_users) becomes an
+#             index-only scan, and it replaces the UNIQUE (user_id, movie_id)
+#             constraint as the ON CONFLICT arbiter of db.upsert_ratings
+#             instead of being maintained next to it
+#   ratings   (created_at): what incremental.py used to sync by; kept for
+#             ad hoc queries
+#   ratings   (change_txid): incremental.py pulls ratings changed by
+#             transactions at or after its watermark
+#   users     (email) INCLUDE (id, username, password), unique: /api/login
+#             without a heap fetch; replaces the UNIQUE (email) constraint
+#
+# Index-only scans need the table's visibility map to be current, which
+# autovacuum normally keeps up with (`verify --vacuum` refreshes it now).
+#
+# Indexes on existing tables are built CONCURRENTLY, outside a transaction,
+# so the app keeps serving; an interrupted build leaves an invalid index
+# that the next run drops and rebuilds.
+#
+# Partitioning (version 5) is optional: with --partitions N (or
+# DB_RATINGS_PARTITIONS) `ratings` is rebuilt as N hash partitions on
+# user_id, so a user's ratings are read from one small partition and vacuum
+# works partition by partition. The rebuild copies the table under an
+# exclusive lock, so run it in a maintenance window. Needs Postgres 11+.
+#
+# Change tracking (version 6) stamps every rating with the id of the
+# transaction that last wrote it: inserts through the column default,
+# updates through a row trigger (per partition, which Postgres 11 and 12
+# need), so db.upsert_ratings and manual SQL are tracked alike.
+
+# Any constant shared by concurrent migrators
+LOCK_KEY = 4815162342
+
+SCHEMA_MIGRATIONS_SQL = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        name VARCHAR(100) NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+
+class Migration:
+
+    def __init__(self, version, name, apply, transactional=True, optional=False):
+        self.version = version
+        self.name = name
+        self.apply = apply                  # apply(cur, args)
+        self.transactional = transactional  # False for CREATE INDEX CONCURRENTLY
+        self.optional = optional            # only applied when asked for
+
+# -----------------------
+# Migrations
+# -----------------------
+
+INITIAL_SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS users (
+        id SERIAL PRIMARY KEY,
+        username VARCHAR(100) NOT NULL,
+        email VARCHAR(255) NOT NULL UNIQUE,
+        password VARCHAR(255) NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    CREATE TABLE IF NOT EXISTS ratings (
+        id SERIAL PRIMARY KEY,
+        user_id INTEGER NOT NULL REFERENCES users(id),
+        movie_id INTEGER NOT NULL,
+        rating INTEGER NOT NULL CHECK (rating >= 1 AND rating <= 5),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(user_id, movie_id)
+    );
+
+    CREATE TABLE IF NOT EXISTS preferences (
+        id SERIAL PRIMARY KEY,
+        user_id INTEGER NOT NULL REFERENCES users(id) UNIQUE,
+        genres JSONB,
+        mood VARCHAR(50),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    -- Precomputed by batch.py
+    CREATE TABLE IF NOT EXISTS recommendations (
+        user_id INTEGER NOT NULL REFERENCES users(id),
+        method VARCHAR(20) NOT NULL,
+        size INTEGER NOT NULL,
+        items JSONB NOT NULL,
+        model_version VARCHAR(64),
+        computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (user_id, method)
+    );
+"""
+
+
+def initial_schema(cur, args):
+    cur.execute(INITIAL_SCHEMA_SQL)
+
+
+def ratings_user_index(cur, args):
+    _create_index_concurrently(
+        cur, "ratings_user_movie_idx",
+        "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ratings_user_movie_idx "
+        "ON ratings (user_id, movie_id) INCLUDE (rating)"
+    )
+    cur.execute("ALTER TABLE ratings DROP CONSTRAINT IF EXISTS ratings_user_id_movie_id_key")
+
+
+def users_email_index(cur, args):
+    _create_index_concurrently(
+        cur, "users_email_idx",
+        "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS users_email_idx "
+        "ON users (email) INCLUDE (id, username, password)"
+    )
+    cur.execute("ALTER TABLE users DROP CONSTRAINT IF EXISTS users_email_key")
+
+
+def ratings_created_at_index(cur, args):
+    _create_index_concurrently(
+        cur, "ratings_created_at_idx",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ratings_created_at_idx ON ratings (created_at)"
+    )
+
+
+RATINGS_CHANGE_TRACKING_SQL = """
+    ALTER TABLE ratings ADD COLUMN IF NOT EXISTS change_txid BIGINT NOT NULL DEFAULT txid_current();
+
+    CREATE OR REPLACE FUNCTION ratings_stamp_change() RETURNS trigger AS $$
+    BEGIN
+        NEW.change_txid := txid_current();
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql;
+"""
+
+
+def ratings_change_tracking(cur, args):
+    cur.execute(RATINGS_CHANGE_TRACKING_SQL)
+    _create_change_triggers(cur)
+
+
+def ratings_change_txid_index(cur, args):
+    if _partitioned(cur):
+        # CONCURRENTLY is not supported on partitioned tables
+        cur.execute("CREATE INDEX IF NOT EXISTS ratings_change_txid_idx ON ratings (change_txid)")
+        return
+    _create_index_concurrently(
+        cur, "ratings_change_txid_idx",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ratings_change_txid_idx ON ratings (change_txid)"
+    )
+
+
+def _create_change_triggers(cur):
+    # On every partition, or on the table itself when it has none
+    cur.execute("""
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'ratings'::regclass
+    """)
+    tables = [row[0] for row in cur.fetchall()] or ["ratings"]
+    for table in tables:
+        cur.execute(f"DROP TRIGGER IF EXISTS ratings_stamp_change ON {table}")
+        cur.execute(
+            f"CREATE TRIGGER ratings_stamp_change BEFORE UPDATE ON {table} "
+            "FOR EACH ROW EXECUTE PROCEDURE ratings_stamp_change()"
+        )
+
+
+def _partitioned(cur):
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = 'ratings'::regclass")
+    return cur.fetchone()[0] == 'p'
+
+
+def partition_ratings(cur, args):
+    partitions = args.partitions
+    if _partitioned(cur):
+        print("⚠️ ratings is already partitioned, leaving it as it is")
+        return
+    # Partitioning can come after change tracking (version 6) was applied
+    cur.execute(
+        "SELECT 1 FROM information_schema.columns WHERE table_name = 'ratings' AND column_name = 'change_txid'"
+    )
+    tracked = cur.fetchone() is not None
+
+    # Writers wait until the swap commits
+    cur.execute("LOCK TABLE ratings IN ACCESS EXCLUSIVE MODE")
+    cur.execute("""
+        CREATE TABLE ratings_partitioned (
+            id INTEGER NOT NULL DEFAULT nextval('ratings_id_seq'),
+            user_id INTEGER NOT NULL REFERENCES users(id),
+            movie_id INTEGER NOT NULL,
+            rating INTEGER NOT NULL CHECK (rating >= 1 AND rating <= 5),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            change_txid BIGINT NOT NULL DEFAULT txid_current()
+        ) PARTITION BY HASH (user_id)
+    """)
+    for remainder in range(partitions):
+        cur.execute(
+            f"CREATE TABLE ratings_p{remainder} PARTITION OF ratings_partitioned "
+            f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})"
+        )
+
+    columns = "id, user_id, movie_id, rating, created_at" + (", change_txid" if tracked else "")
+    cur.execute(f"INSERT INTO ratings_partitioned ({columns}) SELECT {columns} FROM ratings")
+    print(f"🔄 Copied {cur.rowcount} ratings into {partitions} partitions")
+
+    # The id sequence moves over before the old table (its owner) is dropped
+    cur.execute("ALTER SEQUENCE ratings_id_seq OWNED BY ratings_partitioned.id")
+    cur.execute("DROP TABLE ratings")
+    cur.execute("ALTER TABLE ratings_partitioned RENAME TO ratings")
+
+    # Unique keys on a partitioned table must contain user_id
+    cur.execute("ALTER TABLE ratings ADD PRIMARY KEY (user_id, id)")
+    cur.execute("CREATE UNIQUE INDEX ratings_user_movie_idx ON ratings (user_id, movie_id) INCLUDE (rating)")
+    cur.execute("CREATE INDEX ratings_created_at_idx ON ratings (created_at)")
+    if tracked:
+        cur.execute("CREATE INDEX ratings_change_txid_idx ON ratings (change_txid)")
+        _create_change_triggers(cur)
+    cur.execute("ANALYZE ratings")
+
+
+MIGRATIONS = [
+    Migration(1, "initial_schema", initial_schema),
+    Migration(2, "ratings_user_covering_index", ratings_user_index, transactional=False),
+    Migration(3, "users_email_covering_index", users_email_index, transactional=False),
+    Migration(4, "ratings_created_at_index", ratings_created_at_index, transactional=False),
+    Migration(5, "partition_ratings_by_user", partition_ratings, optional=True),
+    Migration(6, "ratings_change_tracking", ratings_change_tracking),
+    Migration(7, "ratings_change_txid_index", ratings_change_txid_index, transactional=False),
+]
+
+
+def _create_index_concurrently(cur, name, sql):
+    # A failed concurrent build leaves an INVALID index behind, which
+    # IF NOT EXISTS would otherwise keep forever
+    cur.execute(
+        "SELECT NOT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = %s",
+        (name,)
+    )
+    row = cur.fetchone()
+    if row and row[0]:
+        print(f"⚠️ Dropping invalid index {name} left by an interrupted build")
+        cur.execute(f"DROP INDEX CONCURRENTLY {name}")
+    cur.execute(sql)
+
+# -----------------------
+# Runner
+# -----------------------
+
+def applied_versions(cur):
+    cur.execute(SCHEMA_MIGRATIONS_SQL)
+    cur.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cur.fetchall()}
+
+
+def pending(applied, args):
+    return [
+        m for m in MIGRATIONS
+        if m.version not in applied and (not m.optional or args.partitions > 0)
+    ]
+
+
+def upgrade(args):
+    with closing(connect()) as conn:
+        # Transactions are opened per migration: CREATE INDEX CONCURRENTLY
+        # cannot run inside one
+        conn.autocommit = True
+        cur = conn.cursor()
+        cur.execute("SELECT pg_advisory_lock(%s)", (LOCK_KEY,))
+        try:
+            todo = pending(applied_versions(cur), args)
+            if not todo:
+                print("✅ Schema is up to date")
+                return
+
+            for migration in todo:
+                start = time.perf_counter()
+                print(f"🔄 {migration.version:03d} {migration.name}...")
+                if migration.transactional:
+                    cur.execute("BEGIN")
+                try:
+                    migration.apply(cur, args)
+                    cur.execute(
+                        "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                        (migration.version, migration.name)
+                    )
+                    if migration.transactional:
+                        cur.execute("COMMIT")
+                except Exception as e:
+                    if migration.transactional:
+                        cur.execute("ROLLBACK")
+                    print(f"❌ Migration {migration.version:03d} failed: {e}")
+                    raise SystemExit(1)
+                print(f"✅ {migration.version:03d} {migration.name} ({time.perf_counter() - start:.1f}s)")
+
+        finally:
+            cur.execute("SELECT pg_advisory_unlock(%s)", (LOCK_KEY,))
+            cur.close()
+
+
+def status(args):
+    with closing(connect()) as conn:
+        cur = conn.cursor()
+        applied_versions(cur)
+        cur.execute("SELECT version, applied_at FROM schema_migrations")
+        applied = dict(cur.fetchall())
+        conn.commit()
+        cur.close()
+
+    for m in MIGRATIONS:
+        if m.version in applied:
+            state = f"applied {applied[m.version]:%Y-%m-%d %H:%M}"
+        else:
+            state = "optional (--partitions)" if m.optional else "pending"
+        print(f"  {m.version:03d} {m.name:<32} {state}")
+
+# -----------------------
+# EXPLAIN verification
+# -----------------------
+#
+# Each hot query is EXPLAINed with sample parameters from the database and
+# must be answered through its index: (name, query, parameters, expected
+# index, required scan type, reads one user's partition only).
+
+def explain_checks(cur):
+    cur.execute("SELECT user_id FROM ratings ORDER BY created_at DESC LIMIT 1")
+    row = cur.fetchone()
+    user_id = row[0] if row else 1
+    cur.execute("SELECT email, password FROM users ORDER BY id LIMIT 1")
+    email, password = cur.fetchone() or ("nobody@example.com", "")
+    cur.execute(SNAPSHOT_XMIN_SQL)
+    (watermark,) = cur.fetchone()
+
+    return [
+        ("per-user ratings", "SELECT movie_id, rating FROM ratings WHERE user_id = %s",
+         (user_id,), "ratings_user_movie_idx", "Index Only Scan", True),
+        ("profile load (batch.fetch_users)", FETCH_USERS_SQL,
+         ([user_id], [user_id]), "ratings_user_movie_idx", "Index Only Scan", True),
+        ("login", "SELECT id, username FROM users WHERE email=%s AND password=%s",
+         (email, password), "users_email_idx", "Index Only Scan", False),
+        ("incremental sync", CHANGED_RATINGS_SQL,
+         (watermark,), "ratings_change_txid_idx", None, False),
+    ]
+
+
+def _scans(plan):
+    # Every scan node of a JSON plan, depth first
+    if "Relation Name" in plan:
+        yield plan
+    for child in plan.get("Plans", []):
+        yield from _scans(child)
+
+
+def _index_name(scan):
+    # Bitmap heap scans name their index on the Bitmap Index Scan below
+    if "Index Name" in scan:
+        return scan["Index Name"]
+    for child in scan.get("Plans", []):
+        if "Index Name" in child:
+            return child["Index Name"]
+    return None
+
+
+def _parents(cur, names):
+    # Partition relations (tables and their indexes) -> partitioned parent
+    cur.execute("""
+        SELECT c.relname, p.relname FROM pg_class c
+        JOIN pg_inherits i ON i.inhrelid = c.oid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE c.relname = ANY(%s)
+    """, (list(names),))
+    return dict(cur.fetchall())
+
+
+def verify(args):
+    failures = 0
+    with closing(connect()) as conn:
+        conn.autocommit = True
+        cur = conn.cursor()
+        if args.vacuum:
+            cur.execute("VACUUM ANALYZE users")
+            cur.execute("VACUUM ANALYZE ratings")
+        # Small development databases are cheaper to scan sequentially; this
+        # only checks that the indexes can serve the queries
+        if args.force_index:
+            cur.execute("SET enable_seqscan = off")
+
+        for name, query, params, index, scan_type, one_partition in explain_checks(cur):
+            cur.execute("EXPLAIN (FORMAT JSON) " + query, params)
+            plan = cur.fetchone()[0]
+            plan = (json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]
+
+            table = index.split("_")[0]
+            scans = [s for s in _scans(plan) if s["Relation Name"].startswith(table)]
+            parents = _parents(cur, {s["Relation Name"] for s in scans} | {_index_name(s) or "" for s in scans})
+
+            problems = []
+            for s in scans:
+                used = _index_name(s)
+                if parents.get(used, used) != index:
+                    problems.append(f"{s['Node Type']} on {s['Relation Name']}")
+                elif scan_type and s["Node Type"] != scan_type:
+                    problems.append(f"{s['Node Type']} instead of {scan_type}")
+            if not scans:
+                problems.append(f"no scan of {table}")
+            if one_partition and len({s["Relation Name"] for s in scans}) > 1:
+                problems.append(f"{len(scans)} partitions scanned")
+
+            kinds = ", ".join(sorted({f"{s['Node Type']} on {s['Relation Name']}" for s in scans}))
+            if problems:
+                failures += 1
+                print(f"  ❌ {name:<34} {'; '.join(problems)}")
+            else:
+                print(f"  ✅ {name:<34} {kinds}")
+
+        cur.close()
+
+    if failures:
+        raise SystemExit(f"❌ Hot queries not served by their index: {failures}")
+    print("✅ All hot queries use their indexes")
+
+
+COMMANDS = {
+    "upgrade": upgrade,
+    "status": status,
+    "verify": verify,
+}
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Apply and check database schema migrations")
+    parser.add_argument("command", nargs="?", default="upgrade", choices=sorted(COMMANDS))
+    parser.add_argument("--partitions", type=int, default=DB_RATINGS_PARTITIONS,
+                        help="hash-partition ratings by user_id into this many tables (0 = no partitioning)")
+    parser.add_argument("--vacuum", action="store_true",
+                        help="verify: VACUUM ANALYZE first so index-only scans are planned")
+    parser.add_argument("--force-index", action="store_true",
+                        help="verify: disable sequential scans (small development databases)")
+    args = parser.parse_args()
+
+    if args.partitions < 0:
+        parser.error("--partitions must be 0 or more")
+
+    COMMANDS[args.command](args)
@@ -0,0 +1,412 @@
+import copy
+import hashlib
+import json
+import os
+import pickle
+import random
+import re
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from ann import AnnIndex
+from catalog import Catalog
+from coldstart import ColdStartEngine
+from config import (
+    SIMILARITY_TOP_K, SIMILARITY_FLOOR, SIMILARITY_WORKERS, SIMILARITY_DTYPE, MODEL_ARTIFACT, ANN_CANDIDATES
+)
+from mf import RATING_RANGE, MatrixFactors, train_als
+from rating_matrix import RatingMatrix
+from scoring import ScoringEngine, top_n
+from similarity import DenseSimilarity, TopKSimilarity, build_similarity
+
+MODEL_PATH = os.path.join(os.path.dirname(__file__), "model_small.pkl")
+
+# Bump whenever the on-disk artifact layout changes
+ARTIFACT_FORMAT = 2
+
+# 📄 EXTRACT YEAR FROM TITLE
+def extract_year(title):
+    match = re.search(r'\((\d{4})\)', title)
+    if match:
+        return int(match.group(1))
+    return 0
+
+# -----------------------
+# Load ML model
+# -----------------------
+
+def load_model(path=MODEL_PATH, top_k=SIMILARITY_TOP_K, floor=SIMILARITY_FLOOR, workers=SIMILARITY_WORKERS,
+               dtype=SIMILARITY_DTYPE, mf_factors=0):
+
+    print(f"📥 Loading {os.path.basename(path)}...")
+
+    with open(path, 'rb') as f:
+        data = pickle.load(f)
+
+    print("🔄 Building user-movie matrix...")
+
+    ratings = data['ratings']
+    user_movie_matrix = RatingMatrix.from_frame(ratings)
+
+    return build_model(data['movies'], ratings, user_movie_matrix, top_k, floor, workers, dtype, mf_factors)
+
+
+def load_streamed_model(rating_chunks, movies, top_k=SIMILARITY_TOP_K, floor=SIMILARITY_FLOOR,
+                        workers=SIMILARITY_WORKERS, dtype=SIMILARITY_DTYPE, mf_factors=0):
+    # Builds from ratings read chunk by chunk (see rating_matrix.py) instead
+    # of a pickled frame; `movies` is the catalog frame (movieId, title, genres)
+
+    print("🔄 Streaming ratings into the user-movie matrix...")
+
+    user_movie_matrix = RatingMatrix.from_chunks(rating_chunks)
+
+    return build_model(movies, user_movie_matrix.to_frame(), user_movie_matrix, top_k, floor, workers, dtype,
+                       mf_factors)
+
+
+def build_model(movies, ratings, user_movie_matrix, top_k, floor, workers, dtype="float64", mf_factors=0):
+    # mf_factors > 0 also trains matrix factors (build_model.py passes
+    # MF_FACTORS); everything else leaves method="mf" unavailable
+
+    print("📅 Extracting movie years...")
+    movies['year'] = movies['title'].apply(extract_year)
+
+    print("📊 Data loaded:")
+    print("Movies:", len(movies))
+    print("Ratings:", len(ratings))
+    print("Users:", len(user_movie_matrix.user_ids))
+
+    # -----------------------
+    # Build similarities
+    # -----------------------
+
+    print("🔄 Computing collaborative similarity...")
+
+    movie_similarity = build_similarity(user_movie_matrix.item_rows(), top_k, floor, workers)
+
+    print("🔄 Computing content similarity...")
+
+    tfidf = TfidfVectorizer(stop_words='english')
+    tfidf_matrix = tfidf.fit_transform(movies['genres'])
+
+    content_similarity = build_similarity(tfidf_matrix, top_k, floor, workers)
+
+    factors = None
+    if mf_factors > 0:
+        print("🔄 Training matrix factors...")
+        factors = train_als(user_movie_matrix, mf_factors)
+
+    model = assemble_model(movies, ratings, user_movie_matrix, tfidf_matrix, movie_similarity, content_similarity,
+                           factors)
+
+    if dtype != "float64":
+        print(f"🔄 Quantizing similarity to {dtype}...")
+        engine = model['engine']
+        quantized = copy.copy(engine)
+        quantized.collab_sim = engine.collab_sim.quantize(dtype)
+        quantized.content_sim = engine.content_sim.quantize(dtype)
+        model['quantization'] = quantization_report(engine, quantized, user_movie_matrix)
+        # The float64 stores are dropped once the quantized ones are in place
+        engine.collab_sim, engine.content_sim = quantized.collab_sim, quantized.content_sim
+
+    return model
+
+
+def quantization_report(engine, quantized, user_movie_matrix, users=200, n=10, seed=0):
+    # Mean top-n overlap between `engine` (the float64 baseline) and
+    # `quantized` (the same engine on quantized stores) for a sample of
+    # users, per method
+    matrix = user_movie_matrix.matrix
+    movie_ids = user_movie_matrix.movie_ids
+    sample = random.Random(seed).sample(range(matrix.shape[0]), min(users, matrix.shape[0]))
+
+    overlap = {}
+    for method in ["hybrid", "collaborative", "content"]:
+        shares = []
+        for row in sample:
+            start, end = matrix.indptr[row], matrix.indptr[row + 1]
+            rating_rows = list(zip(movie_ids[matrix.indices[start:end]].tolist(),
+                                   np.asarray(matrix.data[start:end]).tolist()))
+            expected = top_n(*engine.score(rating_rows, method=method), n)[0]
+            actual = top_n(*quantized.score(rating_rows, method=method), n)[0]
+            shares.append(len(np.intersect1d(expected, actual)) / max(len(expected), 1))
+        overlap[method] = float(np.mean(shares))
+
+    report = {
+        "dtype": quantized.collab_sim.dtype,
+        "users": len(sample),
+        "n": n,
+        "overlap": overlap,
+        "bytes": {"float64": engine.collab_sim.nbytes + engine.content_sim.nbytes,
+                  "quantized": quantized.collab_sim.nbytes + quantized.content_sim.nbytes},
+    }
+    print(f"🔍 Top-{n} overlap with float64 over {len(sample)} users: "
+          + ", ".join(f"{method} {share:.1%}" for method, share in overlap.items())
+          + f" | similarity {report['bytes']['float64'] / 2**20:.0f} MB -> {report['bytes']['quantized'] / 2**20:.0f} MB")
+    return report
+
+
+def assemble_model(movies, ratings, user_movie_matrix, tfidf_matrix, movie_similarity, content_similarity,
+                   factors=None):
+
+    # Request-path view of the catalog; the frame is kept for offline tooling
+    catalog = Catalog.from_frame(movies)
+
+    engine = ScoringEngine(
+        catalog.movie_ids,
+        catalog.years,
+        catalog.genre_index,
+        user_movie_matrix.movie_ids,
+        movie_similarity,
+        content_similarity,
+        factors
+    )
+
+    # Candidate generation index (see ann.py), only when it is enabled
+    ann = None
+    if ANN_CANDIDATES > 0:
+        print("🔄 Building candidate index...")
+        ann = AnnIndex(engine, user_movie_matrix, tfidf_matrix)
+
+    # Popularity lists for users without enough ratings (see coldstart.py)
+    coldstart = ColdStartEngine(catalog, user_movie_matrix)
+
+    return {
+        "movies": movies,
+        "catalog": catalog,
+        "ratings": ratings,
+        "user_movie_matrix": user_movie_matrix,
+        "tfidf_matrix": tfidf_matrix,
+        "engine": engine,
+        "coldstart": coldstart,
+        "ann": ann
+    }
+
+# -----------------------
+# Precomputed artifacts
+# -----------------------
+#
+# An artifact is a directory of .npy files plus manifest.json describing
+# them. Everything the server needs is stored already derived, so loading
+# is a handful of np.load(mmap_mode='r') calls and worker processes share
+# the page cache instead of each holding a private copy.
+#
+#   artifacts/
+#     current                  <- name of the active version
+#     20261017-120000/
+#       manifest.json
+#       movies.movieId.npy ... collab_sim.indptr.npy ...
+
+def _similarity_arrays(name, store):
+    # Quantized stores keep their dtype on disk; int8 adds the row scales
+    scale = {} if store.scale is None else {f"{name}.scale": store.scale}
+    if isinstance(store, TopKSimilarity):
+        return "topk", {
+            f"{name}.indptr": store.indptr,
+            f"{name}.indices": store.indices,
+            f"{name}.data": store.data,
+            f"{name}.tail": store.tail,
+            **scale,
+        }
+    return "dense", {name: store.matrix, **scale}
+
+
+def _load_similarity(kind, arrays, name):
+    scale = arrays.get(f"{name}.scale")
+    if kind == "topk":
+        n = len(arrays[f"{name}.tail"])
+        return TopKSimilarity(
+            arrays[f"{name}.indptr"],
+            arrays[f"{name}.indices"],
+            arrays[f"{name}.data"],
+            arrays[f"{name}.tail"],
+            (n, n),
+            scale
+        )
+    return DenseSimilarity(arrays[name], scale)
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def save_artifact(model, root, source=None, version=None):
+    # Writes `model` as a new version under `root` and returns its path.
+    # The version directory is written under a temporary name and renamed
+    # into place, so readers never see a half-written artifact.
+    version = version or time.strftime("%Y%m%d-%H%M%S")
+    final_dir = os.path.join(root, version)
+    tmp_dir = os.path.join(root, f".tmp-{version}")
+
+    movies = model['movies']
+    ratings = model['ratings']
+    user_movie_matrix = model['user_movie_matrix'].matrix
+    tfidf_matrix = model['tfidf_matrix'].tocsr()
+    engine = model['engine']
+
+    collab_kind, collab_arrays = _similarity_arrays("collab_sim", engine.collab_sim)
+    content_kind, content_arrays = _similarity_arrays("content_sim", engine.content_sim)
+
+    arrays = {
+        "movies.movieId": movies['movieId'].to_numpy(),
+        "movies.title": movies['title'].to_numpy().astype(str),
+        "movies.genres": movies['genres'].to_numpy().astype(str),
+        "movies.year": movies['year'].to_numpy(),
+        "ratings.userId": ratings['userId'].to_numpy(),
+        "ratings.movieId": ratings['movieId'].to_numpy(),
+        "ratings.rating": ratings['rating'].to_numpy(),
+        "user_movie_matrix.data": user_movie_matrix.data,
+        "user_movie_matrix.indices": user_movie_matrix.indices,
+        "user_movie_matrix.indptr": user_movie_matrix.indptr,
+        "user_movie_matrix.userId": model['user_movie_matrix'].user_ids,
+        "user_movie_matrix.movieId": model['user_movie_matrix'].movie_ids,
+        "tfidf.data": tfidf_matrix.data,
+        "tfidf.indices": tfidf_matrix.indices,
+        "tfidf.indptr": tfidf_matrix.indptr,
+        **collab_arrays,
+        **content_arrays,
+    }
+    if engine.factors is not None:
+        arrays["mf.item_factors"] = engine.factors.item_factors
+
+    os.makedirs(tmp_dir, exist_ok=True)
+    files = {}
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        np.save(os.path.join(tmp_dir, f"{name}.npy"), array, allow_pickle=False)
+        files[name] = {"dtype": array.dtype.str, "shape": list(array.shape)}
+
+    manifest = {
+        "format": ARTIFACT_FORMAT,
+        "version": version,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "source": source and {"path": os.path.basename(source), "sha256": _file_sha256(source)},
+        "tfidf_shape": list(tfidf_matrix.shape),
+        "similarity": {"collab_sim": collab_kind, "content_sim": content_kind},
+        "mf": engine.factors and {
+            "regularization": engine.factors.regularization,
+            "rating_range": list(engine.factors.rating_range),
+        },
+        "quantization": model.get("quantization"),
+        "arrays": files,
+    }
+    with open(os.path.join(tmp_dir, "manifest.json"), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    if os.path.exists(final_dir):
+        shutil.rmtree(final_dir)
+    os.rename(tmp_dir, final_dir)
+    return final_dir
+
+
+def set_current_artifact(root, version):
+    # Atomically points root/current at `version`
+    pointer = os.path.join(root, "current")
+    with open(pointer + ".tmp", 'w') as f:
+        f.write(version + "\n")
+    os.replace(pointer + ".tmp", pointer)
+
+
+def resolve_artifact(path):
+    # Accepts a version directory or a `current` pointer file
+    if os.path.isfile(path):
+        with open(path) as f:
+            return os.path.join(os.path.dirname(path), f.read().strip())
+    return path
+
+
+def load_artifact(path):
+
+    path = resolve_artifact(path)
+
+    with open(os.path.join(path, "manifest.json")) as f:
+        manifest = json.load(f)
+
+    if manifest["format"] != ARTIFACT_FORMAT:
+        raise ValueError(
+            f"Artifact {path} has format {manifest['format']}, expected {ARTIFACT_FORMAT}. "
+            "Rebuild it with build_model.py"
+        )
+
+    print(f"📥 Mapping model artifact {manifest['version']}...")
+
+    arrays = {
+        name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r', allow_pickle=False)
+        for name in manifest["arrays"]
+    }
+
+    # Small catalog frames are rebuilt in memory; the large matrices stay mapped
+    movies = pd.DataFrame({
+        "movieId": arrays["movies.movieId"],
+        "title": arrays["movies.title"],
+        "genres": arrays["movies.genres"],
+        "year": arrays["movies.year"],
+    })
+    ratings = pd.DataFrame({
+        "userId": arrays["ratings.userId"],
+        "movieId": arrays["ratings.movieId"],
+        "rating": arrays["ratings.rating"],
+    })
+    user_ids = arrays["user_movie_matrix.userId"]
+    movie_ids = arrays["user_movie_matrix.movieId"]
+    user_movie_matrix = RatingMatrix(
+        sp.csr_matrix(
+            (arrays["user_movie_matrix.data"], arrays["user_movie_matrix.indices"],
+             arrays["user_movie_matrix.indptr"]),
+            shape=(len(user_ids), len(movie_ids))
+        ),
+        user_ids,
+        movie_ids
+    )
+    tfidf_matrix = sp.csr_matrix(
+        (arrays["tfidf.data"], arrays["tfidf.indices"], arrays["tfidf.indptr"]),
+        shape=tuple(manifest["tfidf_shape"])
+    )
+
+    # Artifacts built with MF_FACTORS=0 have no factors
+    factors = None
+    if manifest.get("mf"):
+        factors = MatrixFactors(
+            arrays["mf.item_factors"], manifest["mf"]["regularization"],
+            tuple(manifest["mf"].get("rating_range", RATING_RANGE))
+        )
+
+    kinds = manifest["similarity"]
+    model = assemble_model(
+        movies,
+        ratings,
+        user_movie_matrix,
+        tfidf_matrix,
+        _load_similarity(kinds["collab_sim"], arrays, "collab_sim"),
+        _load_similarity(kinds["content_sim"], arrays, "content_sim"),
+        factors
+    )
+    model["version"] = manifest["version"]
+
+    print("📊 Data loaded:")
+    print("Movies:", len(movies))
+    print("Ratings:", len(ratings))
+    print("Users:", len(user_movie_matrix.user_ids))
+
+    return model
+
+
+def load_serving_model():
+    # Prefer the prebuilt artifact; fall back to building from the pickle
+    if MODEL_ARTIFACT and os.path.exists(MODEL_ARTIFACT):
+        return load_artifact(MODEL_ARTIFACT)
+
+    # (no matrix factors: method="mf" needs an artifact from build_model.py)
+    print("⚠️ No model artifact found, building from pickle (run build_model.py to speed this up)")
+    model = load_model()
+    model["version"] = "pickle"
+    return model
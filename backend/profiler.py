@@ -0,0 +1,80 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from config import PROFILE_DIR, PROFILE_INTERVAL
+
+# -----------------------
+# Sampling profiler
+# -----------------------
+#
+# Opt-in (PROFILING_ENABLED=1): a request sent with the header
+# `X-Profile: 1` is sampled while it runs. A background thread reads the
+# handling thread's stack every PROFILE_INTERVAL seconds, and the samples
+# are written in the folded-stack format used by flamegraph.pl, speedscope
+# and inferno:
+#
+#   run.py:get_recommendations;run.py:recommend;scoring.py:score 42
+#
+# The file name is returned in the X-Profile-File response header.
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class SamplingProfiler:
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def dump(self, name):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{name}.folded")
+        with open(path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+def init_app(app):
+    from flask import g, request
+
+    @app.before_request
+    def start_profile():
+        if request.headers.get("X-Profile") == "1":
+            g.profiler = SamplingProfiler(threading.get_ident()).start()
+
+    @app.after_request
+    def stop_profile(response):
+        profiler = g.pop("profiler", None)
+        if profiler is not None:
+            profiler.stop()
+            name = (request.url_rule.rule if request.url_rule else "unmatched").strip("/").replace("/", "-")
+            response.headers["X-Profile-File"] = profiler.dump(name)
+        return response
@@ -0,0 +1,173 @@
+import threading
+import time
+from collections import OrderedDict
+
+from batch import fetch_users
+from cache import LocalVersions
+from config import PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL
+
+# -----------------------
+# User profile cache
+# -----------------------
+#
+# /api/recommend needs a user's ratings and preferences on every cache miss
+# of the result cache. The same active users are read over and over, so
+# profiles are kept in an in-process LRU in front of Postgres:
+#
+#   reads    get_or_load(user_id, cur) serves from memory, or loads the
+#            profile with one query (batch.fetch_users) and keeps it;
+#            /api/recommend calls get() first and load() only on a miss, so
+#            a hit needs no connection at all
+#   writes   /api/rate and /api/preferences call update_ratings() and
+#            update_preferences() after their transaction commits, so the
+#            cached profile follows the database instead of being dropped
+#   warm-up  warm(cur, n) loads the n users who rated most recently with
+#            one bulk query when the server starts
+#
+# Like cache.MemoryBackend, every entry remembers the user's version it was
+# stamped with. A write bumps the version: a load that started before the
+# write cannot store what it read, and under serve.py (SharedVersions) the
+# other workers drop their copy and reload it on the next read.
+
+RECENTLY_ACTIVE_SQL = """
+    SELECT user_id FROM ratings
+    GROUP BY user_id
+    ORDER BY max(created_at) DESC
+    LIMIT %s
+"""
+
+
+class ProfileCache:
+
+    def __init__(self, max_entries=PROFILE_CACHE_SIZE, ttl=PROFILE_CACHE_TTL, versions=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.versions = versions if versions is not None else LocalVersions()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._entries = OrderedDict()   # user_id -> [expires_at, version, {movie_id: rating}, genres, mood]
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    # ---------------------------
+    # Reads
+    # ---------------------------
+
+    def get(self, user_id):
+        # (rating_rows, preferred_genres, mood), or None when not cached
+        user_id = int(user_id)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] < time.monotonic() or entry[1] != self.versions.get(user_id):
+                if entry is not None:
+                    del self._entries[user_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return list(entry[2].items()), entry[3], entry[4]
+
+    def get_or_load(self, user_id, cur):
+        profile = self.get(user_id)
+        if profile is not None:
+            return profile
+        return self.load(user_id, cur)
+
+    def load(self, user_id, cur):
+        # Reads the profile from the database and caches it (after a get()
+        # miss, for callers that only open a connection when they need one)
+        user_id = int(user_id)
+        version = self.versions.get(user_id)
+        profile = fetch_users(cur, [user_id]).get(user_id, ([], [], ""))
+        self.put(user_id, profile, version)
+        return profile
+
+    def put(self, user_id, profile, version):
+        # Stores a profile read from the database while the user was at
+        # `version`; skipped if a write has happened since
+        rating_rows, genres, mood = profile
+        with self._lock:
+            if self.versions.get(user_id) != version:
+                return
+            if user_id in self._entries:
+                self._entries.move_to_end(user_id)
+            self._entries[user_id] = [time.monotonic() + self.ttl, version, dict(rating_rows), genres, mood]
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    # ---------------------------
+    # Write-through
+    # ---------------------------
+
+    def update_ratings(self, user_id, rating_rows):
+        # rating_rows: the (movie_id, rating) pairs just committed
+        self._write(int(user_id), lambda entry: entry[2].update(rating_rows))
+
+    def update_preferences(self, user_id, genres, mood):
+        def apply(entry):
+            entry[3], entry[4] = genres or [], mood or ""
+        self._write(int(user_id), apply)
+
+    def _write(self, user_id, apply):
+        # The write is applied in place only if the entry is current and no
+        # other write (from another worker, or a colliding SharedVersions
+        # slot) landed since it was stamped; otherwise the entry is dropped
+        # and the next read loads the committed state.
+        with self._lock:
+            self.writes += 1
+            version = self.versions.bump(user_id)
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return
+            if entry[1] != version - 1 or entry[0] < time.monotonic():
+                del self._entries[user_id]
+                return
+            apply(entry)
+            entry[1] = version
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self.versions.bump(int(user_id))
+            self._entries.pop(int(user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    # ---------------------------
+    # Warm-up
+    # ---------------------------
+
+    def warm(self, cur, n):
+        # Loads the n most recently active users in one bulk query (plus
+        # the small query picking them). Returns how many were cached.
+        if n <= 0 or self.max_entries <= 0:
+            return 0
+
+        cur.execute(RECENTLY_ACTIVE_SQL, (min(n, self.max_entries),))
+        user_ids = [row[0] for row in cur.fetchall()]
+        versions = {user_id: self.versions.get(user_id) for user_id in user_ids}
+
+        profiles = fetch_users(cur, user_ids)
+        # Oldest first, so the most recent users end up least likely to be evicted
+        for user_id in reversed(user_ids):
+            if user_id in profiles:
+                self.put(user_id, profiles[user_id], versions[user_id])
+        return len(profiles)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "writes": self.writes,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,141 @@
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+# -----------------------
+# Sparse user x movie rating matrix
+# -----------------------
+#
+# Replaces ratings.pivot_table(...).fillna(0), which materialises every
+# (user, movie) cell: MovieLens 25M would need 160k x 60k float64s before
+# similarity even starts. RatingMatrix keeps only the stored ratings in CSR
+# form (users x movies, rows and columns in ascending id order like the
+# pivot) and can be built from a frame or streamed chunk by chunk, so the
+# peak memory of a build is proportional to the number of ratings.
+#
+#   matrix = RatingMatrix.from_chunks(csv_chunks("ratings.csv"))
+#   matrix.item_rows()       # movies x users, the collaborative features
+
+DEFAULT_CHUNK_SIZE = 1_000_000
+
+RATING_COLUMNS = ["userId", "movieId", "rating"]
+
+
+class RatingMatrix:
+
+    def __init__(self, matrix, user_ids, movie_ids):
+        self.matrix = matrix            # CSR, len(user_ids) x len(movie_ids)
+        self.user_ids = user_ids
+        self.movie_ids = movie_ids
+        self.shape = matrix.shape
+
+    @property
+    def nbytes(self):
+        return (self.matrix.data.nbytes + self.matrix.indices.nbytes + self.matrix.indptr.nbytes
+                + self.user_ids.nbytes + self.movie_ids.nbytes)
+
+    @classmethod
+    def from_frame(cls, ratings):
+        return cls.from_chunks([ratings])
+
+    @classmethod
+    def from_chunks(cls, chunks):
+        # chunks: iterable of frames with userId, movieId and rating columns.
+        # Each chunk is reduced to three compact arrays as it arrives; repeated
+        # (user, movie) pairs are averaged, as pivot_table does.
+        users, movies, values = [], [], []
+        for chunk in chunks:
+            users.append(np.asarray(chunk['userId'], dtype=np.int64))
+            movies.append(np.asarray(chunk['movieId'], dtype=np.int64))
+            values.append(np.asarray(chunk['rating'], dtype=np.float64))
+
+        if not users:
+            raise ValueError("No ratings to build the matrix from")
+
+        user_ids, rows = np.unique(np.concatenate(users), return_inverse=True)
+        del users
+        movie_ids, cols = np.unique(np.concatenate(movies), return_inverse=True)
+        del movies
+        values = np.concatenate(values)
+        shape = (len(user_ids), len(movie_ids))
+
+        # CSR conversion sums duplicates: divide by how many were summed
+        matrix = sp.csr_matrix((values, (rows, cols)), shape=shape)
+        if matrix.nnz < len(values):
+            counts = sp.csr_matrix((np.ones(len(values)), (rows, cols)), shape=shape)
+            matrix.data /= counts.data
+        matrix.sort_indices()
+
+        return cls(matrix, user_ids, movie_ids)
+
+    def item_rows(self):
+        # movies x users CSR: the feature rows for collaborative similarity
+        return self.matrix.T.tocsr()
+
+    def column_norms(self):
+        return np.sqrt(np.asarray(self.matrix.multiply(self.matrix).sum(axis=0)).ravel())
+
+    def to_frame(self):
+        # One row per stored rating, ordered by user then movie
+        counts = np.diff(self.matrix.indptr)
+        return pd.DataFrame({
+            "userId": np.repeat(self.user_ids, counts),
+            "movieId": self.movie_ids[self.matrix.indices],
+            "rating": self.matrix.data,
+        })
+
+    def to_dense(self):
+        # Offline tooling only: materialises the full matrix
+        return self.matrix.toarray()
+
+# -----------------------
+# Chunked rating sources
+# -----------------------
+
+def csv_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    # MovieLens ratings.csv (userId,movieId,rating[,timestamp])
+    yield from pd.read_csv(
+        path,
+        usecols=RATING_COLUMNS,
+        dtype={"userId": np.int64, "movieId": np.int64, "rating": np.float64},
+        chunksize=chunk_size
+    )
+
+
+def parquet_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Reading Parquet ratings needs pyarrow (pip install pyarrow)")
+
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=RATING_COLUMNS):
+        yield batch.to_pandas()
+
+
+def postgres_chunks(chunk_size=DEFAULT_CHUNK_SIZE):
+    # The `ratings` table, read through a server-side cursor so only one
+    # chunk is ever held by the client
+    from db import connect
+
+    conn = connect()
+    try:
+        cur = conn.cursor(name="rating_matrix_export")
+        cur.itersize = chunk_size
+        cur.execute("SELECT user_id, movie_id, rating FROM ratings")
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield pd.DataFrame(rows, columns=RATING_COLUMNS)
+        cur.close()
+    finally:
+        conn.close()
+
+
+def rating_chunks(source, chunk_size=DEFAULT_CHUNK_SIZE):
+    # "postgres", or a .csv / .parquet path
+    if source == "postgres":
+        return postgres_chunks(chunk_size)
+    if source.endswith(".parquet"):
+        return parquet_chunks(source, chunk_size)
+    return csv_chunks(source, chunk_size)
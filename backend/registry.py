@@ -0,0 +1,183 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+from config import ARTIFACT_DIR, MODEL_ARTIFACT
+from model import load_artifact, load_serving_model, resolve_artifact
+
+# -----------------------
+# Model registry and hot reload
+# -----------------------
+#
+# The serving model is one dict (see model.assemble_model) held by the
+# registry. Request handlers take registry.current() once and use that dict
+# for the whole request, so a reload never changes the model under a
+# request that is already running:
+#
+#   1. the new artifact is loaded and validated on a background thread
+#      while the old model keeps serving;
+#   2. `prepare(model)` attaches per-model services (the incremental
+#      updater) before anything can see it;
+#   3. one reference assignment swaps it in; `on_swap(old, new)` then
+#      retires the old model's services. Requests still holding the old
+#      dict finish on it, and it is freed when the last of them returns.
+#
+# A reload is triggered by POST /api/admin/reload or by the watcher, which
+# polls the `current` pointer written by build_model.py. Under serve.py
+# every worker runs its own watcher, so flipping `current` reloads all of
+# them (an admin request only reaches one worker).
+
+
+class ModelRegistry:
+
+    def __init__(self, model, prepare=None, on_swap=None, load_seconds=None):
+        self.model = model
+        self.prepare = prepare
+        self.on_swap = on_swap
+
+        self.loaded_at = time.time()
+        self.load_seconds = load_seconds
+        self.reloads = 0
+        self.failures = 0
+        self.loading = None         # artifact being loaded, if any
+        self.last_error = None
+
+        self._lock = threading.Lock()
+        self._watcher = None
+        self._stop = threading.Event()
+
+    def current(self):
+        return self.model
+
+    # ---------------------------
+    # Reloading
+    # ---------------------------
+
+    def reload(self, path=MODEL_ARTIFACT, wait=False):
+        # Starts loading `path` (a version directory or the `current`
+        # pointer). Returns False when a reload is already running.
+        with self._lock:
+            if self.loading is not None:
+                return False
+            self.loading = path
+
+        thread = threading.Thread(target=self._load, args=(path,), name="model-reload", daemon=True)
+        thread.start()
+        if wait:
+            thread.join()
+        return True
+
+    def _load(self, path):
+        start = time.perf_counter()
+        try:
+            if os.path.exists(path):
+                model = load_artifact(path)
+            elif path == MODEL_ARTIFACT:
+                model = load_serving_model()
+            else:
+                raise FileNotFoundError(f"No model artifact at {path}")
+
+            validate_model(model)
+            if self.prepare:
+                self.prepare(model)
+
+            old, self.model = self.model, model
+            self.loaded_at = time.time()
+            self.load_seconds = time.perf_counter() - start
+            self.reloads += 1
+            self.last_error = None
+            print(f"✅ Model {old.get('version')} -> {model.get('version')} "
+                  f"swapped in after {self.load_seconds:.1f}s")
+
+            if self.on_swap:
+                self.on_swap(old, model)
+
+        except Exception as e:
+            self.failures += 1
+            self.last_error = f"{type(e).__name__}: {e}"
+            print(f"❌ Model reload from {path} failed, still serving {self.model.get('version')}:", e)
+
+        finally:
+            with self._lock:
+                self.loading = None
+
+    # ---------------------------
+    # Watching the `current` pointer
+    # ---------------------------
+
+    def watch(self, interval, path=MODEL_ARTIFACT):
+        # Reloads whenever `path` resolves to a version other than the one
+        # being served (including right after a serve.py worker respawns
+        # with its parent's older model)
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    if not os.path.exists(path):
+                        continue
+                    version = os.path.basename(resolve_artifact(path))
+                    if version != self.model.get("version"):
+                        self.reload(path, wait=True)
+                except Exception as e:
+                    print("⚠️ Model watcher failed:", e)
+
+        self._watcher = threading.Thread(target=loop, name="model-watch", daemon=True)
+        self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        return {
+            "version": self.model.get("version"),
+            "loaded_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.loaded_at)),
+            "load_seconds": round(self.load_seconds, 3) if self.load_seconds is not None else None,
+            "reloads": self.reloads,
+            "failures": self.failures,
+            "loading": self.loading,
+            "last_error": self.last_error,
+        }
+
+
+def artifact_path(version):
+    # A version name under ARTIFACT_DIR; names only, so admin requests
+    # cannot point the server at arbitrary paths
+    if not version or os.path.basename(version) != version or version.startswith("."):
+        raise ValueError(f"Invalid artifact version {version!r}")
+    return os.path.join(ARTIFACT_DIR, version)
+
+# -----------------------
+# Validation
+# -----------------------
+
+def validate_model(model):
+    # Cheap consistency checks plus one real scoring pass, run before a
+    # model is swapped in. Raises ValueError describing the first problem.
+    catalog = model['catalog']
+    engine = model['engine']
+    user_movie_matrix = model['user_movie_matrix']
+
+    if len(catalog) == 0:
+        raise ValueError("Catalog is empty")
+    if engine.content_sim.shape != (len(catalog), len(catalog)):
+        raise ValueError(f"Content similarity is {engine.content_sim.shape}, catalog has {len(catalog)} movies")
+    collab = len(user_movie_matrix.movie_ids)
+    if engine.collab_sim.shape != (collab, collab):
+        raise ValueError(f"Collaborative similarity is {engine.collab_sim.shape}, {collab} movies are rated")
+    if engine.factors is not None and engine.factors.shape[0] != collab:
+        raise ValueError(f"Matrix factors cover {engine.factors.shape[0]} movies, {collab} movies are rated")
+
+    # The busiest user's ratings must produce finite scores
+    matrix = user_movie_matrix.matrix
+    row = int(np.argmax(np.diff(matrix.indptr)))
+    start, end = matrix.indptr[row], matrix.indptr[row + 1]
+    rating_rows = list(zip(user_movie_matrix.movie_ids[matrix.indices[start:end]].tolist(),
+                           np.asarray(matrix.data[start:end]).tolist()))
+    positions, scores = engine.score(rating_rows)
+    if len(positions) == 0 or not np.isfinite(scores).all():
+        raise ValueError("Scoring a sample user returned no finite scores")
+
+    positions, scores = model['coldstart'].recommend([], n=10)
+    if len(positions) == 0:
+        raise ValueError("Cold-start lists are empty")
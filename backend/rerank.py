@@ -0,0 +1,160 @@
+import time
+
+import numpy as np
+
+from config import RERANK_METHOD, RERANK_POOL, RERANK_DIVERSITY, RERANK_GENRE_CAP, RERANK_BUDGET_MS
+import metrics
+from scoring import top_n
+
+# -----------------------
+# Diversity re-ranking
+# -----------------------
+#
+# Plain top-n by score tends to return near-duplicates: sequels and movies
+# sharing one genre string. The last ranking step can instead re-rank the
+# RERANK_POOL best scored candidates:
+#
+#   mmr        maximal marginal relevance: each slot takes the candidate
+#              maximising (1 - diversity) * relevance - diversity * max
+#              content similarity to the movies already picked. Relevance is
+#              the score rescaled to [0, 1] over the pool. The max similarity
+#              of every candidate is updated with the pick's similarities to
+#              the pool only (similarity block(), which for top-k stores
+#              reads just the pick's stored neighbours), so n picks from a
+#              pool of k cost O(n * k) rather than O(n * N) over the catalog
+#              or the k x k block up front.
+#   genre_cap  at most RERANK_GENRE_CAP movies per genre string, in score
+#              order; skipped movies fill any slots left at the end
+#   none       plain top-n
+#
+# Items keep their original scores, so a re-ranked list is not sorted by
+# score. A re-ranker that runs past its budget fills the remaining slots in
+# score order (counted in rerank_budget_exceeded_total).
+
+BUDGET_EXCEEDED = metrics.registry.counter(
+    "rerank_budget_exceeded_total", "Re-rankings cut short by their latency budget", ["method"]
+)
+
+DEFAULTS = {
+    "method": RERANK_METHOD,
+    "pool": RERANK_POOL,
+    "diversity": RERANK_DIVERSITY,
+    "genre_cap": RERANK_GENRE_CAP,
+    "budget_ms": RERANK_BUDGET_MS,
+}
+
+
+def options_from(data):
+    # Re-ranking options from an /api/recommend body, defaults filled in.
+    # Raises ValueError for unknown methods or out-of-range knobs.
+    options = dict(DEFAULTS)
+    if data.get("rerank") is not None:
+        options["method"] = str(data["rerank"])
+    for key, cast in (("pool", int), ("diversity", float), ("genre_cap", int), ("budget_ms", float)):
+        if data.get(key) is not None:
+            options[key] = cast(data[key])
+
+    if options["method"] not in RERANKERS:
+        raise ValueError(f"Unknown rerank method {options['method']!r} (expected one of {', '.join(RERANKERS)})")
+    if not 0.0 <= options["diversity"] <= 1.0:
+        raise ValueError("diversity must be between 0 and 1")
+    if not 1 <= options["pool"] <= 1000:
+        raise ValueError("pool must be between 1 and 1000")
+    if options["genre_cap"] < 1:
+        raise ValueError("genre_cap must be at least 1")
+    if options["budget_ms"] <= 0:
+        raise ValueError("budget_ms must be positive")
+    return options
+
+
+def cache_key(options):
+    # Hashable form for the result cache key
+    return tuple(sorted(options.items()))
+
+
+def rank(model, positions, scores, n, options=DEFAULTS):
+    # The n movies to return, (positions, scores) in display order
+    if options["method"] == "none" or n <= 1:
+        return top_n(positions, scores, n)
+
+    positions, scores = top_n(positions, scores, max(options["pool"], n))
+    if len(positions) <= 1:
+        return positions, scores
+
+    deadline = time.perf_counter() + options["budget_ms"] / 1000
+    order, complete = RERANKERS[options["method"]](model, positions, scores, n, options, deadline)
+    if not complete:
+        BUDGET_EXCEEDED.inc(method=options["method"])
+        order = _fill(order, len(positions), n)
+    return positions[order], scores[order]
+
+
+def _fill(order, size, n):
+    # Pads a partial pick list with the best (lowest index) unpicked entries
+    picked = np.zeros(size, dtype=bool)
+    picked[order] = True
+    rest = np.flatnonzero(~picked)[:max(n - len(order), 0)]
+    return np.concatenate([np.asarray(order, dtype=np.int64), rest])
+
+# -----------------------
+# Re-rankers
+# -----------------------
+#
+# Each takes the pool sorted best first and returns (pool indices in pick
+# order, finished within the deadline).
+
+def mmr(model, positions, scores, n, options, deadline):
+    content_sim = model['engine'].content_sim
+    diversity = options["diversity"]
+
+    # Rounded so that score() and score_batch(), which differ by float
+    # noise, pick the same movies: exact ties go to the better ranked one
+    spread = scores[0] - scores[-1]
+    relevance = np.round((scores - scores[-1]) / spread, 9) if spread > 0 else np.ones(len(scores))
+    gain = (1.0 - diversity) * relevance
+
+    # Highest similarity of each candidate to any pick so far
+    closest = np.zeros(len(positions))
+    picked = np.zeros(len(positions), dtype=bool)
+    order = []
+
+    for _ in range(min(n, len(positions))):
+        value = gain - diversity * closest
+        value[picked] = -np.inf
+        best = int(np.argmax(value))        # ties go to the better scored movie
+        order.append(best)
+        picked[best] = True
+
+        if len(order) == n:
+            break
+        if time.perf_counter() > deadline:
+            return order, False
+        np.maximum(closest, content_sim.block([positions[best]], positions)[0], out=closest)
+
+    return order, True
+
+
+def genre_cap(model, positions, scores, n, options, deadline):
+    codes = model['catalog'].genre_codes[positions].tolist()
+    cap = options["genre_cap"]
+    counts = {}
+    order, skipped = [], []
+
+    for i, code in enumerate(codes):
+        if counts.get(code, 0) < cap:
+            counts[code] = counts.get(code, 0) + 1
+            order.append(i)
+            if len(order) == n:
+                return order, True
+        else:
+            skipped.append(i)
+
+    # Fewer distinct genre strings than n / cap: relax the cap in score order
+    return order + skipped[:n - len(order)], True
+
+
+RERANKERS = {
+    "none": None,
+    "mmr": mmr,
+    "genre_cap": genre_cap,
+}
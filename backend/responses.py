@@ -0,0 +1,263 @@
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from flask import current_app, request
+from flask.json.provider import DefaultJSONProvider
+
+from config import RESPONSE_COMPRESS_MIN_BYTES, RESPONSE_GZIP_LEVEL, RESPONSE_CACHE_SIZE
+import metrics
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# -----------------------
+# Response encoding
+# -----------------------
+#
+# Every jsonify() goes through FastJSONProvider: orjson when installed
+# (several times faster than the json module, and it encodes NumPy arrays
+# and scalars itself), otherwise the json module with a NumPy fallback.
+# Keys are not sorted.
+#
+# JSON bodies of at least RESPONSE_COMPRESS_MIN_BYTES are compressed for
+# clients that accept it: brotli when installed, else gzip.
+#
+# Responses sent through send() are encoded once:
+#
+#   json_response(obj, version)  GET responses (/api/health) carry a weak
+#                                ETag, and a matching If-None-Match gets an
+#                                empty 304 before anything is encoded. The
+#                                ETag comes from `version` when given (the
+#                                stable part of a body whose counters change
+#                                on every request), else from the body.
+#   cached_response(key, source, build)
+#                                body and compressed forms are kept per key
+#                                for as long as `source` (the cached result
+#                                or seeded page the body is built from) is
+#                                the same object, so repeats skip building,
+#                                encoding and compressing altogether
+#
+# Conditional responses are deliberately GET and HEAD only: browsers do
+# not send If-None-Match on POST, and a matching one there calls for a 412
+# rather than a 304 (RFC 9110, 13.1.2). The POST endpoints (/api/recommend,
+# /api/movies-by-genre) get the encoded-payload cache and no ETag.
+
+RESPONSE_BYTES = metrics.registry.counter(
+    "response_bytes_total", "JSON response bytes sent, by content encoding", ["encoding"]
+)
+NOT_MODIFIED = metrics.registry.counter(
+    "responses_not_modified_total", "Conditional GET requests answered with 304", ["endpoint"]
+)
+PAYLOAD_HITS = metrics.registry.counter(
+    "response_cache_hits_total", "Responses served from an already encoded body", ["endpoint"]
+)
+
+
+def _default(obj):
+    # NumPy values for the json module (orjson handles the common ones)
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj):
+        return orjson.dumps(obj, default=_default, option=_OPTIONS)
+else:
+    import json
+
+    def dumps(obj):
+        return json.dumps(obj, default=_default, separators=(",", ":")).encode()
+
+
+class FastJSONProvider(DefaultJSONProvider):
+
+    sort_keys = False
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return dumps(obj).decode()
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj), mimetype="application/json")
+
+# -----------------------
+# Encoded payloads
+# -----------------------
+
+def _etag(body):
+    return hashlib.blake2b(body, digest_size=12).hexdigest()
+
+
+class Payload:
+
+    # One encoded body with its ETag (sent on GET only); compressed forms are
+    # made on demand
+
+    __slots__ = ("source", "body", "etag", "status", "_encoded")
+
+    def __init__(self, body, status=200, source=None, etag=None):
+        self.source = source
+        self.body = body
+        self.etag = etag or _etag(body)
+        self.status = status
+        self._encoded = {}
+
+    def encoded(self, encoding):
+        data = self._encoded.get(encoding)
+        if data is None:
+            data = self._encoded[encoding] = _compress(self.body, encoding)
+        return data
+
+
+class PayloadCache:
+
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, source):
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is None or payload.source is not source:
+                return None
+            self._entries.move_to_end(key)
+            return payload
+
+    def put(self, key, payload):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = payload
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+payloads = PayloadCache()
+
+
+def _accepted_encoding(size):
+    if RESPONSE_COMPRESS_MIN_BYTES <= 0 or size < RESPONSE_COMPRESS_MIN_BYTES:
+        return None
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return None
+
+
+def _compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=RESPONSE_GZIP_LEVEL, mtime=0)
+
+
+def _endpoint():
+    return request.url_rule.rule if request.url_rule else "unmatched"
+
+
+def _conditional():
+    return request.method in ("GET", "HEAD")
+
+
+def _not_modified(etag):
+    if not _conditional() or not request.if_none_match.contains_weak(etag):
+        return None
+    NOT_MODIFIED.inc(endpoint=_endpoint())
+    response = current_app.response_class(status=304)
+    response.set_etag(etag, weak=True)
+    return response
+
+
+def send(payload):
+    # Response for `payload`: 304 (GET and HEAD), or the body in the best
+    # accepted encoding
+    response = _not_modified(payload.etag)
+    if response is not None:
+        return response
+
+    encoding = _accepted_encoding(len(payload.body))
+    response = current_app.response_class(
+        payload.encoded(encoding) if encoding else payload.body, status=payload.status, mimetype="application/json"
+    )
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    if _conditional():
+        response.set_etag(payload.etag, weak=True)
+    return response
+
+
+def json_response(obj, status=200, version=None):
+    # jsonify() with an ETag on GET; see the top of the file for `version`
+    etag = None
+    if version is not None:
+        etag = _etag(repr(version).encode())
+        response = _not_modified(etag)
+        if response is not None:
+            return response
+    return send(Payload(dumps(obj), status, etag=etag))
+
+
+def cached_response(key, source, build):
+    # `build()` returns the object to encode; it only runs when no body is
+    # cached for `key` with this `source`
+    payload = payloads.get(key, source)
+    if payload is not None:
+        PAYLOAD_HITS.inc(endpoint=_endpoint())
+    else:
+        payload = Payload(dumps(build()), source=source)
+        payloads.put(key, payload)
+    return send(payload)
+
+# -----------------------
+# Flask hooks
+# -----------------------
+
+def init_app(app):
+    app.json = FastJSONProvider(app)
+
+    @app.after_request
+    def compress(response):
+        # Plain jsonify() responses; send() has already encoded its own
+        if "Content-Encoding" in response.headers:
+            RESPONSE_BYTES.inc(response.content_length or 0, encoding=response.headers["Content-Encoding"])
+            return response
+        if response.mimetype != "application/json" or response.direct_passthrough:
+            return response
+
+        body = response.get_data()
+        encoding = _accepted_encoding(len(body))
+        if encoding:
+            body = _compress(body, encoding)
+            response.set_data(body)
+            response.headers["Content-Encoding"] = encoding
+            response.vary.add("Accept-Encoding")
+        RESPONSE_BYTES.inc(len(body), encoding=encoding or "identity")
+        return response
@@ -1,12 +1,32 @@
-from flask import Flask, request, jsonify
+import hmac
+import os
+import threading
+import time
+
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
-import pandas as pd
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.feature_extraction.text import TfidfVectorizer
-import pickle
 import numpy as np
-import os
 import psycopg2
+from psycopg2.errors import QueryCanceled
+
+from batch import METHODS, fresh_recommendations, invalidate_recommendations, result_version, run_batch
+from budget import CostEstimate, Deadline, Degraded
+from cache import RecommendationCache
+from config import (
+    INCREMENTAL_SYNC_INTERVAL, ANN_CANDIDATES, ANN_NPROBE, BATCH_RESULT_SIZE, BATCH_MAX_USERS, PROFILING_ENABLED,
+    COLD_START_MIN_RATINGS, MODEL_WATCH_INTERVAL, ADMIN_TOKEN, MODEL_ARTIFACT, PROFILE_CACHE_WARM,
+    RECOMMEND_BUDGET_MS, RECOMMEND_MAX_INFLIGHT, RECOMMEND_COST_PRIOR_MS, GENRE_PAGE_MAX
+)
+from db import PoolError, pool, upsert_ratings
+from genre_index import MOOD_MAP, sample
+from incremental import IncrementalUpdater
+import metrics
+from metrics import span
+from model import load_serving_model
+from profiles import ProfileCache
+from registry import ModelRegistry, artifact_path
+import rerank
+import responses
 
 # -----------------------
 # Flask setup
@@ -15,242 +35,233 @@ import psycopg2
 app = Flask(__name__)
 CORS(app, supports_credentials=True)
 
-# -----------------------
-# PostgreSQL connection
-# -----------------------
+# Per-request timing spans, latency histograms and the Server-Timing header
+metrics.init_app(app)
 
-def get_db():
-    return psycopg2.connect(
-        host="localhost",
-        database="movie_recommendation",
-        user="postgres",
-        password="postgres@123"   # your password
-    )
+# Fast JSON, compression, encoded-payload cache and ETags on GET (see responses.py)
+responses.init_app(app)
+
+if PROFILING_ENABLED:
+    import profiler
+    profiler.init_app(app)
 
 # -----------------------
 # Load ML model
 # -----------------------
 
-import re
+# Per-user /api/recommend results (see cache.py)
+result_cache = RecommendationCache()
+
+# Per-user ratings and preferences in front of Postgres (see profiles.py)
+profile_cache = ProfileCache()
+
+services_started = False
+
+
+def attach_updater(model):
+    # Fold ratings stored through /api/rate into the model's collaborative
+    # similarity (see incremental.py); cached results are dropped whenever
+    # it changes. A reloaded model catches up on every app rating before it
+    # is swapped in.
+    model['updater'] = None
+    if INCREMENTAL_SYNC_INTERVAL > 0:
+        try:
+            model['updater'] = IncrementalUpdater(
+                model['engine'], model['user_movie_matrix'], on_update=result_cache.clear
+            )
+        except ValueError as e:
+            print("⚠️ Incremental updates disabled:", e)
+            return
+        if services_started:
+            try:
+                model['updater'].sync()
+            except Exception as e:
+                print("⚠️ Incremental sync of the new model failed, its sync thread will retry:", e)
+
+
+def model_swapped(old, new):
+    if old.get('updater'):
+        old['updater'].stop()
+    if new.get('updater') and services_started:
+        new['updater'].start(INCREMENTAL_SYNC_INTERVAL)
+    result_cache.clear()
+    responses.payloads.clear()
+
+
+# Every request reads the model through models.current() (see registry.py)
+load_start = time.perf_counter()
+initial_model = load_serving_model()
+attach_updater(initial_model)
+models = ModelRegistry(
+    initial_model, prepare=attach_updater, on_swap=model_swapped, load_seconds=time.perf_counter() - load_start
+)
+del initial_model
+
+print("✅ Backend fully ready!\n")
 
 # -----------------------
-# Load ML model
+# Background services
 # -----------------------
+#
+# Database connections and the sync thread do not survive fork(), so they
+# are started by whichever process serves requests: `python run.py` below,
+# or each serve.py worker after it has been forked.
 
-print("📥 Loading model_small.pkl...")
+def start_services():
+    global rng, services_started
 
-MODEL_PATH = os.path.join(os.path.dirname(__file__), "model_small.pkl")
+    # Forked workers would otherwise all draw the same "random" movies
+    rng = np.random.default_rng()
 
-with open(MODEL_PATH, 'rb') as f:
-    data = pickle.load(f)
+    try:
+        pool.open()
+    except Exception as e:
+        print("⚠️ Could not pre-open database connections:", e)
+
+    if PROFILE_CACHE_WARM > 0:
+        try:
+            with pool.connection() as conn:
+                cur = conn.cursor()
+                warmed = profile_cache.warm(cur, PROFILE_CACHE_WARM)
+                cur.close()
+            print(f"✅ Profile cache warmed with {warmed} users")
+        except Exception as e:
+            print("⚠️ Could not warm the profile cache:", e)
+
+    services_started = True
+    updater = models.current()['updater']
+    if updater:
+        updater.start(INCREMENTAL_SYNC_INTERVAL)
+
+    if MODEL_WATCH_INTERVAL > 0:
+        models.watch(MODEL_WATCH_INTERVAL)
 
-movies = data['movies']
-ratings = data['ratings']
+# -----------------------
+# Recommendation logic
+# -----------------------
 
-# 📄 EXTRACT YEAR FROM TITLE
-def extract_year(title):
-    match = re.search(r'\((\d{4})\)', title)
-    if match:
-        return int(match.group(1))
-    return 0
+# Full computations running in this process, and recent scoring times per
+# method, for the request budget (see budget.py)
+inflight = threading.BoundedSemaphore(RECOMMEND_MAX_INFLIGHT) if RECOMMEND_MAX_INFLIGHT > 0 else None
+scoring_cost = CostEstimate(prior=RECOMMEND_COST_PRIOR_MS / 1000)
 
-print("📅 Extracting movie years...")
-movies['year'] = movies['title'].apply(extract_year)
 
-print("📊 Data loaded:")
-print("Movies:", len(movies))
-print("Ratings:", len(ratings))
-print("Users:", ratings['userId'].nunique())
+def degraded_recommendations(model, user_id, n, reason, profile=None):
+    # Popularity merged with whatever preferences are known without a query
+    if profile is None:
+        profile = profile_cache.get(user_id) or ([], [], "")
+    rating_rows, preferred_genres, preferred_mood = profile
+    with span("degraded"):
+        positions, scores = model['coldstart'].recommend(rating_rows, preferred_genres, preferred_mood, n)
+        return Degraded(model['catalog'].recommendations(positions, scores), reason)
 
-# -----------------------
-# Build matrices
-# -----------------------
 
-print("🔄 Building user-movie matrix...")
+def recommend(user_id, n=10, method="hybrid", options=rerank.DEFAULTS, deadline=None):
 
-user_movie_matrix = ratings.pivot_table(
-    index='userId',
-    columns='movieId',
-    values='rating'
-).fillna(0)
+    # One model for the whole request, even if a reload swaps it meanwhile
+    model = models.current()
 
-print("🔄 Computing collaborative similarity...")
+    if inflight is None:
+        return compute_recommendations(model, user_id, n, method, options, deadline)
+    if not inflight.acquire(blocking=False):
+        return degraded_recommendations(model, user_id, n, "saturated")
+    try:
+        return compute_recommendations(model, user_id, n, method, options, deadline)
+    finally:
+        inflight.release()
 
-movie_similarity_df = pd.DataFrame(
-    cosine_similarity(user_movie_matrix.T),
-    index=user_movie_matrix.columns,
-    columns=user_movie_matrix.columns
-)
 
-print("🔄 Computing content similarity...")
+def compute_recommendations(model, user_id, n, method, options, deadline):
+    catalog = model['catalog']
+    engine = model['engine']
+    ann = model['ann']
 
-tfidf = TfidfVectorizer(stop_words='english')
-tfidf_matrix = tfidf.fit_transform(movies['genres'])
+    # 1. Ratings and preferences from the profile cache: a hit needs no
+    # database round trip
+    profile = profile_cache.get(user_id)
 
-content_similarity_df = pd.DataFrame(
-    cosine_similarity(tfidf_matrix),
-    index=movies['movieId'],
-    columns=movies['movieId']
-)
+    # 0. A fresh precomputed result stored by batch.py (stored lists are
+    # re-ranked with the default options), read when a connection is opened
+    # for the profile anyway or when the budget cannot cover scoring
+    use_stored = options == rerank.DEFAULTS and (
+        profile is None or (deadline is not None and deadline.remaining() < scoring_cost.expected(method))
+    )
 
-print("✅ Backend fully ready!\n")
+    if profile is None or use_stored:
+        try:
+            with pool.connection(deadline and deadline.remaining()) as conn:
+                cur = conn.cursor()
 
-# -----------------------
-# Recommendation logic
-# -----------------------
+                # Queries get what is left of the budget, not more (the pool
+                # rolls the transaction back, and the setting with it)
+                if deadline is not None:
+                    cur.execute("SET LOCAL statement_timeout = %s", (deadline.statement_timeout(),))
 
-MOOD_MAP = {
-    "Happy": ["Comedy", "Adventure", "Animation", "Musical"],
-    "Funny": ["Comedy", "Animation"],
-    "Sad": ["Drama", "Romance", "Documentary"],
-    "Quirky": ["Indie", "Fantasy", "Comedy"], # Indie might not be a genre in dataset, checking... usually standard genres
-    "Romantic": ["Romance", "Comedy"],
-    "Action": ["Action", "Thriller", "Sci-Fi", "Adventure"]
-}
+                if use_stored:
+                    with span("db.stored"):
+                        stored = fresh_recommendations(cur, user_id, method, n, result_version(model))
+                    if stored is not None:
+                        cur.close()
+                        return stored
 
-def recommend(user_id, n=10, method="hybrid"):
+                if profile is None:
+                    with span("profile"):
+                        profile = profile_cache.load(user_id, cur)
 
-    conn = get_db()
-    cur = conn.cursor()
-    
-    # 1. Fetch Ratings
-    cur.execute("SELECT movie_id, rating FROM ratings WHERE user_id = %s", (user_id,))
-    rating_rows = cur.fetchall()
-    
-    # 2. Fetch Preferences
-    cur.execute("SELECT genres, mood FROM preferences WHERE user_id = %s", (user_id,))
-    pref_row = cur.fetchone()
-    
-    cur.close()
-    conn.close()
+                cur.close()
+
+        except (PoolError, psycopg2.Error) as e:
+            if deadline is None:
+                raise
+            print("⚠️ Recommendation database step failed, serving the fallback:", e)
+            reason = "budget" if isinstance(e, QueryCanceled) else "database"
+            return degraded_recommendations(model, user_id, n, reason, profile)
+
+    rating_rows, preferred_genres, preferred_mood = profile
 
-    # Process Ratings
-    user_ratings_dict = {row[0]: row[1] for row in rating_rows}
-    rated_movie_ids = set(user_ratings_dict.keys())
-    
-    # Process Preferences
-    preferred_genres = []
-    preferred_mood = ""
-    
-    if pref_row:
-        # genres is already a list if stored as jsonb and psycopg2 handles it, 
-        # or we might need json.loads if it comes back as string.
-        # usually psycopg2 with jsonb returns list/dict python objects directly.
-        preferred_genres = pref_row[0] if pref_row[0] else [] 
-        preferred_mood = pref_row[1] if pref_row[1] else ""
-        
     print(f"👤 User {user_id} | Genres: {preferred_genres} | Mood: {preferred_mood}")
 
+    # New users: popularity lists merged with their preferences (coldstart.py)
+    if len(rating_rows) < COLD_START_MIN_RATINGS:
+        with span("coldstart"):
+            depth = n if options["method"] == "none" else max(options["pool"], n)
+            positions, scores = model['coldstart'].recommend(rating_rows, preferred_genres, preferred_mood, depth)
+        with span("rerank"):
+            positions, scores = rerank.rank(model, positions, scores, n, options)
+        with span("format"):
+            return catalog.recommendations(positions, scores)
+
+    # Not enough budget left for a full scoring pass at its recent cost
+    if deadline is not None and deadline.remaining() < scoring_cost.expected(method):
+        scoring_cost.skipped(method)
+        return degraded_recommendations(
+            model, user_id, n, "budget", (rating_rows, preferred_genres, preferred_mood)
+        )
+    scoring_start = time.perf_counter()
+
     # MOOD GENRES
     mood_target_genres = MOOD_MAP.get(preferred_mood, [])
 
-    predictions = []
-
-    # Filter for candidates: ONLY movies > 2000
-    # We can either filter explicitly or just punish older movies heavily.
-    # User requested Strict filtering "Fetch only movies released between 2000 and 2026".
-    candidate_movies = movies[movies['year'] >= 2000]
-
-    for index, row in candidate_movies.iterrows():
-        mid = row['movieId']
-
-        if mid in rated_movie_ids:
-            continue
-            
-        # Optimization: Skip movies not in our lookup dicts to save time
-        if mid not in movie_similarity_df.columns and mid not in content_similarity_df.columns:
-            continue
-
-        score_collab = 0
-        score_content = 0
-
-        # Collaborative (Item-Item)
-        if mid in movie_similarity_df.columns:
-            sims = movie_similarity_df[mid]
-            valid_sims_indices = sims.index.intersection(rated_movie_ids)
-            
-            if not valid_sims_indices.empty:
-                my_ratings_for_sim_movies = [user_ratings_dict[m] for m in valid_sims_indices]
-                my_sims_values = sims[valid_sims_indices].values
-                sim_sum = my_sims_values.sum()
-                
-                if sim_sum > 0:
-                    dot_product = np.dot(my_ratings_for_sim_movies, my_sims_values)
-                    score_collab = dot_product / sim_sum
-
-        # Content-based
-        if mid in content_similarity_df.columns:
-            if rating_rows:
-                sorted_user_ratings = sorted(rating_rows, key=lambda x: x[1], reverse=True)
-                top_3_favs = [x[0] for x in sorted_user_ratings[:3]]
-                scores = []
-                for fav in top_3_favs:
-                    if fav in content_similarity_df.columns:
-                        scores.append(content_similarity_df[mid][fav])
-                if scores:
-                    score_content = float(np.mean(scores))
-            else:
-                # Cold start: Boost basic content score slightly if we have no history
-                score_content = 0.0
-
-        # Base Score
-        if method == "collaborative":
-            final_score = score_collab
-        elif method == "content":
-            final_score = score_content
-        else:
-            final_score = (0.7 * score_collab) + (0.3 * score_content)
-            
-        # ---------------------------
-        # BOOSTING LOGIC 🚀
-        # ---------------------------
-        
-        movie_genres_str = row['genres']
-        movie_genres_list = movie_genres_str.split('|')
-        
-        # 1. Genre Match Boost
-        overlap = set(preferred_genres).intersection(movie_genres_list)
-        if overlap:
-            final_score += 0.3 # Strong additive boost
-            
-        # 2. Mood Match Boost
-        mood_overlap = set(mood_target_genres).intersection(movie_genres_list)
-        if mood_overlap:
-            final_score += 0.2
-            
-        # 3. Recency Bias (Multiplicative)
-        # year from 2000 to 2026.
-        # 2000 -> 1.0
-        # 2024 -> 1.24
-        age_bonus = 1.0 + (row['year'] - 2000) * 0.01
-        final_score *= age_bonus
-        
-        if final_score > 0:
-            predictions.append({
-                "movieId": mid,
-                "score": final_score,
-                "year": row['year']
-            })
-            
-    if not predictions:
-        return []
-
-    result = pd.DataFrame(predictions)\
-        .sort_values("score", ascending=False)\
-        .head(n)
-
-    result = result.merge(movies, on="movieId", suffixes=('', '_dup'))
-    # Clean up duplicate columns if any (merge might add _dup if columns exist in both)
-    # Actually movies has 'year' now, so predictions 'year' and movies 'year' might crash or duplicate.
-    # predictions has 'year', movies has 'year'. merge on movieId.
-    # Result will have year_x and year_y.
-    
-    # Let's fix column selection
-    final_cols = []
-    if 'year_x' in result.columns:
-        result['year'] = result['year_x']
+    # Shortlist likely movies first when candidate generation is enabled
+    # (None for users without ratings: they are scored exhaustively)
+    candidates = None
+    if ann is not None:
+        with span("candidates"):
+            candidates = ann.candidates(
+                rating_rows, preferred_genres, mood_target_genres, method, ANN_CANDIDATES, ANN_NPROBE
+            )
+
+    # Score the shortlist (or every unrated post-2000 movie) in one vectorized pass
+    with span("score"):
+        positions, scores = engine.score(rating_rows, preferred_genres, mood_target_genres, method, candidates)
 
-    return result[["title", "genres", "score", "year"]].to_dict("records")
+    # Top n, re-ranked for diversity (see rerank.py)
+    with span("rank"):
+        positions, scores = rerank.rank(model, positions, scores, n, options)
+    scoring_cost.observe(method, time.perf_counter() - scoring_start)
+
+    with span("format"):
+        return catalog.recommendations(positions, scores)
 
 # -----------------------
 # AUTH APIs
@@ -265,31 +276,30 @@ def signup():
     email = data.get("email")
     password = data.get("password")
 
-    conn = get_db()
-    cur = conn.cursor()
+    with pool.connection() as conn:
+        cur = conn.cursor()
 
-    try:
-        cur.execute(
-            "INSERT INTO users (username, email, password) VALUES (%s, %s, %s)",
-            (username, email, password)
-        )
-        conn.commit()
+        try:
+            cur.execute(
+                "INSERT INTO users (username, email, password) VALUES (%s, %s, %s)",
+                (username, email, password)
+            )
+            conn.commit()
 
-        return jsonify({
-            "success": True,
-            "message": "Account created successfully"
-        })
+            return jsonify({
+                "success": True,
+                "message": "Account created successfully"
+            })
 
-    except Exception as e:
-        conn.rollback()
-        return jsonify({
-            "success": False,
-            "message": "Email already exists"
-        })
+        except Exception as e:
+            conn.rollback()
+            return jsonify({
+                "success": False,
+                "message": "Email already exists"
+            })
 
-    finally:
-        cur.close()
-        conn.close()
+        finally:
+            cur.close()
 
 
 @app.route("/api/login", methods=["POST"])
@@ -300,18 +310,17 @@ def login():
     email = data.get("email")
     password = data.get("password")
 
-    conn = get_db()
-    cur = conn.cursor()
+    with pool.connection() as conn:
+        cur = conn.cursor()
 
-    cur.execute(
-        "SELECT id, username FROM users WHERE email=%s AND password=%s",
-        (email, password)
-    )
+        cur.execute(
+            "SELECT id, username FROM users WHERE email=%s AND password=%s",
+            (email, password)
+        )
 
-    user = cur.fetchone()
+        user = cur.fetchone()
 
-    cur.close()
-    conn.close()
+        cur.close()
 
     if user:
         return jsonify({
@@ -339,30 +348,29 @@ def rate_movies():
     if not user_id or not ratings_list:
         return jsonify({"success": False, "message": "Missing data"}), 400
 
-    conn = get_db()
-    cur = conn.cursor()
+    with pool.connection() as conn:
+        cur = conn.cursor()
 
-    try:
-        for movie_id_str, score in ratings_list.items():
-            
-            cur.execute("""
-                INSERT INTO ratings (user_id, movie_id, rating)
-                VALUES (%s, %s, %s)
-                ON CONFLICT (user_id, movie_id) 
-                DO UPDATE SET rating = EXCLUDED.rating;
-            """, (user_id, int(movie_id_str), score))
-            
-        conn.commit()
-        return jsonify({"success": True, "message": "Ratings saved"})
-        
-    except Exception as e:
-        conn.rollback()
-        print(e)
-        return jsonify({"success": False, "message": str(e)}), 500
-        
-    finally:
-        cur.close()
-        conn.close()
+        try:
+            # One multi-row upsert for the whole batch (see db.upsert_ratings)
+            stored = upsert_ratings(cur, [
+                (user_id, int(movie_id_str), score)
+                for movie_id_str, score in ratings_list.items()
+            ], returning=True)
+            invalidate_recommendations(cur, user_id)
+
+            conn.commit()
+            profile_cache.update_ratings(user_id, stored)
+            result_cache.invalidate(user_id)
+            return jsonify({"success": True, "message": "Ratings saved"})
+
+        except Exception as e:
+            conn.rollback()
+            print(e)
+            return jsonify({"success": False, "message": str(e)}), 500
+
+        finally:
+            cur.close()
 
 # -----------------------
 # PREFERENCES API (NEW)
@@ -379,86 +387,87 @@ def save_preferences():
     if not user_id:
         return jsonify({"success": False, "message": "Missing user_id"}), 400
         
-    conn = get_db()
-    cur = conn.cursor()
-    
-    try:
-        # Use json.dumps for the list to ensure it's stored as valid JSONB
-        import json
-        genres_json = json.dumps(genres)
-        
-        cur.execute("""
-            INSERT INTO preferences (user_id, genres, mood)
-            VALUES (%s, %s, %s)
-            ON CONFLICT (user_id)
-            DO UPDATE SET genres = EXCLUDED.genres, mood = EXCLUDED.mood;
-        """, (user_id, genres_json, mood))
-        
-        conn.commit()
-        return jsonify({"success": True, "message": "Preferences saved"})
-        
-    except Exception as e:
-        conn.rollback()
-        print("Error saving preferences:", e)
-        return jsonify({"success": False, "message": str(e)}), 500
-        
-    finally:
-        cur.close()
-        conn.close()
+    with pool.connection() as conn:
+        cur = conn.cursor()
+
+        try:
+            # Use json.dumps for the list to ensure it's stored as valid JSONB
+            import json
+            genres_json = json.dumps(genres)
+
+            cur.execute("""
+                INSERT INTO preferences (user_id, genres, mood)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (user_id)
+                DO UPDATE SET genres = EXCLUDED.genres, mood = EXCLUDED.mood;
+            """, (user_id, genres_json, mood))
+            invalidate_recommendations(cur, user_id)
+
+            conn.commit()
+            profile_cache.update_preferences(user_id, genres, mood)
+            result_cache.invalidate(user_id)
+            return jsonify({"success": True, "message": "Preferences saved"})
+
+        except Exception as e:
+            conn.rollback()
+            print("Error saving preferences:", e)
+            return jsonify({"success": False, "message": str(e)}), 500
+
+        finally:
+            cur.close()
 
 # -----------------------
 # MOVIES BY GENRE API (NEW)
 # -----------------------
 
+rng = np.random.default_rng()
+
 @app.route("/api/movies-by-genre", methods=["POST"])
 def get_movies_by_genre():
     data = request.get_json()
-    genres = data.get("genres", [])
-    n = data.get("n", 10)
-
-    # If no genres provided, return top rated or random
-    if not genres:
-        # Filter for year >= 2000
-        candidates = movies[movies['year'] >= 2000]
-        sample = candidates.sample(n=n)
-    else:
-        # Filter movies that match ANY of the genres
-        # movies['genres'] is a pipe-separated string "Action|Adventure"
-        
-        # Filter for year >= 2000 first
-        candidates = movies[movies['year'] >= 2000]
-        
-        # Create a boolean mask on the filtered candidates
-        mask = candidates['genres'].apply(lambda x: any(g in x.split('|') for g in genres))
-        filtered_movies = candidates[mask]
-        
-        if filtered_movies.empty:
-            # Fallback if no matches found (rare), but still respect year
-            sample = candidates.sample(n=n)
-        elif len(filtered_movies) < n:
-            # Return all if less than n
-            sample = filtered_movies
-        else:
-            sample = filtered_movies.sample(n=n)
-
-    result = sample[['movieId', 'title', 'genres', 'year']].to_dict('records')
-    
-    # Add a mock summary if not present (dataset dependent, usually datasets like movielens don't have summaries)
-    # The frontend expects a summary. Let's add a placeholder if missing.
-    # Checking existing code... frontend interface has 'summary'.
-    # Our 'movies' df likely came from MovieLens which only has title/genres.
-    # Let's add a generic summary.
-    for movie in result:
-        movie['summary'] = f"Released in {movie['year']}. A popular {movie['genres'].replace('|', ', ')} movie."
-        # Frontend RateMovies props expect: id, title, genre, summary
-        # Rename keys to match frontend expectation or update frontend
-        movie['id'] = movie.pop('movieId')
-        movie['genre'] = movie.pop('genres') # Frontend expects 'genre' singular
-        
-    return jsonify({
-        "success": True,
-        "movies": result
-    })
+    genres = data.get("genres") or []
+
+    # Movies that match ANY (default) or ALL of the genres
+    match_all = data.get("match", "any") == "all"
+
+    # Optional seed: the same seed (and cursor) always returns the same page,
+    # and next_cursor continues it without repeats
+    try:
+        n = int(data.get("n", 10))
+        seed = None if data.get("seed") is None else int(data["seed"])
+        cursor = int(data.get("cursor") or 0)
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "message": "n, seed and cursor must be integers"}), 400
+    if not 1 <= n <= GENRE_PAGE_MAX:
+        return jsonify({"success": False, "message": f"n must be between 1 and {GENRE_PAGE_MAX}"}), 400
+    if cursor < 0 or (seed is not None and seed < 0):
+        return jsonify({"success": False, "message": "seed and cursor must not be negative"}), 400
+
+    catalog = models.current()['catalog']
+
+    # Post-2000 movies matching the genres, or all of them when nothing
+    # matches (precomputed pools, see genre_index.py). MovieLens has no plot
+    # summaries; the frontend (RateMovies) expects id, title, genre and
+    # summary, which Catalog.cards() prebuilds.
+    if seed is None:
+        candidates = catalog.genre_index.pool(genres, match_all)
+        return jsonify({"success": True, "movies": catalog.cards(sample(candidates, n, rng))})
+
+    # Seeded pages never change for a model: encoded once (see responses.py)
+    order = catalog.genre_index.shuffled(genres, match_all, seed)
+    end = cursor + n
+
+    def page():
+        return {
+            "success": True,
+            "movies": catalog.cards(order[cursor:end]),
+            "seed": seed,
+            "total": len(order),
+            "next_cursor": end if end < len(order) else None,
+        }
+
+    key = ("movies-by-genre", match_all, frozenset(genres), seed, cursor, n)
+    return responses.cached_response(key, order, page)
 
 # -----------------------
 # Recommendation API
@@ -467,14 +476,33 @@ def get_movies_by_genre():
 @app.route("/api/recommend", methods=["POST"])
 def get_recommendations():
 
-    data = request.get_json()
+    data = request.get_json(silent=True)
 
-    try:
-        user_id = int(data["user_id"])
-        num_recs = int(data.get("num_recommendations", 5))
-        method = data.get("method", "hybrid")
+    # Past the budget the answer comes from the cheap path (see budget.py)
+    deadline = Deadline(RECOMMEND_BUDGET_MS / 1000) if RECOMMEND_BUDGET_MS > 0 else None
 
-        results = recommend(user_id, num_recs, method)
+    try:
+        # Diversity knobs: rerank, pool, diversity, genre_cap, budget_ms
+        try:
+            if not isinstance(data, dict):
+                raise ValueError("Expected a JSON object")
+            options = rerank.options_from(data)
+            user_id = int(data["user_id"])
+            num_recs = int(data.get("num_recommendations", 5))
+            method = data.get("method", "hybrid")
+        except KeyError:
+            return jsonify({"success": False, "message": "Missing user_id"}), 400
+        except (TypeError, ValueError) as e:
+            return jsonify({"success": False, "message": str(e)}), 400
+
+        # Identical concurrent requests share one computation
+        try:
+            results = result_cache.get_or_compute(
+                user_id, method, num_recs, lambda: recommend(user_id, num_recs, method, options, deadline),
+                rerank.cache_key(options), deadline and deadline.remaining()
+            )
+        except TimeoutError:
+            results = degraded_recommendations(models.current(), user_id, num_recs, "coalesced")
 
         if not results:
             return jsonify({
@@ -482,10 +510,22 @@ def get_recommendations():
                 "message": "No recommendations found"
             })
 
-        return jsonify({
-            "success": True,
-            "recommendations": results
-        })
+        # Degraded results say so, with the reason (see budget.py)
+        if getattr(results, "degraded", False):
+            with span("serialize"):
+                return jsonify({
+                    "success": True,
+                    "recommendations": results,
+                    "degraded": True,
+                    "degraded_reason": results.reason
+                })
+
+        # Cached results are encoded once (see responses.py)
+        key = ("recommend", user_id, method, num_recs, rerank.cache_key(options))
+        with span("serialize"):
+            return responses.cached_response(
+                key, results, lambda: {"success": True, "recommendations": results, "degraded": False}
+            )
 
     except Exception as e:
         print("Recommendation error:", e)
@@ -494,6 +534,58 @@ def get_recommendations():
             "message": str(e)
         }), 500
 
+@app.route("/api/recommend/batch", methods=["POST"])
+def get_batch_recommendations():
+
+    # Scores and writes up to BATCH_MAX_USERS users: admin only
+    if not admin_allowed():
+        return jsonify({"success": False, "message": "Forbidden"}), 403
+
+    data = request.get_json(silent=True)
+
+    try:
+        if not isinstance(data, dict):
+            raise ValueError("Expected a JSON object")
+        user_ids = [int(u) for u in data.get("user_ids") or []]
+        num_recs = int(data.get("num_recommendations", BATCH_RESULT_SIZE))
+        method = data.get("method", "hybrid")
+    except (TypeError, ValueError) as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+
+    if method not in METHODS:
+        return jsonify({"success": False, "message": f"Unknown method (expected one of {', '.join(METHODS)})"}), 400
+    if num_recs < 1:
+        return jsonify({"success": False, "message": "num_recommendations must be positive"}), 400
+    if not user_ids:
+        return jsonify({"success": False, "message": "Missing user_ids"}), 400
+    if len(user_ids) > BATCH_MAX_USERS:
+        return jsonify({
+            "success": False,
+            "message": f"At most {BATCH_MAX_USERS} user_ids per request, use batch.py for more"
+        }), 400
+
+    with pool.connection() as conn:
+        cur = conn.cursor()
+
+        try:
+            # Scores every user together and stores the results, so later
+            # /api/recommend calls for them are served from the table
+            results = run_batch(models.current(), cur, user_ids, [method], num_recs)[method]
+            conn.commit()
+
+            return jsonify({
+                "success": True,
+                "recommendations": {str(user_id): items for user_id, items in results.items()}
+            })
+
+        except Exception as e:
+            conn.rollback()
+            print("Batch recommendation error:", e)
+            return jsonify({"success": False, "message": str(e)}), 500
+
+        finally:
+            cur.close()
+
 # -----------------------
 # Health API
 # -----------------------
@@ -501,24 +593,113 @@ def get_recommendations():
 @app.route("/api/health")
 def health():
 
-    return jsonify({
+    model = models.current()
+    updater = model['updater']
+    stats = models.stats()
+
+    # The ETag covers the model and its updates only: the counters below
+    # change on every request, so a 304 says the model is unchanged, not
+    # that the counters are
+    version = (
+        stats["version"], stats["loaded_at"], stats["loading"], stats["last_error"],
+        updater.last_change if updater else None,
+    )
+    return responses.json_response({
         "status": "ok",
-        "movies": len(movies),
-        "ratings": len(ratings),
-        "users": int(ratings["userId"].nunique())
-    })
+        "worker": os.getpid(),
+        "model": stats,
+        "movies": len(model['catalog']),
+        "ratings": int(model['user_movie_matrix'].matrix.nnz),
+        "users": len(model['user_movie_matrix'].user_ids),
+        "db_pool": pool.stats(),
+        "result_cache": result_cache.stats(),
+        "profile_cache": profile_cache.stats(),
+        "response_cache": len(responses.payloads),
+        "scoring_ms": scoring_cost.stats(),
+        "incremental": updater.stats() if updater else None
+    }, version=version)
+
+# -----------------------
+# Admin API
+# -----------------------
+
+def admin_allowed():
+    token = request.headers.get("X-Admin-Token", "")
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+@app.route("/api/admin/reload", methods=["POST"])
+def reload_model():
+
+    if not admin_allowed():
+        return jsonify({"success": False, "message": "Forbidden"}), 403
+
+    data = request.get_json(silent=True) or {}
+
+    # {"version": "20261017-120000"} loads that artifact; without it the
+    # `current` pointer is reloaded. {"wait": true} answers once it is live.
+    # Only the worker that answers reloads, and while the watcher runs it
+    # switches back to `current` on its next check: to roll out (or roll
+    # back) a version everywhere, point `current` at it instead.
+    try:
+        path = artifact_path(data["version"]) if data.get("version") else MODEL_ARTIFACT
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+
+    if not models.reload(path, wait=bool(data.get("wait"))):
+        return jsonify({"success": False, "message": "A reload is already running", "model": models.stats()}), 409
+
+    stats = models.stats()
+    if data.get("wait") and stats["last_error"]:
+        return jsonify({"success": False, "message": stats["last_error"], "model": stats}), 500
+
+    return jsonify({"success": True, "model": stats}), 200 if data.get("wait") else 202
+
+# -----------------------
+# Metrics API
+# -----------------------
+#
+# Prometheus text format. Counters and histograms are per process: under
+# serve.py each scrape is answered by one worker and carries its pid in
+# the `worker_pid` gauge, so scrape every worker (or sum across them).
+
+@metrics.registry.collect
+def runtime_metrics():
+    db = pool.stats()
+    cache = result_cache.stats()
+    profiles = profile_cache.stats()
+    return [
+        ("worker_pid", "gauge", "Process id of the worker that answered this scrape", os.getpid()),
+        ("db_pool_connections", "gauge", "Open database connections", db["size"]),
+        ("db_pool_in_use", "gauge", "Database connections checked out", db["in_use"]),
+        ("db_pool_checkouts_total", "counter", "Connection checkouts", db["checkouts"]),
+        ("db_pool_waits_total", "counter", "Checkouts that waited for a free connection", db["waits"]),
+        ("db_pool_wait_seconds_total", "counter", "Time spent waiting for connections", db["wait_seconds_total"]),
+        ("db_pool_timeouts_total", "counter", "Checkouts that timed out", db["timeouts"]),
+        ("result_cache_hits_total", "counter", "Recommendation cache hits", cache.get("hits")),
+        ("result_cache_misses_total", "counter", "Recommendation cache misses", cache.get("misses")),
+        ("result_cache_entries", "gauge", "Cached recommendation results", cache.get("entries")),
+        ("result_cache_coalesced_total", "counter", "Requests that joined an identical computation",
+         cache.get("coalesced")),
+        ("profile_cache_hits_total", "counter", "Profile cache hits", profiles["hits"]),
+        ("profile_cache_misses_total", "counter", "Profile cache misses", profiles["misses"]),
+        ("profile_cache_entries", "gauge", "Cached user profiles", profiles["entries"]),
+    ]
+
+@app.route("/api/metrics")
+def get_metrics():
+
+    return Response(metrics.registry.render(), mimetype="text/plain; version=0.0.4")
 
 @app.route("/api/test-db")
 def test_db():
 
-    conn = get_db()
-    cur = conn.cursor()
+    with pool.connection() as conn:
+        cur = conn.cursor()
 
-    cur.execute("SELECT COUNT(*) FROM users;")
-    count = cur.fetchone()[0]
+        cur.execute("SELECT COUNT(*) FROM users;")
+        count = cur.fetchone()[0]
 
-    cur.close()
-    conn.close()
+        cur.close()
 
     return jsonify({"users_in_db": count})
 
@@ -527,6 +708,8 @@ def test_db():
 
 if __name__ == "__main__":
 
+    start_services()
+
     print("🚀 Flask running at http://localhost:5000")
     app.run(port=5000, debug=False)
 
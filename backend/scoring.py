@@ -0,0 +1,262 @@
+import numpy as np
+import scipy.sparse as sp
+
+from genre_index import GenreIndex, MIN_YEAR
+
+# -----------------------
+# Vectorized scoring engine
+# -----------------------
+
+COLLAB_WEIGHT = 0.7
+CONTENT_WEIGHT = 0.3
+GENRE_BOOST = 0.3
+MOOD_BOOST = 0.2
+
+# Candidates are restricted to movies released from MIN_YEAR on, and the
+# recency bonus grows by 1% per year after it.
+RECENCY_PER_YEAR = 0.01
+
+# Number of top-rated movies used as "favourites" for the content score
+CONTENT_FAVOURITES = 3
+
+
+class ScoringEngine:
+
+    def __init__(self, movie_ids, years, genres, collab_ids, collab_sim, content_sim, factors=None):
+        # Catalog arrays, aligned with the row order of the `movies` frame
+        self.movie_ids = np.asarray(movie_ids)
+        self.years = np.asarray(years)
+        self.position = {int(mid): i for i, mid in enumerate(self.movie_ids)}
+        self.recency = 1.0 + (self.years - MIN_YEAR) * RECENCY_PER_YEAR
+
+        # Genre bitmasks and posting lists, used for the boosts and the year
+        # filter; `genres` is the genre strings or an already built index
+        self.genre_index = genres if isinstance(genres, GenreIndex) else GenreIndex(genres, self.years)
+        self.recent = self.genre_index.recent_flags
+
+        # Similarity stores (see similarity.py). Collaborative similarity only
+        # covers movies that have ratings, so keep a catalog position -> collab
+        # position map (-1 = not rated)
+        self.collab_sim = collab_sim
+        self.collab_position = {int(mid): i for i, mid in enumerate(collab_ids)}
+        self.collab_of = np.array(
+            [self.collab_position.get(int(mid), -1) for mid in self.movie_ids],
+            dtype=np.int64
+        )
+
+        # Content similarity is indexed by catalog position
+        self.content_sim = content_sim
+
+        # Item factors for method="mf" (see mf.py), rows in collab order;
+        # None when the model was built without them
+        self.factors = factors
+
+    # ---------------------------
+    # Individual score components
+    # ---------------------------
+
+    def collab_scores(self, rating_rows, positions=None):
+        # Weighted average of the user's ratings, weighted by the similarity
+        # between each rated movie and each catalog movie (every movie, or
+        # only those at `positions`).
+        scores = np.zeros(len(self.movie_ids) if positions is None else len(positions))
+
+        rated = sorted(
+            (self.collab_position[m], r) for m, r in rating_rows if m in self.collab_position
+        )
+        if not rated:
+            return scores
+
+        rows = [p for p, _ in rated]
+        values = [r for _, r in rated]
+
+        collab_of = self.collab_of if positions is None else self.collab_of[positions]
+        has_collab = collab_of >= 0
+        columns = None if positions is None else collab_of[has_collab]
+
+        # Row r of the store holds sim(rated movie r, candidate) for every
+        # candidate, so one weighted row sum gives the whole numerator.
+        # Read the store once: background updates may swap it mid-request.
+        sim = self.collab_sim
+        numerator = sim.row_sums(rows, values, columns)
+        denominator = sim.row_sums(rows, columns=columns)
+
+        collab = np.zeros(len(denominator))
+        positive = denominator > 0
+        collab[positive] = numerator[positive] / denominator[positive]
+
+        if positions is None:
+            scores[has_collab] = collab[collab_of[has_collab]]
+        else:
+            scores[has_collab] = collab
+        return scores
+
+    def content_scores(self, rating_rows, positions=None):
+        # Mean content similarity to the user's top rated movies
+        scores = np.zeros(len(self.movie_ids) if positions is None else len(positions))
+        if not rating_rows:
+            return scores
+
+        favourites = sorted(rating_rows, key=lambda x: x[1], reverse=True)[:CONTENT_FAVOURITES]
+        rows = [self.position[m] for m, _ in favourites if m in self.position]
+        if not rows:
+            return scores
+
+        return self.content_sim.row_sums(rows, columns=positions) / len(rows)
+
+    def mf_scores(self, rating_rows, positions=None):
+        # Predicted ratings from the user's ratings folded into the item
+        # factors; 0 for movies nobody had rated when the factors were trained
+        if self.factors is None:
+            raise ValueError("This model has no matrix factors (build an artifact with build_model.py --mf-factors)")
+        scores = np.zeros(len(self.movie_ids) if positions is None else len(positions))
+
+        rated = [(self.collab_position[m], r) for m, r in rating_rows if m in self.collab_position]
+        if not rated:
+            return scores
+
+        user, mean = self.factors.fold_in([p for p, _ in rated], [r for _, r in rated])
+        collab_of = self.collab_of if positions is None else self.collab_of[positions]
+        has_collab = collab_of >= 0
+        scores[has_collab] = self.factors.predict(user, mean, collab_of[has_collab])
+        return scores
+
+    # ---------------------------
+    # Full scoring pass
+    # ---------------------------
+
+    def score(self, rating_rows, preferred_genres=(), mood_genres=(), method="hybrid", candidates=None):
+        # Returns (catalog positions, scores) for every unrated post-2000 movie
+        # with a positive final score. `candidates` restricts scoring to a
+        # shortlist of catalog positions (see ann.py).
+        rating_rows = list(rating_rows)
+        positions = None if candidates is None else np.asarray(candidates, dtype=np.int64)
+
+        if method == "collaborative":
+            final = self.collab_scores(rating_rows, positions)
+        elif method == "content":
+            final = self.content_scores(rating_rows, positions)
+        elif method == "mf":
+            final = self.mf_scores(rating_rows, positions)
+        else:
+            final = (COLLAB_WEIGHT * self.collab_scores(rating_rows, positions)) + \
+                    (CONTENT_WEIGHT * self.content_scores(rating_rows, positions))
+
+        return self._finish(final, positions, rating_rows, preferred_genres, mood_genres)
+
+    def score_batch(self, users, method="hybrid"):
+        # Scores many users at once. users: list of (rating_rows,
+        # preferred_genres, mood_genres). Their ratings become sparse
+        # users x movies weight matrices, so each similarity store is applied
+        # with one matrix product per batch instead of a row sum per user.
+        # Returns score()'s (positions, scores) for every user, in order.
+        users = [(list(rating_rows), genres, mood) for rating_rows, genres, mood in users]
+
+        if method == "collaborative":
+            final = self.collab_batch(users)
+        elif method == "content":
+            final = self.content_batch(users)
+        elif method == "mf":
+            final = self.mf_batch(users)
+        else:
+            final = (COLLAB_WEIGHT * self.collab_batch(users)) + \
+                    (CONTENT_WEIGHT * self.content_batch(users))
+
+        return [
+            self._finish(final[i], None, rating_rows, genres, mood)
+            for i, (rating_rows, genres, mood) in enumerate(users)
+        ]
+
+    def collab_batch(self, users):
+        # collab_scores() for every user: rows of `weights` hold each user's
+        # ratings, rows of `rated` a 1 per rated movie (the denominator)
+        entries = [
+            (i, self.collab_position[m], r)
+            for i, (rating_rows, _, _) in enumerate(users)
+            for m, r in rating_rows if m in self.collab_position
+        ]
+        scores = np.zeros((len(users), len(self.movie_ids)))
+        if not entries:
+            return scores
+
+        user_rows, columns, values = (np.array(x) for x in zip(*entries))
+        shape = (len(users), self.collab_sim.shape[0])
+        weights = sp.csr_matrix((values.astype(np.float64), (user_rows, columns)), shape=shape)
+        rated = sp.csr_matrix((np.ones(len(values)), (user_rows, columns)), shape=shape)
+
+        sim = self.collab_sim
+        numerator = sim.matmul(weights)
+        denominator = sim.matmul(rated)
+
+        collab = np.zeros(denominator.shape)
+        positive = denominator > 0
+        collab[positive] = numerator[positive] / denominator[positive]
+
+        has_collab = self.collab_of >= 0
+        scores[:, has_collab] = collab[:, self.collab_of[has_collab]]
+        return scores
+
+    def content_batch(self, users):
+        # content_scores() for every user: each row averages the content
+        # similarity rows of that user's favourites
+        entries = []
+        for i, (rating_rows, _, _) in enumerate(users):
+            favourites = sorted(rating_rows, key=lambda x: x[1], reverse=True)[:CONTENT_FAVOURITES]
+            rows = [self.position[m] for m, _ in favourites if m in self.position]
+            entries.extend((i, p, 1.0 / len(rows)) for p in rows)
+
+        if not entries:
+            return np.zeros((len(users), len(self.movie_ids)))
+
+        user_rows, columns, values = (np.array(x) for x in zip(*entries))
+        weights = sp.csr_matrix((values, (user_rows, columns)), shape=(len(users), len(self.movie_ids)))
+        return self.content_sim.matmul(weights)
+
+    def mf_batch(self, users):
+        # mf_scores() for every user. Each prediction is a single
+        # matrix-vector product already, and reusing it keeps stored batch
+        # results identical to live ones (a float32 matrix product rounds
+        # differently and would reorder near-ties).
+        scores = np.zeros((len(users), len(self.movie_ids)))
+        for i, (rating_rows, _, _) in enumerate(users):
+            scores[i] = self.mf_scores(rating_rows)
+        return scores
+
+    def _finish(self, final, positions, rating_rows, preferred_genres, mood_genres):
+        # Boosts, recency and the candidate filter shared by score() and
+        # score_batch(); `final` holds the blended scores of every movie, or
+        # of the movies at `positions`
+
+        # BOOSTING LOGIC 🚀
+        final[self.genre_index.hits(preferred_genres, positions)] += GENRE_BOOST
+        final[self.genre_index.hits(mood_genres, positions)] += MOOD_BOOST
+
+        if positions is None:
+            positions = np.arange(len(self.movie_ids))
+            final *= self.recency
+            keep = self.recent & (final > 0)
+        else:
+            final *= self.recency[positions]
+            keep = self.recent[positions] & (final > 0)
+
+        rated = [self.position[m] for m, _ in rating_rows if m in self.position]
+        if rated:
+            keep &= ~np.isin(positions, rated)
+
+        return positions[keep], final[keep]
+
+
+def top_n(positions, scores, n):
+    # Highest scores first; ties are broken by catalog order so the result
+    # is deterministic.
+    if n <= 0 or len(scores) == 0:
+        return positions[:0], scores[:0]
+
+    if len(scores) > n:
+        cut = len(scores) - n
+        kth = scores[np.argpartition(scores, cut)[cut]]
+        keep = np.flatnonzero(scores >= kth)
+        positions, scores = positions[keep], scores[keep]
+
+    order = np.lexsort((positions, -scores))[:n]
+    return positions[order], scores[order]
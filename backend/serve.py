@@ -0,0 +1,144 @@
+import os
+import signal
+import socket
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+from cache import SharedVersions
+from config import (
+    SERVER_HOST, SERVER_PORT, SERVER_WORKERS, SERVER_THREADS, SERVER_BACKLOG, SERVER_KEEPALIVE
+)
+
+# -----------------------
+# Production server
+# -----------------------
+#
+#   SERVER_WORKERS=4 SERVER_THREADS=8 python serve.py
+#
+# Pre-fork server for the Flask app in run.py. The model is loaded once in
+# this process, then SERVER_WORKERS workers are forked and share its arrays
+# (see the Serving section of config.py). Each worker accepts from the same
+# listening socket and runs requests on a bounded pool of SERVER_THREADS
+# threads, so a slow Postgres query only holds one thread while other
+# requests keep being served. A worker whose threads are all busy stops
+# accepting, so new connections wait in the kernel backlog (SERVER_BACKLOG)
+# or go to an idle worker instead of queueing inside a busy one. Workers
+# that die are replaced.
+#
+# run:app also works under other pre-forking WSGI servers, as long as
+# run.start_services() is called in each worker after the fork (e.g. from
+# gunicorn's post_fork hook).
+
+
+class RequestHandler(WSGIRequestHandler):
+    # Idle keep-alive connections are closed instead of pinning a thread
+    timeout = SERVER_KEEPALIVE
+
+
+class PooledWSGIServer(BaseWSGIServer):
+
+    # Werkzeug's threaded server starts a thread per connection; this one
+    # hands connections to a fixed-size pool. A slot is taken before each
+    # accept and given back when the connection is closed, so the pool's
+    # queue never holds more than `threads` connections.
+    multithread = True
+
+    def __init__(self, host, port, app, threads, fd=None):
+        super().__init__(host, port, app, handler=RequestHandler, fd=fd)
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="request")
+        self.slots = threading.BoundedSemaphore(threads)
+
+    def get_request(self):
+        self.slots.acquire()
+        try:
+            return super().get_request()
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self._process, request, client_address)
+
+    def shutdown_request(self, request):
+        # Called once for every accepted connection
+        try:
+            super().shutdown_request(request)
+        finally:
+            self.slots.release()
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+def worker(run, sock):
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    run.start_services()
+    server = PooledWSGIServer(SERVER_HOST, SERVER_PORT, run.app, SERVER_THREADS, fd=sock.fileno())
+    server.serve_forever()
+
+
+def spawn(run, sock):
+    pid = os.fork()
+    if pid == 0:
+        try:
+            worker(run, sock)
+        finally:
+            os._exit(1)
+    return pid
+
+
+def main():
+    # Bind first so a busy port fails before the model is loaded
+    sock = socket.create_server((SERVER_HOST, SERVER_PORT), backlog=SERVER_BACKLOG)
+
+    import run
+
+    # Invalidations from one worker must reach the others' result and
+    # profile caches
+    run.result_cache.backend.versions = SharedVersions()
+    run.profile_cache.versions = SharedVersions()
+
+    print(f"🚀 Serving on http://{SERVER_HOST}:{SERVER_PORT} "
+          f"with {SERVER_WORKERS} workers x {SERVER_THREADS} threads")
+    sys.stdout.flush()
+
+    workers = {spawn(run, sock) for _ in range(SERVER_WORKERS)}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        workers.discard(pid)
+        if not stopping:
+            print(f"⚠️ Worker {pid} exited (status {status}), starting a new one")
+            workers.add(spawn(run, sock))
+
+    print("👋 Server stopped")
+
+
+if __name__ == "__main__":
+    main()
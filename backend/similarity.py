@@ -0,0 +1,440 @@
+import multiprocessing
+from functools import partial
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.metrics.pairwise import cosine_similarity
+
+# -----------------------
+# Item similarity stores
+# -----------------------
+#
+# Both stores expose the same small interface used by the scoring engine:
+#   row_sums(rows, weights=None, columns=None)
+#                                -> sum_r weights[r] * sim[r, columns]
+#   matmul(weights)              -> weights @ sim for a sparse (users x N)
+#                                   weight matrix, as a dense array
+#   to_dense()                   -> full N x N array (offline tooling only)
+#   quantize(dtype)              -> copy stored as float32 / float16 / int8
+#   nbytes                       -> memory held by the store
+#
+# PatchedSimilarity overlays replaced rows on a dense store (incremental.py).
+
+# Rows of the feature matrix compared against the whole catalog at once
+# while building a store; bounds the temporary block to BLOCK_SIZE x N
+# floats per worker process.
+BLOCK_SIZE = 1024
+
+# -----------------------
+# Quantized storage
+# -----------------------
+#
+# Stores can keep their values in a narrower type than float64
+# (SIMILARITY_DTYPE). int8 values carry one float64 scale per row:
+#
+#   sim[r, c] = values[r, c] * scale[r],  scale[r] = max |sim[r, :]| / 127
+#
+# Scoring reads only the quantized rows it needs, widens them and
+# accumulates in float64 (int8 scales are folded into the row weights), so
+# the error is limited to the stored values. model.quantization_report()
+# measures what that does to the top n.
+
+DTYPES = ("float64", "float32", "float16", "int8")
+
+
+def _quantize(block, dtype):
+    # (values, per-row scale or None) for a float64 block of rows
+    if dtype != "int8":
+        return block.astype(dtype), None
+    scale = np.abs(block).max(axis=1) / 127
+    scale[scale == 0] = 1.0
+    return np.round(block / scale[:, None]).astype(np.int8), scale
+
+# -----------------------
+# Blockwise cosine similarity
+# -----------------------
+#
+# Blocks are independent, so with workers > 1 they are computed by a pool of
+# forked processes. The features are inherited through fork rather than
+# pickled to every worker; each worker returns only what the caller keeps
+# from its block (the top-k entries, or the block itself for dense stores).
+
+_features = None
+_reduce = None
+
+
+def _compute_block(start, block_size):
+    block = cosine_similarity(_features[start:start + block_size], _features)
+    return start, block if _reduce is None else _reduce(block, start)
+
+
+def _similarity_blocks(features, block_size, workers, reduce=None):
+    # Yields (start, reduce(block, start)) for consecutive row blocks, in order
+    global _features, _reduce
+    starts = range(0, features.shape[0], block_size)
+
+    _features, _reduce = features, reduce
+    try:
+        if workers <= 1 or len(starts) <= 1:
+            for start in starts:
+                yield _compute_block(start, block_size)
+            return
+
+        context = multiprocessing.get_context("fork")
+        with context.Pool(min(workers, len(starts))) as pool:
+            yield from pool.imap(partial(_compute_block, block_size=block_size), starts)
+    finally:
+        _features, _reduce = None, None
+
+
+class DenseSimilarity:
+
+    def __init__(self, matrix, scale=None):
+        self.matrix = matrix
+        self.scale = scale          # per-row scale of int8 values, else None
+        self.shape = matrix.shape
+        self.dtype = matrix.dtype.name
+
+    @property
+    def nbytes(self):
+        return self.matrix.nbytes + (0 if self.scale is None else self.scale.nbytes)
+
+    def row_sums(self, rows, weights=None, columns=None):
+        if columns is None:
+            block = np.asarray(self.matrix[rows], dtype=np.float64)
+        else:
+            block = np.asarray(self.matrix[np.ix_(rows, columns)], dtype=np.float64)
+        if self.scale is not None:
+            weights = self.scale[rows] * (1.0 if weights is None else np.asarray(weights, dtype=np.float64))
+        if weights is None:
+            return block.sum(axis=0)
+        return np.asarray(weights, dtype=np.float64) @ block
+
+    def block(self, rows, columns):
+        # sim(rows[i], columns[j]) as a float64 len(rows) x len(columns) array
+        block = np.asarray(self.matrix[np.ix_(rows, columns)], dtype=np.float64)
+        if self.scale is not None:
+            block *= self.scale[np.asarray(rows), None]
+        return block
+
+    def matmul(self, weights):
+        if self.dtype == "float64":
+            return np.asarray(weights @ self.matrix, dtype=np.float64)
+
+        # Widen BLOCK_SIZE rows at a time rather than the whole matrix
+        weights = sp.csc_matrix(weights)
+        sums = np.zeros((weights.shape[0], self.shape[1]))
+        for start in range(0, self.shape[0], BLOCK_SIZE):
+            end = min(start + BLOCK_SIZE, self.shape[0])
+            sums += weights[:, start:end] @ self.rows(start, end)
+        return sums
+
+    def rows(self, start, end):
+        # Rows start:end as float64
+        block = np.asarray(self.matrix[start:end], dtype=np.float64)
+        if self.scale is not None:
+            block *= self.scale[start:end, None]
+        return block
+
+    def to_dense(self):
+        return self.rows(0, self.shape[0])
+
+    def row(self, position):
+        # A float64 copy, safe to modify
+        row = np.array(self.matrix[position], dtype=np.float64)
+        if self.scale is not None:
+            row *= self.scale[position]
+        return row
+
+    def patched(self, positions, rows):
+        return PatchedSimilarity(self, np.empty(0, dtype=np.int64), np.empty((0, self.shape[1]))).patched(
+            positions, rows
+        )
+
+    def quantize(self, dtype):
+        matrix = np.empty(self.shape, dtype=dtype)
+        scale = np.empty(self.shape[0]) if dtype == "int8" else None
+        for start in range(0, self.shape[0], BLOCK_SIZE):
+            end = min(start + BLOCK_SIZE, self.shape[0])
+            matrix[start:end], block_scale = _quantize(self.rows(start, end), dtype)
+            if scale is not None:
+                scale[start:end] = block_scale
+        return DenseSimilarity(matrix, scale)
+
+
+class PatchedSimilarity:
+
+    # A dense store with some rows replaced, and since similarity is
+    # symmetric the same columns: sim[p, :] = sim[:, p] = patch[slot[p]].
+    # The base (usually the mmap'd artifact) is never written, so updates
+    # cost memory for the replaced rows only, not a private N x N copy.
+    # Replaced rows are float64 whatever the base dtype.
+    #
+    # Instances are immutable: patched() returns a new store, which the
+    # caller swaps in while requests keep reading the old one.
+
+    def __init__(self, base, positions, patch):
+        self.base = base
+        self.positions = positions  # replaced positions, in slot order
+        self.patch = patch          # len(positions) x N float64
+        self.shape = base.shape
+        self.dtype = base.dtype
+        self.slot = np.full(self.shape[0], -1, dtype=np.int64)
+        self.slot[positions] = np.arange(len(positions))
+
+    @property
+    def nbytes(self):
+        return self.base.nbytes + self.patch.nbytes + self.slot.nbytes
+
+    def patched(self, positions, rows):
+        # New store with rows[i] at positions[i] (distinct). The new rows
+        # are authoritative, including their entries for rows replaced before.
+        positions = np.asarray(positions, dtype=np.int64)
+        rows = np.asarray(rows, dtype=np.float64)
+        fresh = positions[self.slot[positions] < 0]
+        merged = np.concatenate([self.positions, fresh])
+        slot = self.slot.copy()
+        slot[fresh] = np.arange(len(self.positions), len(merged))
+
+        patch = np.concatenate([self.patch, np.empty((len(fresh), self.shape[1]))])
+        patch[slot[positions]] = rows
+        # Keep the older rows' entries for the new columns in step
+        patch[:, positions] = rows[:, merged].T
+        return PatchedSimilarity(self.base, merged, patch)
+
+    def row(self, position):
+        slot = self.slot[position]
+        if slot >= 0:
+            return self.patch[slot].copy()
+        row = self.base.row(position)
+        row[self.positions] = self.patch[:, position]
+        return row
+
+    def block(self, rows, columns):
+        rows = np.asarray(rows, dtype=np.int64)
+        columns = np.asarray(columns, dtype=np.int64)
+        block = self.base.block(rows, columns)
+        row_slots, column_slots = self.slot[rows], self.slot[columns]
+        hit = row_slots >= 0
+        block[hit] = self.patch[row_slots[hit]][:, columns]
+        hit = column_slots >= 0
+        block[:, hit] = self.patch[column_slots[hit]][:, rows].T
+        return block
+
+    def row_sums(self, rows, weights=None, columns=None):
+        rows = np.asarray(rows, dtype=np.int64)
+        weights = np.ones(len(rows)) if weights is None else np.asarray(weights, dtype=np.float64)
+        sums = self.base.row_sums(rows, weights, columns)
+        if not len(self.positions):
+            return sums
+        columns = np.arange(self.shape[1]) if columns is None else np.asarray(columns, dtype=np.int64)
+
+        # Replaced rows: swap their base contribution for the patch ...
+        hit = self.slot[rows] >= 0
+        if hit.any():
+            replaced = self.patch[self.slot[rows[hit]]][:, columns] - self.base.block(rows[hit], columns)
+            sums += weights[hit] @ replaced
+        # ... and replaced columns are the patch rows read downwards
+        hit = self.slot[columns] >= 0
+        sums[hit] = self.patch[self.slot[columns[hit]]][:, rows] @ weights
+        return sums
+
+    def matmul(self, weights):
+        sums = self.base.matmul(weights)
+        if not len(self.positions):
+            return sums
+        weights = sp.csc_matrix(weights)
+        # Replaced rows: swap their base contribution for the patch ...
+        base_rows = self.base.block(self.positions, np.arange(self.shape[1]))
+        sums += np.asarray(weights[:, self.positions] @ (self.patch - base_rows))
+        # ... and replaced columns are the patch rows read downwards
+        sums[:, self.positions] = np.asarray(weights @ self.patch.T)
+        return sums
+
+    def rows(self, start, end):
+        return self.block(np.arange(start, end), np.arange(self.shape[1]))
+
+    def to_dense(self):
+        return self.rows(0, self.shape[0])
+
+    def quantize(self, dtype):
+        # Offline tooling only: densifies
+        return DenseSimilarity(self.to_dense()).quantize(dtype)
+
+
+class TopKSimilarity:
+
+    # Each item keeps only its k most similar neighbours. Entries are stored
+    # transposed, in CSR layout keyed by the neighbour: row i lists every item
+    # j that has i among its top-k (indices[indptr[i]:indptr[i + 1]]), with
+    # sim(i, j) in the same slice of data. Scoring sums rows of the movies a
+    # user rated, so each candidate is scored from its own nearest neighbours.
+    #
+    # tail[j] is the mean similarity of the neighbours dropped for item j and
+    # stands in for every pruned entry, which keeps weighted averages over a
+    # user's full rating history close to the dense result.
+
+    def __init__(self, indptr, indices, data, tail, shape, scale=None):
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.tail = tail
+        self.shape = shape
+        self.scale = scale          # per-row scale of int8 data, else None
+        self.dtype = data.dtype.name
+        self._corrections = None    # built on first matmul()
+
+    @property
+    def nbytes(self):
+        scale = 0 if self.scale is None else self.scale.nbytes
+        return self.indptr.nbytes + self.indices.nbytes + self.data.nbytes + self.tail.nbytes + scale
+
+    @classmethod
+    def from_features(cls, features, k, floor=0.0, block_size=BLOCK_SIZE, workers=1):
+        # Cosine similarity between the rows of `features` (dense or sparse),
+        # computed one block of rows at a time so the full N x N matrix
+        # never exists.
+        n = features.shape[0]
+        k = min(k, n - 1)
+        reduce = partial(_top_k, n=n, k=k, floor=floor)
+        parts = (part for _, part in _similarity_blocks(features, block_size, workers, reduce))
+        return cls._from_parts(parts, n)
+
+    @classmethod
+    def from_dense(cls, matrix, k, floor=0.0, block_size=BLOCK_SIZE):
+        n = matrix.shape[0]
+        k = min(k, n - 1)
+        reduce = partial(_top_k, n=n, k=k, floor=floor)
+        parts = (
+            reduce(np.array(matrix[start:start + block_size], dtype=np.float64), start)
+            for start in range(0, n, block_size)
+        )
+        return cls._from_parts(parts, n)
+
+    @classmethod
+    def _from_parts(cls, parts, n):
+        owners, neighbours, values, tail = (np.concatenate(arrays) for arrays in zip(*parts))
+
+        # Transpose: group the (owner, neighbour) pairs by neighbour
+        order = np.lexsort((owners, neighbours))
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum(np.bincount(neighbours, minlength=n))
+
+        return cls(
+            indptr,
+            owners[order].astype(np.int32),
+            values[order],
+            tail,
+            (n, n)
+        )
+
+    def row_sums(self, rows, weights=None, columns=None):
+        rows = np.asarray(rows, dtype=np.int64)
+        weights = np.ones(len(rows)) if weights is None else np.asarray(weights, dtype=np.float64)
+
+        starts = self.indptr[rows]
+        lengths = self.indptr[rows + 1] - starts
+
+        # Flat positions of every stored entry of every requested row
+        offsets = np.cumsum(lengths) - lengths
+        take = np.arange(lengths.sum()) - np.repeat(offsets - starts, lengths)
+
+        # Every column starts from its tail value; stored entries correct it
+        neighbours = self.indices[take]
+        values = np.asarray(self.data[take], dtype=np.float64)
+        if self.scale is not None:
+            values *= np.repeat(self.scale[rows], lengths)
+        corrections = (values - self.tail[neighbours]) * np.repeat(weights, lengths)
+        sums = self.tail * weights.sum() + np.bincount(neighbours, weights=corrections, minlength=self.shape[1])
+        return sums if columns is None else sums[columns]
+
+    def block(self, rows, columns):
+        # sim(rows[i], columns[j]) as a float64 len(rows) x len(columns)
+        # array, like row_sums() row by row but reading only the stored
+        # entries of `rows` instead of building full-width sums
+        columns = np.asarray(columns, dtype=np.int64)
+        block = np.repeat(self.tail[columns][None, :], len(rows), axis=0)
+        if len(columns) == 0:
+            return block
+
+        order = np.argsort(columns, kind="stable")
+        ordered = columns[order]
+        for i, row in enumerate(np.asarray(rows, dtype=np.int64).tolist()):
+            lo, hi = self.indptr[row], self.indptr[row + 1]
+            neighbours = self.indices[lo:hi]
+            at = np.minimum(np.searchsorted(ordered, neighbours), len(ordered) - 1)
+            hit = ordered[at] == neighbours
+            values = np.asarray(self.data[lo:hi][hit], dtype=np.float64)
+            if self.scale is not None:
+                values *= self.scale[row]
+            block[i, order[at[hit]]] = values
+        return block
+
+    def matmul(self, weights):
+        # Same decomposition as row_sums: tail times each user's total weight,
+        # plus the stored corrections as one sparse product
+        if self._corrections is None:
+            self._corrections = sp.csr_matrix(
+                (self.values() - self.tail[self.indices], self.indices, self.indptr), shape=self.shape
+            )
+        sums = (weights @ self._corrections).toarray()
+        sums += np.asarray(weights.sum(axis=1)) * self.tail[None, :]
+        return sums
+
+    def to_dense(self):
+        dense = np.repeat(self.tail[None, :], self.shape[0], axis=0)
+        rows = np.repeat(np.arange(self.shape[0]), np.diff(self.indptr))
+        dense[rows, self.indices] = self.values()
+        return dense
+
+    def values(self):
+        # Every stored entry as float64
+        values = np.asarray(self.data, dtype=np.float64)
+        if self.scale is not None:
+            values = values * np.repeat(self.scale, np.diff(self.indptr))
+        return values
+
+    def quantize(self, dtype):
+        values = self.values()
+        if dtype != "int8":
+            return TopKSimilarity(self.indptr, self.indices, values.astype(dtype), self.tail, self.shape)
+
+        rows = np.repeat(np.arange(self.shape[0]), np.diff(self.indptr))
+        scale = np.zeros(self.shape[0])
+        np.maximum.at(scale, rows, np.abs(values))
+        scale /= 127
+        scale[scale == 0] = 1.0
+        data = np.round(values / scale[rows]).astype(np.int8)
+        return TopKSimilarity(self.indptr, self.indices, data, self.tail, self.shape, scale)
+
+
+def _top_k(block, start, n, k, floor):
+    # The k most similar neighbours of each row of a block, as
+    # (owners, neighbours, values, tail)
+    rows = np.arange(block.shape[0])
+    # Self-similarity is never used (rated movies are not candidates)
+    block[rows, rows + start] = 0
+
+    top = np.argpartition(block, -k, axis=1)[:, -k:]
+    top_values = np.take_along_axis(block, top, axis=1)
+
+    # Zero similarities add nothing to a weighted average
+    keep = (top_values > 0) & (top_values >= floor)
+    kept = np.where(keep, top_values, 0).sum(axis=1)
+    dropped = np.maximum(n - 1 - keep.sum(axis=1), 1)
+    tail = (block.sum(axis=1) - kept) / dropped
+
+    owners = np.broadcast_to(rows[:, None] + start, top.shape)[keep]
+    return owners, top[keep], top_values[keep], tail
+
+
+def build_similarity(features, top_k=0, floor=0.0, workers=1, block_size=BLOCK_SIZE):
+    # top_k <= 0 keeps the full dense cosine matrix, filled block by block
+    if top_k > 0:
+        return TopKSimilarity.from_features(features, top_k, floor, block_size, workers)
+
+    n = features.shape[0]
+    matrix = np.empty((n, n))
+    for start, block in _similarity_blocks(features, block_size, workers):
+        matrix[start:start + block.shape[0]] = block
+    return DenseSimilarity(matrix)
@@ -0,0 +1,199 @@
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+import scipy.sparse as sp
+from sklearn.metrics.pairwise import cosine_similarity
+
+import db
+from incremental import IncrementalUpdater
+from rating_matrix import RatingMatrix
+from similarity import PatchedSimilarity, build_similarity
+
+# -----------------------
+# Incremental updates vs a full rebuild
+# -----------------------
+#
+#   python -m pytest test_incremental.py
+#
+# A small synthetic catalog stands in for the model: app-user ratings go
+# through the updater, and the patched store must match cosine similarity
+# recomputed from scratch over the model's and the app users' ratings.
+
+MOVIES = 40
+
+
+def model_ratings(seed=1):
+    rng = np.random.default_rng(seed)
+    rows = [
+        (user_id, movie_id, float(rng.integers(1, 11)) / 2)
+        for user_id in range(1, 31)
+        for movie_id in rng.choice(MOVIES, 12, replace=False)
+    ]
+    return pd.DataFrame(rows, columns=['userId', 'movieId', 'rating'])
+
+
+def make_updater(ratings, dtype="float64"):
+    matrix = RatingMatrix.from_frame(ratings)
+    store = build_similarity(matrix.item_rows())
+    if dtype != "float64":
+        store = store.quantize(dtype)
+    engine = SimpleNamespace(
+        collab_sim=store,
+        collab_position={int(m): i for i, m in enumerate(matrix.movie_ids)},
+    )
+    return IncrementalUpdater(engine, matrix), engine, matrix
+
+
+def app_ratings(seed=2):
+    # App users with a few ratings each, then re-ratings of some of them
+    rng = np.random.default_rng(seed)
+    rows = [
+        (user_id, int(movie_id), int(rng.integers(1, 6)))
+        for user_id in range(1, 9)
+        for movie_id in rng.choice(MOVIES, 6, replace=False)
+    ]
+    for i in rng.choice(len(rows), len(rows) // 4, replace=False):
+        rows.append((rows[i][0], rows[i][1], int(rng.integers(1, 6))))
+    return rows
+
+
+def rebuilt(ratings, rows, movie_ids):
+    # App users get negative ids so they never collide with model users
+    latest = {(-user_id, movie_id): rating for user_id, movie_id, rating in rows}
+    app = pd.DataFrame([(u, m, r) for (u, m), r in latest.items()], columns=['userId', 'movieId', 'rating'])
+    combined = pd.concat([ratings, app], ignore_index=True)
+    matrix = combined.pivot_table(index='userId', columns='movieId', values='rating').fillna(0)
+    return cosine_similarity(matrix.reindex(columns=movie_ids, fill_value=0).T)
+
+
+@pytest.mark.parametrize("batches", [1, 4])
+def test_matches_full_rebuild(batches):
+    ratings = model_ratings()
+    updater, engine, matrix = make_updater(ratings)
+    base = engine.collab_sim
+    before = base.matrix.copy()
+    rows = app_ratings()
+
+    for batch in np.array_split(np.arange(len(rows)), batches):
+        updater.apply([rows[i] for i in batch])
+
+    expected = rebuilt(ratings, rows, matrix.movie_ids)
+    np.testing.assert_allclose(engine.collab_sim.to_dense(), expected, atol=1e-9)
+
+    # The loaded store is never written; only changed rows are held
+    assert isinstance(engine.collab_sim, PatchedSimilarity)
+    assert engine.collab_sim.base is base
+    np.testing.assert_array_equal(base.matrix, before)
+    changed = {engine.collab_position[m] for _, m, _ in rows}
+    assert set(engine.collab_sim.positions.tolist()) == changed
+
+
+def test_reapplying_is_a_no_op():
+    updater, engine, _ = make_updater(model_ratings())
+    rows = app_ratings()
+    assert updater.apply(rows) > 0
+    store = engine.collab_sim
+    latest = {(user_id, movie_id): rating for user_id, movie_id, rating in rows}
+    assert updater.apply([(u, m, r) for (u, m), r in latest.items()]) == 0
+    assert engine.collab_sim is store
+
+
+def test_patched_store_reads_match_dense():
+    updater, engine, _ = make_updater(model_ratings())
+    updater.apply(app_ratings())
+    store = engine.collab_sim
+    dense = store.to_dense()
+    rng = np.random.default_rng(3)
+
+    rows = rng.choice(MOVIES, 10, replace=False)
+    columns = rng.choice(MOVIES, 15, replace=False)
+    weights = rng.random(10)
+    np.testing.assert_allclose(store.row_sums(rows, weights), weights @ dense[rows], atol=1e-12)
+    np.testing.assert_allclose(store.row_sums(rows, weights, columns), weights @ dense[np.ix_(rows, columns)], atol=1e-12)
+    np.testing.assert_allclose(store.block(rows, columns), dense[np.ix_(rows, columns)], atol=1e-12)
+    np.testing.assert_allclose(store.row(rows[0]), dense[rows[0]], atol=1e-12)
+
+    users = sp.random(5, MOVIES, density=0.2, random_state=4, format="csr")
+    np.testing.assert_allclose(store.matmul(users), users @ dense, atol=1e-12)
+
+
+def test_quantized_store_stays_quantized_underneath():
+    ratings = model_ratings()
+    updater, engine, matrix = make_updater(ratings, dtype="int8")
+    rows = app_ratings()
+    updater.apply(rows)
+    assert engine.collab_sim.base.dtype == "int8"
+    # Changed rows start from the quantized values, so only roughly equal
+    expected = rebuilt(ratings, rows, matrix.movie_ids)
+    assert np.abs(engine.collab_sim.to_dense() - expected).max() < 0.05
+
+# -----------------------
+# Syncing: long transactions are not missed
+# -----------------------
+
+class FakeDatabase:
+
+    # Answers the updater's two queries from a list of
+    # (user_id, movie_id, rating, change_txid) rows visible at the time
+
+    def __init__(self):
+        self.visible = []
+        self.xmin = 1
+        self.queries = []
+
+    @contextmanager
+    def connection(self, timeout=None):
+        yield self
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params=None):
+        self.queries.append((sql, params))
+        if "txid_snapshot_xmin" in sql:
+            self.result = [(self.xmin,)]
+        elif params is None:
+            self.result = list(self.visible)
+        else:
+            self.result = [row for row in self.visible if row[3] >= params[0]]
+
+    def fetchone(self):
+        return self.result[0]
+
+    def fetchall(self):
+        return self.result
+
+    def close(self):
+        pass
+
+
+def test_sync_picks_up_transactions_that_commit_late(monkeypatch):
+    database = FakeDatabase()
+    monkeypatch.setattr(db, "pool", database)
+    ratings = model_ratings()
+    updater, engine, matrix = make_updater(ratings)
+    movie_ids = matrix.movie_ids.tolist()
+
+    # Transaction 100 (a long import) is still running at the first sync
+    database.visible = [(1, movie_ids[0], 4, 90), (1, movie_ids[1], 2, 101)]
+    database.xmin = 100
+    assert updater.sync() == 2
+    assert updater.watermark == 100 and updater.last_change == 101
+
+    # ... and commits before the second one, with rows older than 101
+    database.visible += [(2, movie_ids[2], 5, 100), (2, movie_ids[3], 3, 100)]
+    database.xmin = 120
+    assert updater.sync() == 2
+    assert database.queries[-1][1] == (100,)
+
+    rows = [(user_id, movie_id, rating) for user_id, movie_id, rating, _ in database.visible]
+    np.testing.assert_allclose(engine.collab_sim.to_dense(), rebuilt(ratings, rows, matrix.movie_ids), atol=1e-9)
+
+    # Nothing new: the watermark moves, the model and last_change do not
+    database.xmin = 130
+    store = engine.collab_sim
+    assert updater.sync() == 0
+    assert engine.collab_sim is store and updater.last_change == 101
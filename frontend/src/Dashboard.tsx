@@ -99,6 +99,7 @@ export default function Dashboard({ userId }: { userId: number }) {
                     <option value="hybrid">🚀 Hybrid</option>
                     <option value="collaborative">🤝 Collaborative</option>
                     <option value="content">🎭 Content-Based</option>
+                    <option value="mf">🧮 Matrix Factorization</option>
                   </select>
                   <div className="absolute right-3 top-3.5 pointer-events-none text-gray-400">
                     ▼